@@ -41,12 +41,18 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First so it times the whole chain; removes itself unless REQUEST_INSTRUMENTATION is on
+    'education.middleware.RequestInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Inside the session and auth middleware, whose queries always use the primary database
+    'education.replicas.ReplicaRoutingMiddleware',
+    # Routes the request to the shard of the user's faculty; removes itself unless shards are configured
+    'education.sharding.ShardRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -79,6 +85,81 @@ DATABASES = {
     )
 }
 
+# Optional read replica of the primary, read by the student-facing views (see education/replicas.py)
+DATABASE_REPLICA_URL = config('DATABASE_REPLICA_URL', default='')
+if DATABASE_REPLICA_URL:
+    DATABASES['replica'] = dj_database_url.parse(DATABASE_REPLICA_URL, conn_max_age=600)
+    # Tests read the primary's test database through the replica alias
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+# Seconds a user's reads stay on the primary after a request of theirs wrote, covering replication lag
+DATABASE_REPLICA_LAG_SECONDS = config('DATABASE_REPLICA_LAG_SECONDS', default=5, cast=int)
+
+# Optional per-faculty shards (see education/sharding.py): comma-separated alias=url pairs.
+# Faculties live on default until move_faculty moves them to a shard
+DATABASE_SHARD_URLS = config('DATABASE_SHARD_URLS', default='')
+DATABASE_SHARDS = ['default']
+for shard in filter(None, DATABASE_SHARD_URLS.split(',')):
+    alias, _, url = shard.strip().partition('=')
+    DATABASES[alias] = dj_database_url.parse(url, conn_max_age=600)
+    DATABASE_SHARDS.append(alias)
+# Seconds other processes may keep routing a moved faculty to its old shard
+DATABASE_SHARD_MAP_TTL = config('DATABASE_SHARD_MAP_TTL', default=60, cast=int)
+# The shard router picks the shard; reads it sends to default may still go to the replica, which copies default only
+DATABASE_ROUTERS = ['education.sharding.ShardRouter', 'education.replicas.ReplicaRouter']
+
+# SQLite production profile: WAL journaling, so readers never wait for the one writer,
+# tuned pragmas on every connection and BEGIN IMMEDIATE write transactions that wait
+# SQLITE_BUSY_TIMEOUT ms for the write lock (see education/sqlite_backend).
+# Off unless SQLITE_PRODUCTION=True, as the Procfile sets: switching to WAL changes the
+# database file (it adds the -wal and -shm files next to it, which must stay on a local
+# disk), so a deployment has to opt in rather than get it from an upgrade.
+SQLITE_PRODUCTION = config('SQLITE_PRODUCTION', default=False, cast=bool)
+SQLITE_PRODUCTION_OPTIONS = {
+    # Run in this order: the busy timeout also covers the switch to WAL
+    'pragmas': {
+        'busy_timeout': config('SQLITE_BUSY_TIMEOUT', default=5000, cast=int),
+        'journal_mode': 'WAL',
+        # Durable across application crashes; a power loss may drop the last commits
+        'synchronous': 'NORMAL',
+        'mmap_size': config('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024, cast=int),
+        'cache_size': -config('SQLITE_CACHE_KIB', default=64 * 1024, cast=int),  # negative: KiB, not pages
+        'temp_store': 'MEMORY',
+    },
+    'begin_attempts': config('SQLITE_BEGIN_ATTEMPTS', default=3, cast=int),
+}
+for database in DATABASES.values():
+    if not SQLITE_PRODUCTION or database['ENGINE'] != 'django.db.backends.sqlite3':
+        continue
+    database['ENGINE'] = 'education.sqlite_backend'
+    database['OPTIONS'] = SQLITE_PRODUCTION_OPTIONS
+
+# Cache: locmem works out of the box (per process); use file (one host) or redis to share it between processes
+CACHE_BACKEND = config('CACHE_BACKEND', default='locmem')
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'zalikovka'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / 'media' / 'cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+}
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND][0],
+        'LOCATION': config('CACHE_LOCATION', default=CACHE_BACKENDS[CACHE_BACKEND][1]),
+    }
+}
+
+# Sessions: 'db' keeps Django's default; the other modes avoid the per-request session SELECT
+# and keep flash messages in a cookie instead of the session
+SESSION_MODE = config('SESSION_MODE', default='db')
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_ENGINE = SESSION_ENGINES[SESSION_MODE]
+if SESSION_MODE != 'db':
+    MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -117,4 +198,60 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Custom user model
 AUTH_USER_MODEL = 'education.ApplicationUser'
 
-LOGIN_URL = '/login/'
\ No newline at end of file
+LOGIN_URL = '/login/'
+
+AUTHENTICATION_BACKENDS = [
+    # Loads the session user with its student/teacher, group and faculty in one query
+    'education.backends.RoleModelBackend',
+    # Kept so sessions created before RoleModelBackend stay logged in
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+# Release identifier mixed into page ETags, so browsers drop cached pages after a deploy
+RELEASE_VERSION = config('RELEASE_VERSION', default=config('RENDER_GIT_COMMIT', default='dev'))
+
+# PDF transcript export: 'sync' renders inside the request, 'background' queues
+# a TranscriptJob for the run_transcript_worker command and caches the result
+PDF_EXPORT_MODE = config('PDF_EXPORT_MODE', default='sync')
+TRANSCRIPT_CACHE_DIR = config('TRANSCRIPT_CACHE_DIR', default=str(BASE_DIR / 'media' / 'transcripts'))
+TRANSCRIPT_CACHE_MAX_BYTES = config('TRANSCRIPT_CACHE_MAX_BYTES', default=512 * 1024 * 1024, cast=int)
+TRANSCRIPT_CACHE_MAX_AGE = config('TRANSCRIPT_CACHE_MAX_AGE', default=7 * 24 * 3600, cast=int)  # seconds
+
+# Group lists of the registration form: process-local cache in front of the shared cache
+GROUPS_CACHE = config('GROUPS_CACHE', default=True, cast=bool)
+GROUPS_CACHE_ALIAS = config('GROUPS_CACHE_ALIAS', default='default')
+# Invalidation reaches only the current process's locmem cache, so there the other
+# workers must see group changes by expiry: keep their entries short-lived
+GROUPS_CACHE_SECONDS = config('GROUPS_CACHE_SECONDS', default=30 if CACHE_BACKEND == 'locmem' else 24 * 3600, cast=int)
+GROUPS_LOCAL_CACHE_SECONDS = config('GROUPS_LOCAL_CACHE_SECONDS', default=5, cast=int)
+GROUPS_HTTP_MAX_AGE = config('GROUPS_HTTP_MAX_AGE', default=0, cast=int)  # 0: always revalidate
+
+# Rendered grade tables: process-local LRU keyed by student, grade version and filters,
+# in front of the shared cache (shared between processes unless CACHE_BACKEND is locmem).
+# GRADE_TABLE_PREWARM renders the default tables of regraded students after a
+# grade sheet is saved: 'off', 'sync' (inside the request) or 'background' (in a thread)
+GRADE_TABLE_CACHE = config('GRADE_TABLE_CACHE', default=True, cast=bool)
+GRADE_TABLE_CACHE_MAX_BYTES = config('GRADE_TABLE_CACHE_MAX_BYTES', default=64 * 1024 * 1024, cast=int)
+GRADE_TABLE_CACHE_ALIAS = config('GRADE_TABLE_CACHE_ALIAS', default='default')
+GRADE_TABLE_CACHE_SECONDS = config('GRADE_TABLE_CACHE_SECONDS', default=24 * 3600, cast=int)
+GRADE_TABLE_PREWARM = config('GRADE_TABLE_PREWARM', default='off')
+
+# Pending registrations approved by `approve_registrations --auto`: ';'-separated
+# rules of ','-separated conditions, e.g. "faculty=3,email_domain=knu.ua;group=12"
+REGISTRATION_AUTO_APPROVE_RULES = config('REGISTRATION_AUTO_APPROVE_RULES', default='')
+
+# Per-request SQL/template timing (Server-Timing header and a JSON log line per request)
+REQUEST_INSTRUMENTATION = config('REQUEST_INSTRUMENTATION', default=False, cast=bool)
+REQUEST_SLOW_THRESHOLD_MS = config('REQUEST_SLOW_THRESHOLD_MS', default=500, cast=int)
+REQUEST_SLOW_QUERY_COUNT = config('REQUEST_SLOW_QUERY_COUNT', default=5, cast=int)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'education.middleware': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
\ No newline at end of file
@@ -1,13 +1,248 @@
-from django.contrib import admin
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.utils.functional import cached_property
+
 from .models import ApplicationUser, Faculty, Group, Student, Teacher, Discipline, Course, Exam, Grade, PendingRegistration
+from .registrations import APPROVED, REJECTED, auto_approve, configured_rules, decide
+from .sharding import other_shards, pin_shard, sharding_enabled, use_shard
+
+# Unfiltered changelists of tables estimated to be bigger than this show the estimate instead of COUNT(*)
+ESTIMATED_COUNT_THRESHOLD = 100_000
+
+
+def estimated_row_count(model, using='default'):
+    """
+    The database's own row count estimate of ``model``'s table, or None when
+    it has none: PostgreSQL's planner statistics, or SQLite's after ANALYZE.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql, params = 'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table]
+    elif connection.vendor == 'sqlite':
+        # The first number of every index's statistics is the table's row count
+        sql, params = 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table]
+    else:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+    except DatabaseError:
+        # No statistics table yet (SQLite before the first ANALYZE)
+        return None
+    if row is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    # PostgreSQL reports -1 for tables that were never analyzed
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator of the changelists of very large tables: COUNT(*) reads the
+    whole table, so an unfiltered list is counted from the table statistics.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class ShardListFilter(admin.SimpleListFilter):
+    """Picks the shard a changelist shows (ShardedAdmin.get_queryset applies it)."""
+
+    title = 'shard'
+    parameter_name = 'shard'
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in settings.DATABASE_SHARDS]
+
+    def queryset(self, request, queryset):
+        return queryset
+
+
+class ShardedAdmin(admin.ModelAdmin):
+    """
+    Admin of a faculty-owned model: changelists show one shard at a time,
+    ``default`` unless the shard filter picks another, and change pages find
+    their object on any shard. The rest of the request (form choices,
+    actions) then uses that shard.
+    """
+
+    def get_list_filter(self, request):
+        list_filter = super().get_list_filter(request)
+        return (ShardListFilter, *list_filter) if sharding_enabled() else list_filter
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        alias = request.GET.get(ShardListFilter.parameter_name)
+        if sharding_enabled() and alias in settings.DATABASE_SHARDS:
+            pin_shard(alias)
+            return queryset.using(alias)
+        return queryset
+
+    def get_object(self, request, object_id, from_field=None):
+        obj = super().get_object(request, object_id, from_field)
+        if obj is None and sharding_enabled():
+            for alias in other_shards():
+                with use_shard(alias):
+                    obj = super().get_object(request, object_id, from_field)
+                if obj is not None:
+                    pin_shard(alias)
+                    break
+        return obj
+
+
+class SelectRelatedAdmin(ShardedAdmin):
+    """
+    Joins ``list_select_related`` everywhere the admin loads these objects,
+    including autocomplete results and FK labels, since their ``__str__``
+    walks the same foreign keys.
+    """
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(*self.list_select_related)
+
+
+@admin.register(ApplicationUser)
+class ApplicationUserAdmin(admin.ModelAdmin):
+    list_display = ('username', 'full_name', 'email', 'is_active', 'is_staff')
+    list_filter = ('is_active', 'is_staff')
+    search_fields = ('^username', '=email', '^full_name')
+    show_full_result_count = False
+
+
+@admin.register(Faculty)
+class FacultyAdmin(admin.ModelAdmin):
+    list_display = ('name', 'dean_name')
+    search_fields = ('^name',)
+
+
+@admin.register(Group)
+class GroupAdmin(SelectRelatedAdmin):
+    list_display = ('name', 'faculty')
+    list_select_related = ('faculty',)
+    list_filter = ('faculty',)
+    search_fields = ('^name', '^faculty__name')
+
+
+@admin.register(Student)
+class StudentAdmin(ShardedAdmin):
+    list_display = ('full_name', 'email', 'group', 'faculty', 'study_year', 'is_deleted')
+    # Group.__str__ also shows the group's faculty
+    list_select_related = ('group__faculty', 'faculty')
+    # No group filter: it would list every group of every faculty
+    list_filter = ('faculty', 'is_deleted')
+    search_fields = ('=email', '^full_name')
+    raw_id_fields = ('user',)
+    autocomplete_fields = ('group',)
+    # Also orders autocomplete results, which are not sorted by the changelist's default
+    ordering = ('-pk',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(Teacher)
+class TeacherAdmin(ShardedAdmin):
+    list_display = ('full_name', 'email', 'degree', 'faculty', 'is_deleted')
+    list_select_related = ('faculty',)
+    list_filter = ('faculty', 'is_deleted')
+    search_fields = ('=email', '^full_name')
+    raw_id_fields = ('user',)
+    ordering = ('full_name',)
+
+
+@admin.register(Discipline)
+class DisciplineAdmin(ShardedAdmin):
+    list_display = ('name', 'faculty', 'hours')
+    list_select_related = ('faculty',)
+    list_filter = ('faculty',)
+    search_fields = ('^name',)
+
+
+@admin.register(Course)
+class CourseAdmin(SelectRelatedAdmin):
+    list_display = ('discipline', 'teacher', 'study_year', 'semester')
+    list_select_related = ('discipline', 'teacher')
+    list_filter = ('semester', 'study_year')
+    search_fields = ('^discipline__name', '^teacher__full_name')
+    autocomplete_fields = ('discipline', 'teacher')
+
+
+@admin.register(Exam)
+class ExamAdmin(SelectRelatedAdmin):
+    list_display = ('course', 'type', 'date', 'academic_year')
+    list_select_related = ('course__discipline', 'course__teacher')
+    list_filter = ('type', 'academic_year')
+    search_fields = ('^course__discipline__name', '^course__teacher__full_name')
+    autocomplete_fields = ('course',)
+    ordering = ('-pk',)
+    show_full_result_count = False
+
+
+@admin.register(Grade)
+class GradeAdmin(ShardedAdmin):
+    list_display = ('student', 'discipline', 'group', 'exam_date', 'grade_value', 'teacher', 'updated_at')
+    list_select_related = ('student__group', 'exam__course__discipline', 'teacher')
+    list_filter = ('exam__type', 'exam__academic_year')
+    search_fields = ('=student__email', '^student__full_name', '^exam__course__discipline__name')
+    autocomplete_fields = ('student', 'exam', 'teacher')
+    readonly_fields = ('version',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    @admin.display(description='discipline', ordering='exam__course__discipline__name')
+    def discipline(self, grade):
+        return grade.exam.course.discipline.name
+
+    @admin.display(description='group', ordering='student__group__name')
+    def group(self, grade):
+        return grade.student.group.name
+
+    @admin.display(description='exam date', ordering='exam__date')
+    def exam_date(self, grade):
+        return grade.exam.date
+
+
+@admin.register(PendingRegistration)
+class PendingRegistrationAdmin(ShardedAdmin):
+    list_display = ('user', 'status', 'requested_faculty', 'requested_group', 'requested_degree', 'created_at')
+    list_select_related = ('user', 'requested_faculty', 'requested_group__faculty')
+    list_filter = ('status', 'requested_faculty')
+    search_fields = ('^user__username', '=user__email', '^user__full_name')
+    raw_id_fields = ('user',)
+    autocomplete_fields = ('requested_group',)
+    actions = ('approve_registrations', 'reject_registrations', 'auto_approve_registrations')
+
+    def _decide(self, request, queryset, status):
+        result = decide(queryset, status, request.user.username)
+        self.message_user(request, f"{result}.", messages.SUCCESS)
+
+    @admin.action(description='Approve selected pending registrations', permissions=['change'])
+    def approve_registrations(self, request, queryset):
+        self._decide(request, queryset, APPROVED)
+
+    @admin.action(description='Reject selected pending registrations', permissions=['change'])
+    def reject_registrations(self, request, queryset):
+        self._decide(request, queryset, REJECTED)
 
-admin.site.register(ApplicationUser)
-admin.site.register(Faculty)
-admin.site.register(Group)
-admin.site.register(Student)
-admin.site.register(Teacher)
-admin.site.register(Discipline)
-admin.site.register(Course)
-admin.site.register(Exam)
-admin.site.register(Grade)
-admin.site.register(PendingRegistration)
\ No newline at end of file
+    @admin.action(description='Approve selected registrations matching the auto-approval rules',
+                  permissions=['change'])
+    def auto_approve_registrations(self, request, queryset):
+        try:
+            rules = configured_rules()
+        except ValueError as error:
+            self.message_user(request, f"REGISTRATION_AUTO_APPROVE_RULES: {error}", messages.ERROR)
+            return
+        if not rules:
+            self.message_user(request, "No auto-approval rules are configured.", messages.WARNING)
+            return
+        self.message_user(request, f"{auto_approve(rules, queryset)}.", messages.SUCCESS)
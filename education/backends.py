@@ -0,0 +1,23 @@
+"""
+Authentication backend that loads the user's role objects with the user.
+
+Every student and lecturer view checks the role and then reads the student's
+group and faculty or the lecturer's faculty, so the session user is fetched
+together with them in one joined query.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+UserModel = get_user_model()
+
+# The grade summary carries the student's grade version used for conditional GETs
+ROLE_RELATIONS = ('student__group__faculty', 'student__faculty', 'student__grade_summary', 'teacher__faculty')
+
+
+class RoleModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        try:
+            user = UserModel._default_manager.select_related(*ROLE_RELATIONS).get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,142 @@
+"""
+Per-view benchmarks driven through the Django test client.
+
+Each scenario is one request against the current database (normally filled by
+``seed_university``). Wall time is the fastest of several timed runs, the
+query count comes from the last of them and peak Python memory is traced in a
+separate run, since tracemalloc slows requests down.
+"""
+import json
+import time
+import tracemalloc
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .gradebook import default_exam_type, grade_sheet
+from .models import Course, Exam, Student, Teacher
+from .seeding import USERNAME_PREFIX
+
+# Any host accepted by ALLOWED_HOSTS works; the test client defaults to "testserver"
+HOST = 'localhost'
+
+
+class Scenario:
+    """One benchmarked request: ``client`` is logged in as the user the view expects."""
+
+    def __init__(self, name, client, method, url, data=None, headers=None, content_type=None):
+        self.name = name
+        self.client = client
+        self.method = method
+        self.url = url
+        self.data = data or {}
+        self.headers = headers
+        self.content_type = content_type
+
+    def request(self):
+        extra = {'content_type': self.content_type} if self.content_type else {}
+        response = getattr(self.client, self.method)(self.url, self.data, headers=self.headers, **extra)
+        # Consume streamed bodies so their cost is part of the measurement
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response
+
+
+def measure(scenario, repeat=5):
+    """Runs a scenario ``repeat`` times plus one traced run and returns its result dict."""
+    timings = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = scenario.request()
+            timings.append(time.perf_counter() - started)
+        # Read now: the next request resets the connection's query log
+        query_count = len(queries.captured_queries)
+    tracemalloc.start()
+    try:
+        scenario.request()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'view': scenario.name,
+        'status': response.status_code,
+        'seconds': round(min(timings), 4),
+        'median_seconds': round(sorted(timings)[len(timings) // 2], 4),
+        'queries': query_count,
+        'peak_kib': peak // 1024,
+    }
+
+
+def throughput(scenario, requests=1000):
+    """Requests per second of a scenario run back to back ``requests`` times."""
+    started = time.perf_counter()
+    for _ in range(requests):
+        response = scenario.request()
+    elapsed = time.perf_counter() - started
+    return {
+        'view': scenario.name,
+        'status': response.status_code,
+        'requests': requests,
+        'requests_per_second': round(requests / elapsed, 1),
+    }
+
+
+def _client(user):
+    client = Client(HTTP_HOST=HOST)
+    client.force_login(user)
+    return client
+
+
+def default_student():
+    students = Student.objects.select_related('user').order_by('pk')
+    return students.filter(user__username__startswith=USERNAME_PREFIX).first() or students.first()
+
+
+def default_teacher():
+    """A teacher who has at least one course, preferring seeded ones."""
+    teachers = Teacher.objects.filter(course__isnull=False).select_related('user').order_by('pk').distinct()
+    return teachers.filter(user__username__startswith=USERNAME_PREFIX).first() or teachers.first()
+
+
+def view_scenarios(student, teacher):
+    """Scenarios for the student and lecturer pages; either user may be None to skip their views."""
+    scenarios = []
+    if student is not None:
+        client = _client(student.user)
+        scenarios += [
+            Scenario('student_profile', client, 'get', reverse('education:student_profile')),
+            Scenario('student_grades', client, 'get', reverse('education:student_grades')),
+            Scenario('export_grades_pdf', client, 'post', reverse('education:export_grades_pdf')),
+        ]
+    if teacher is not None:
+        client = _client(teacher.user)
+        course = Course.objects.filter(teacher=teacher).select_related('discipline').order_by('pk').first()
+        group_id = course and (Student.objects.filter(faculty_id=course.discipline.faculty_id)
+                               .values_list('group_id', flat=True).order_by('group_id').first())
+        if group_id:
+            sheet = {'discipline': course.discipline_id, 'group': group_id}
+            exam = Exam.objects.filter(course=course).order_by('id').only('id', 'type').first()
+            exam_type = exam.type if exam else default_exam_type(course)
+            # save_grades resubmits the sheet as shown, so repeated runs do not change any grade
+            submission = dict(sheet)
+            rows = grade_sheet(teacher, course, group_id, exam_type, exam_id=exam and exam.pk)
+            for row in rows:
+                submission[f'semester_grade_{row.id}'] = row.semester_grade
+                submission[f'exam_grade_{row.id}'] = row.exam_grade
+                submission[f'version_{row.id}'] = row.grade_version
+            # An autosave batch of one edited cell, also resubmitted unchanged
+            cells = [{'student': row.id, 'semester_grade': row.semester_grade, 'exam_grade': row.exam_grade}
+                     for row in rows[:1]]
+            scenarios += [
+                Scenario('lecturer_grades', client, 'get', reverse('education:lecturer_grades'), sheet),
+                Scenario('save_grades', client, 'post', reverse('education:save_grades'), submission),
+                Scenario('save_grade_cells', client, 'post', reverse('education:save_grade_cells'),
+                         json.dumps({**sheet, 'cells': cells}), content_type='application/json'),
+            ]
+        scenarios.append(Scenario('get_groups', Client(HTTP_HOST=HOST), 'get', reverse('education:get_groups'),
+                                  {'faculty_id': teacher.faculty_id}))
+    return scenarios
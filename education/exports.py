@@ -0,0 +1,114 @@
+"""
+Bulk grade exports for the registrar.
+
+Grades filtered by faculty, group, course and/or academic year are read with
+``.iterator()`` over a flat ``values_list()`` projection joined to the
+student, discipline and exam, and encoded as CSV or JSON while they are
+read. The header is produced before the query runs, so the response starts
+at once, and only one chunk of rows is held in memory at a time. With
+sharding, every shard is read at once and their rows merged by grade id.
+"""
+import csv
+import heapq
+from operator import itemgetter
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Grade
+from .sharding import fan_out
+
+# (column, lookup) pairs of an exported grade
+COLUMNS = (
+    ('grade_id', 'id'),
+    ('student_id', 'student_id'),
+    ('student', 'student__full_name'),
+    ('student_email', 'student__email'),
+    ('group', 'student__group__name'),
+    ('faculty', 'student__faculty__name'),
+    ('discipline', 'exam__course__discipline__name'),
+    ('course_id', 'exam__course_id'),
+    ('semester', 'exam__course__semester'),
+    ('academic_year', 'exam__academic_year'),
+    ('exam_type', 'exam__type'),
+    ('exam_date', 'exam__date'),
+    ('grade', 'grade_value'),
+    ('teacher', 'teacher__full_name'),
+)
+CHUNK_SIZE = 2000
+# Rows encoded per yielded piece of the response body
+ROWS_PER_PIECE = 500
+
+
+class ExportFilters:
+    """Which grades to export; every filter is optional."""
+
+    NAMES = ('faculty', 'group', 'course', 'academic_year')
+    LOOKUPS = {
+        'faculty': 'student__faculty_id',
+        'group': 'student__group_id',
+        'course': 'exam__course_id',
+        'academic_year': 'exam__academic_year',
+    }
+
+    def __init__(self, **values):
+        self.values = {name: value for name, value in values.items() if value is not None}
+
+    @classmethod
+    def from_data(cls, data):
+        """Builds filters from request GET data, raising ValueError for non-numeric values."""
+        values = {}
+        for name in cls.NAMES:
+            value = data.get(name)
+            if value:
+                if not value.isdigit():
+                    raise ValueError(f"{name} must be a number")
+                values[name] = int(value)
+        return cls(**values)
+
+    def filename(self, extension):
+        parts = [f'{name}-{self.values[name]}' for name in self.NAMES if name in self.values]
+        return '-'.join(['grades', *parts]) + f'.{extension}'
+
+
+def export_rows(filters, chunk_size=CHUNK_SIZE):
+    """Row tuples of the exported grades, in COLUMNS order, fetched ``chunk_size`` at a time."""
+    grades = Grade.objects.filter(**{ExportFilters.LOOKUPS[name]: value for name, value in filters.values.items()})
+    shards = [rows.iterator(chunk_size=chunk_size) for rows in
+              fan_out(grades.order_by('pk').values_list(*(lookup for _, lookup in COLUMNS)))]
+    # Grade ids are unique across shards; the id is the first column
+    return shards[0] if len(shards) == 1 else heapq.merge(*shards, key=itemgetter(0))
+
+
+class _Echo:
+    """File-like object whose write() returns the text, so csv.writer produces strings."""
+
+    def write(self, value):
+        return value
+
+
+def _pieces(encoded_rows):
+    piece = []
+    for text in encoded_rows:
+        piece.append(text)
+        if len(piece) >= ROWS_PER_PIECE:
+            yield ''.join(piece)
+            piece = []
+    if piece:
+        yield ''.join(piece)
+
+
+def csv_stream(filters):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([column for column, _ in COLUMNS])
+    yield from _pieces(writer.writerow(row) for row in export_rows(filters))
+
+
+def json_stream(filters):
+    """A JSON array with one object per grade."""
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    columns = [column for column, _ in COLUMNS]
+    yield '['
+    rows = (('\n' if number == 0 else ',\n') + encoder.encode(dict(zip(columns, row)))
+            for number, row in enumerate(export_rows(filters)))
+    yield from _pieces(rows)
+    yield '\n]\n'
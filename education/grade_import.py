@@ -0,0 +1,126 @@
+"""
+Bulk grade import from CSV files kept by lecturers.
+
+Rows of ``student,discipline,semester_grade,exam_grade`` are read one at a
+time from a text stream, so files of any size are imported in constant
+memory. Students are given by email or id and disciplines by id or name;
+both are resolved through maps loaded with one query each, limited to the
+importing lecturer's courses and their faculties' students. Rows are
+validated like autosaved sheet cells and upserted in chunks, one transaction
+per chunk; invalid rows are skipped and reported with their line number.
+"""
+import csv
+from collections import defaultdict
+
+from django.db import router, transaction
+from django.utils import timezone
+
+from .gradebook import cell_total, default_exam_type, save_grade_sheet
+from .models import Course, Exam, Grade, Student
+from .summaries import deferred_refresh
+
+COLUMNS = ('student', 'discipline', 'semester_grade', 'exam_grade')
+CHUNK_SIZE = 2000
+
+
+class ImportResult:
+    """Grade counts of an import and the (line, message) errors of its rejected rows."""
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.errors = []
+
+    def add(self, sheet):
+        self.created += len(sheet.created)
+        self.updated += len(sheet.updated)
+        self.unchanged += len(sheet.unchanged)
+
+    def as_dict(self, max_errors=None):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'error_count': len(self.errors),
+            'errors': [{'line': line, 'error': error} for line, error in self.errors[:max_errors]],
+        }
+
+
+class GradeImporter:
+    """Imports grades given by ``teacher`` for the disciplines of their courses."""
+
+    def __init__(self, teacher, chunk_size=CHUNK_SIZE):
+        self.teacher = teacher
+        self.chunk_size = chunk_size
+        courses = list(Course.objects.filter(teacher=teacher).select_related('discipline').order_by('id'))
+        self.courses = {}
+        for course in courses:
+            self.courses.setdefault(str(course.discipline_id), course)
+            self.courses.setdefault(course.discipline.name.strip().lower(), course)
+        # The first exam of each course, as on the grade sheet; missing ones are created on first use
+        self.exams = {}
+        for exam in Exam.objects.filter(course__in=courses).order_by('-id'):
+            self.exams[exam.course_id] = exam
+        self.students = {}
+        faculty_ids = {course.discipline.faculty_id for course in courses}
+        for student_id, email in (Student.objects.filter(faculty_id__in=faculty_ids, is_deleted=False)
+                                  .values_list('id', 'email')):
+            self.students[str(student_id)] = student_id
+            self.students[email.lower()] = student_id
+
+    def exam(self, course):
+        exam = self.exams.get(course.pk)
+        if exam is None:
+            exam = self.exams[course.pk] = Exam.objects.create(
+                course=course, date=timezone.now(), type=default_exam_type(course)
+            )
+        return exam
+
+    def parse_row(self, row):
+        """(course, student id, total) of a CSV row, raising ValueError for invalid rows."""
+        student = (row.get('student') or '').strip()
+        student_id = self.students.get(student.lower())
+        if student_id is None:
+            raise ValueError(f"Unknown student {student!r}.")
+        discipline = (row.get('discipline') or '').strip()
+        course = self.courses.get(discipline.lower())
+        if course is None:
+            raise ValueError(f"Discipline {discipline!r} is not taught by this lecturer.")
+        return course, student_id, cell_total(row.get('semester_grade') or 0, row.get('exam_grade') or 0)
+
+    def run(self, lines):
+        """
+        Imports CSV text (a file opened with ``newline=''`` or any iterable of
+        lines) and returns an ImportResult. Raises ValueError when the header
+        lacks a column.
+        """
+        reader = csv.DictReader(lines)
+        missing = [column for column in COLUMNS if column not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"Missing CSV columns: {', '.join(missing)}.")
+        result = ImportResult()
+        chunk = defaultdict(dict)  # course -> {student id: total}; later rows for a student win
+        pending = 0
+        for row in reader:
+            result.rows += 1
+            try:
+                course, student_id, total = self.parse_row(row)
+            except ValueError as error:
+                result.errors.append((reader.line_num, str(error)))
+                continue
+            chunk[course][student_id] = total
+            pending += 1
+            if pending >= self.chunk_size:
+                self.save(chunk, result)
+                chunk, pending = defaultdict(dict), 0
+        self.save(chunk, result)
+        return result
+
+    def save(self, chunk, result):
+        # A student's summary is refreshed once per chunk, not once per course
+        with transaction.atomic(using=router.db_for_write(Grade)), deferred_refresh():
+            for course, totals in chunk.items():
+                result.add(save_grade_sheet(self.teacher, self.exam(course), totals))
@@ -0,0 +1,171 @@
+"""
+Versioned cache of rendered grade tables.
+
+The grades page shows one table per student and filter set. The rendered
+table HTML and the statistics shown next to it are kept in a process-local
+LRU keyed by (student, grade version, normalized filters), in front of the
+shared Django cache (``GRADE_TABLE_CACHE_ALIAS``). Every grade change bumps
+the student's version, so an old table is never served again and just ages
+out; the least recently used local tables are evicted once the LRU holds
+more than ``GRADE_TABLE_CACHE_MAX_BYTES``, shared ones expire after
+``GRADE_TABLE_CACHE_SECONDS``.
+
+With ``GRADE_TABLE_PREWARM`` set, saving a grade sheet renders the default
+table of every student whose grade changed ('sync' inside the request,
+'background' in a thread after the commit) into both caches, so the first
+read after the grades are published is a hit in any process sharing the
+cache backend. With the locmem backend that is only the saving process.
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, router, transaction
+from django.template.loader import render_to_string
+
+from .models import Student
+from .reports import GradeFilters, build_grade_report
+from .summaries import loaded_grade_version
+
+TEMPLATE_NAME = 'education/grade_table.html'
+# Rough per-entry overhead of the key, the entry object and the statistics dict
+ENTRY_OVERHEAD = 1024
+
+
+class GradeTable:
+    """Rendered table of one grade report and the statistics shown next to it."""
+
+    def __init__(self, html, stats):
+        self.html = html
+        self.stats = stats
+        self.size = sys.getsizeof(html) + ENTRY_OVERHEAD
+
+
+class GradeTableCache:
+    """Thread-safe LRU of ``GradeTable`` objects bounded by their total size."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            table = self._entries.get(key)
+            if table is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return table
+
+    def put(self, key, table):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous.size
+            if table.size > self.max_bytes:
+                return
+            self._entries[key] = table
+            self.size += table.size
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= evicted.size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = self.hits = self.misses = 0
+
+
+_cache = GradeTableCache(settings.GRADE_TABLE_CACHE_MAX_BYTES)
+
+
+def table_cache():
+    return _cache
+
+
+def table_key(student_id, version, filters):
+    return student_id, version, filters.cache_key()
+
+
+def _shared_cache():
+    return caches[settings.GRADE_TABLE_CACHE_ALIAS]
+
+
+def _shared_key(key):
+    return 'grade_table:%s:%s:%s' % key
+
+
+def render_grade_table(report):
+    stats = report.stats_context()
+    return GradeTable(
+        render_to_string(TEMPLATE_NAME, {'grouped_grades': report.grouped()}),
+        {name: stats[name] for name in ('average_grade', 'total_disciplines', 'exams', 'credits')},
+    )
+
+
+def grade_table(student, filters, report=None):
+    """
+    The student's rendered table for ``filters``. ``report`` is a callable
+    returning the GradeReport, called only on a miss.
+    """
+    if report is None:
+        report = lambda: build_grade_report(student, filters)
+    if not settings.GRADE_TABLE_CACHE:
+        return render_grade_table(report())
+    key = table_key(student.pk, loaded_grade_version(student), filters)
+    table = _cache.get(key)
+    if table is not None:
+        return table
+    shared = _shared_cache().get(_shared_key(key))
+    if shared is None:
+        table = render_grade_table(report())
+        _shared_cache().set(_shared_key(key), (table.html, table.stats), timeout=settings.GRADE_TABLE_CACHE_SECONDS)
+    else:
+        table = GradeTable(*shared)
+    _cache.put(key, table)
+    return table
+
+
+def default_filters():
+    """Filters of the grades page opened without a query string."""
+    return GradeFilters.from_data({})
+
+
+def warm_grade_tables(student_ids, using=None):
+    """Renders and caches the default table of each student."""
+    filters = default_filters()
+    for student in Student.objects.using(using).filter(pk__in=list(student_ids)).select_related('grade_summary'):
+        grade_table(student, filters)
+
+
+def _warm_in_thread(student_ids, using):
+    try:
+        warm_grade_tables(student_ids, using)
+    finally:
+        # The thread's own connections are not closed by any request cycle
+        connections.close_all()
+
+
+def prewarm_grade_tables(student_ids):
+    """Warms the tables of ``student_ids`` after the current transaction commits, as configured."""
+    mode = settings.GRADE_TABLE_PREWARM
+    if not student_ids or mode == 'off' or not settings.GRADE_TABLE_CACHE:
+        return
+    # The database the grades were saved to, also for the thread, which does not see the request's shard
+    using = router.db_for_write(Student)
+    if mode == 'background':
+        transaction.on_commit(lambda: threading.Thread(
+            target=_warm_in_thread, args=(list(student_ids), using), daemon=True,
+        ).start(), using=using)
+    else:
+        transaction.on_commit(lambda: warm_grade_tables(student_ids, using), using=using)
@@ -0,0 +1,264 @@
+"""
+Grade sheets: lecturers view and submit totals for a whole group at once.
+
+The sheet is read with one query that annotates every student of the group
+with their latest grade for the course. Existing grades of the sheet are
+loaded with one query and diffed against the submission; only new and
+changed rows are written, with one bulk INSERT and one bulk UPDATE inside a
+single transaction.
+
+Saves are optimistic: the sheet carries the version of every grade it shows
+and the UPDATE only matches rows still at that version (compare-and-swap), so
+concurrent saves never overwrite each other and no rows are locked. Grades
+changed by someone else since the sheet was read are reported as conflicts.
+"""
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from functools import reduce
+from operator import or_
+
+from django.db import IntegrityError, router, transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Value, When
+from django.utils import timezone
+
+from .models import Grade, Student
+
+SAVE_ATTEMPTS = 5
+# Rows per compare-and-swap UPDATE, which keeps its IN lists within database parameter limits
+CAS_BATCH_SIZE = 500
+PASS_MARK = Decimal(60)
+MAX_POINTS = Decimal(100)
+# Largest autosave batch: a whole group's sheet
+MAX_AUTOSAVE_CELLS = 500
+
+
+class SheetResult:
+    """Outcome of saving a grade sheet."""
+
+    def __init__(self):
+        self.created = []
+        self.updated = []
+        self.unchanged = []
+        # Students whose grade was changed by someone else since the sheet was read
+        self.conflicts = []
+
+
+class SheetSaveConflict(Exception):
+    """Concurrent saves kept changing the sheet between its read and its write."""
+
+
+def parse_version(value):
+    """Parses a grade version field of the grade sheet (0: no grade), raising ValueError on bad input."""
+    try:
+        version = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid grade version: {value!r}")
+    if version < 0:
+        raise ValueError(f"Invalid grade version: {value!r}")
+    return version
+
+
+def parse_points(value):
+    """Parses a points field of the grade sheet, raising ValueError on bad input."""
+    try:
+        points = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f"Invalid points value: {value!r}")
+    if not points.is_finite():
+        raise ValueError(f"Invalid points value: {value!r}")
+    return points
+
+
+def total_grade(semester_grade, exam_grade):
+    """Sum of semester and exam points, capped at 100 and rounded to the stored precision."""
+    return min(Decimal(100), parse_points(semester_grade) + parse_points(exam_grade)).quantize(Decimal('0.01'))
+
+
+def cell_total(semester_grade, exam_grade):
+    """
+    Total of one autosaved sheet cell. Both parts must be 0-100 points and the
+    (capped) total a passing grade, the 60-100 range a stored grade allows.
+    Raises ValueError otherwise.
+    """
+    semester_points, exam_points = parse_points(semester_grade), parse_points(exam_grade)
+    if not (0 <= semester_points <= MAX_POINTS and 0 <= exam_points <= MAX_POINTS):
+        raise ValueError("Points must be between 0 and 100.")
+    total = total_grade(semester_points, exam_points)
+    if total < PASS_MARK:
+        raise ValueError("The total must be at least 60 points.")
+    return total
+
+
+def parse_cells(cells):
+    """
+    Validates a batch of autosaved cells ([{"student", "semester_grade",
+    "exam_grade", "version"}, ...]; the version is optional). Returns
+    (totals, versions, errors) with errors as [{"student", "error"}, ...].
+    """
+    totals = {}
+    versions = {}
+    errors = []
+    for cell in cells:
+        student = cell.get('student') if isinstance(cell, dict) else None
+        try:
+            student_id = int(student)
+        except (TypeError, ValueError):
+            errors.append({'student': student, 'error': "Invalid student id."})
+            continue
+        try:
+            totals[student_id] = cell_total(cell.get('semester_grade', 0), cell.get('exam_grade', 0))
+            if cell.get('version') is not None:
+                versions[student_id] = parse_version(cell['version'])
+        except ValueError as error:
+            totals.pop(student_id, None)
+            errors.append({'student': student_id, 'error': str(error)})
+    return totals, versions, errors
+
+
+def default_exam_type(course):
+    """Assessment type of a course whose exam has not been created yet."""
+    return 'credit' if course.semester == 1 else 'exam'
+
+
+def sheet_national_grade(total, exam_type):
+    """National scale mark shown in the grade sheet ("-" below the pass mark)."""
+    if total < 60:
+        return "-"
+    if exam_type == 'credit':
+        return "Зарахов."
+    if total >= 90:
+        return "5"
+    if total >= 75:
+        return "4"
+    return "3"
+
+
+def sheet_points(total):
+    """Semester and exam points shown for a stored total: only the total is stored, so it is split in half."""
+    total = float(total)
+    return total / 2, total / 2
+
+
+def sheet_students(teacher, course, group_id, exam_id=None):
+    """
+    Active students of a group annotated with their latest grade from
+    ``teacher`` for ``course`` and with the value and version of their grade
+    for the sheet's exam (None without one).
+    """
+    latest = (Grade.objects
+              .filter(student=OuterRef('pk'), exam__course=course, teacher=teacher)
+              .order_by('-created_at', '-id')
+              .values('grade_value')[:1])
+    current = Grade.objects.filter(student=OuterRef('pk'), exam_id=exam_id)
+    return (Student.objects
+            .filter(group_id=group_id, is_deleted=False)
+            .only('id', 'full_name')
+            .annotate(latest_grade=Subquery(latest),
+                      current_grade=Subquery(current.values('grade_value')[:1]),
+                      grade_version=Subquery(current.values('version')[:1])))
+
+
+def _fallback_points(fallback, name):
+    """Points of a sheet field redisplayed from request data; invalid input shows as 0."""
+    try:
+        return float(parse_points(fallback.get(name, 0)))
+    except ValueError:
+        return 0.0
+
+
+def grade_sheet(teacher, course, group_id, exam_type, fallback=None, exam_id=None):
+    """
+    Students of a group annotated with the sheet columns for ``course``.
+    Students without a grade from ``teacher`` take their points from
+    ``fallback`` (request data) when given.
+    """
+    students = list(sheet_students(teacher, course, group_id, exam_id))
+    fallback = fallback or {}
+    for student in students:
+        if student.latest_grade is not None:
+            total = float(student.latest_grade)
+            semester_grade, exam_grade = sheet_points(total)
+        else:
+            semester_grade = _fallback_points(fallback, f'semester_grade_{student.id}')
+            exam_grade = _fallback_points(fallback, f'exam_grade_{student.id}')
+            total = min(100, semester_grade + exam_grade)
+        student.semester_grade = semester_grade
+        student.exam_grade = exam_grade
+        student.total_grade = total
+        student.exam_type = exam_type
+        student.national_grade = sheet_national_grade(total, exam_type)
+        student.grade_version = student.grade_version or 0
+    return students
+
+
+def save_grade_sheet(teacher, exam, totals, versions=None):
+    """
+    Upserts ``totals`` ({student_id: Decimal grade}) for one exam, keyed on
+    (exam, student), recording ``teacher`` as the grading teacher.
+    ``versions`` ({student_id: version}, 0 for no grade) are the grade versions
+    the sheet was read with; students missing from it are saved unchecked.
+    Returns a SheetResult listing the student ids per outcome.
+    """
+    versions = versions or {}
+    for attempt in range(SAVE_ATTEMPTS):
+        try:
+            return _save_grade_sheet(teacher, exam, totals, versions)
+        except (SheetSaveConflict, IntegrityError):
+            # Another save wrote between our read and our write; rereading shows its rows as conflicts
+            if attempt == SAVE_ATTEMPTS - 1:
+                raise SheetSaveConflict(f"Grade sheet of exam {exam.pk} changed during {SAVE_ATTEMPTS} save attempts.")
+
+
+def _save_grade_sheet(teacher, exam, totals, versions):
+    result = SheetResult()
+    now = timezone.now()
+    with transaction.atomic(using=router.db_for_write(Grade)):
+        existing = {
+            grade.student_id: grade
+            for grade in Grade.objects.filter(exam=exam, student_id__in=list(totals))
+            .only('id', 'student_id', 'exam_id', 'teacher_id', 'grade_value', 'version')
+        }
+        to_create = []
+        to_update = []
+        for student_id, value in totals.items():
+            grade = existing.get(student_id)
+            expected = versions.get(student_id)
+            if grade is None:
+                if expected:
+                    # Deleted since the sheet was read
+                    result.conflicts.append(student_id)
+                else:
+                    to_create.append(Grade(exam=exam, student_id=student_id, teacher=teacher, grade_value=value))
+                    result.created.append(student_id)
+            elif grade.grade_value == value and grade.teacher_id == teacher.pk:
+                result.unchanged.append(student_id)
+            elif expected is not None and expected != grade.version:
+                result.conflicts.append(student_id)
+            else:
+                # A student has one grade per exam; resubmitting takes it over
+                grade.grade_value = value
+                to_update.append(grade)
+                result.updated.append(student_id)
+        if to_create:
+            Grade.objects.bulk_create(to_create)
+        for start in range(0, len(to_update), CAS_BATCH_SIZE):
+            batch = to_update[start:start + CAS_BATCH_SIZE]
+            # Rows grouped by version read and by new value keep the statement short
+            by_version = defaultdict(list)
+            by_value = defaultdict(list)
+            for grade in batch:
+                by_version[grade.version].append(grade.pk)
+                by_value[grade.grade_value].append(grade.pk)
+            # Compare-and-swap: each row is only written if it is still at the version read above
+            written = Grade.objects.filter(
+                reduce(or_, (Q(pk__in=pks, version=version) for version, pks in by_version.items()))
+            ).update(
+                grade_value=Case(*(When(pk__in=pks, then=Value(value)) for value, pks in by_value.items()),
+                                 output_field=Grade._meta.get_field('grade_value')),
+                teacher=teacher,
+                updated_at=now,
+                version=F('version') + 1,
+            )
+            if written != len(batch):
+                raise SheetSaveConflict
+    return result
@@ -0,0 +1,80 @@
+"""
+Cached per-faculty group lists for the registration form.
+
+Each list is kept as ready-made JSON with a strong ETag, first in a small
+process-local dict and then in the shared Django cache. Shared entries are
+keyed by a generation number that any Group or Faculty change bumps (after
+the transaction commits), so all processes stop using old entries at once;
+process-local entries live for at most ``GROUPS_LOCAL_CACHE_SECONDS``.
+With the locmem backend the "shared" cache is per process too, and the
+generation bump reaches only the process that made the change; other
+processes rely on ``GROUPS_CACHE_SECONDS``, which is short by default there.
+"""
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Group
+from .sharding import use_faculty
+
+GENERATION_KEY = 'groups:generation'
+
+_local = {}
+_local_lock = threading.Lock()
+
+
+class GroupList:
+    """Serialized group list of one faculty."""
+
+    def __init__(self, body):
+        self.body = body
+        self.etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+
+
+def _shared_cache():
+    return caches[settings.GROUPS_CACHE_ALIAS]
+
+
+def load_group_list(faculty_id):
+    with use_faculty(faculty_id):
+        groups = list(Group.objects.filter(faculty_id=faculty_id).order_by('name', 'id').values('id', 'name'))
+    return GroupList(json.dumps(groups, ensure_ascii=False).encode())
+
+
+def faculty_groups(faculty_id):
+    """Group list of a faculty, from the local cache, the shared cache or the database."""
+    if not settings.GROUPS_CACHE:
+        return load_group_list(faculty_id)
+    now = time.monotonic()
+    entry = _local.get(faculty_id)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+
+    cache = _shared_cache()
+    # A missing (or evicted) generation restarts from the clock, above any number used before
+    generation = cache.get_or_set(GENERATION_KEY, time.time_ns, timeout=None)
+    key = f'groups:{generation}:{faculty_id}'
+    body = cache.get(key)
+    if body is None:
+        group_list = load_group_list(faculty_id)
+        cache.set(key, group_list.body, timeout=settings.GROUPS_CACHE_SECONDS)
+    else:
+        group_list = GroupList(body)
+    with _local_lock:
+        _local[faculty_id] = (now + settings.GROUPS_LOCAL_CACHE_SECONDS, group_list)
+    return group_list
+
+
+def invalidate_groups():
+    """Drops every cached group list, in this process and in the shared cache."""
+    with _local_lock:
+        _local.clear()
+    cache = _shared_cache()
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, time.time_ns(), timeout=None)
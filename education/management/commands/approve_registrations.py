@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from education.models import PendingRegistration
+from education.registrations import (
+    APPROVED, CHUNK_SIZE, PENDING, REJECTED, SYSTEM, ApprovalRule, auto_approve, configured_rules, decide,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Approves (or with --reject, rejects) the pending registrations matching the --faculty, --group and "
+        "--email-domain filters, or with --auto those matching the REGISTRATION_AUTO_APPROVE_RULES setting "
+        "and any --rule. Registrations are decided in chunks, one transaction per chunk."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--faculty', type=int, help="Requested faculty id.")
+        parser.add_argument('--group', type=int, help="Requested group id.")
+        parser.add_argument('--email-domain', help="Email domain of the registered user, e.g. knu.ua.")
+        parser.add_argument('--all', action='store_true', help="Decide every pending registration.")
+        parser.add_argument('--reject', action='store_true', help="Reject instead of approving.")
+        parser.add_argument('--auto', action='store_true',
+                            help="Approve by the configured rules (and --rule) instead of the filters.")
+        parser.add_argument('--rule', action='append', default=[],
+                            help="Extra approval rule for --auto, e.g. faculty=3,email_domain=knu.ua (repeatable).")
+        parser.add_argument('--decided-by', default=SYSTEM, help="Approver recorded on approved students and teachers.")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Registrations decided per transaction.")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the matching registrations.")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+        pending = PendingRegistration.objects.filter(status=PENDING)
+
+        if options['auto']:
+            if options['reject']:
+                raise CommandError("--auto only approves registrations.")
+            try:
+                rules = configured_rules() + [ApprovalRule.parse(rule) for rule in options['rule']]
+            except ValueError as error:
+                raise CommandError(str(error))
+            if not rules:
+                raise CommandError("No approval rules: set REGISTRATION_AUTO_APPROVE_RULES or pass --rule.")
+            if options['dry_run']:
+                for rule in rules:
+                    self.stdout.write(f"{rule}: {rule.filter(pending).count()} pending")
+                return
+            result = auto_approve(rules, chunk_size=options['chunk_size'])
+        else:
+            filters = {name: options[name] for name in ('faculty', 'group', 'email_domain') if options[name]}
+            if filters and options['all']:
+                raise CommandError("--all cannot be combined with filters.")
+            if not filters and not options['all']:
+                raise CommandError("Pass --faculty, --group or --email-domain, or --all for every registration.")
+            registrations = ApprovalRule(**filters).filter(pending) if filters else pending
+            if options['dry_run']:
+                self.stdout.write(f"{registrations.count()} pending")
+                return
+            status = REJECTED if options['reject'] else APPROVED
+            result = decide(registrations, status, options['decided_by'], options['chunk_size'])
+
+        self.stdout.write(self.style.SUCCESS(f"{result}."))
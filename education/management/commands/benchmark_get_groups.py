@@ -0,0 +1,53 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from education.benchmarks import HOST, Scenario, throughput
+from education.group_cache import faculty_groups, invalidate_groups
+from education.models import Faculty
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares get_groups requests per second without the group cache, with it, "
+        "and for browser revalidations (If-None-Match answered with 304)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--faculty', type=int, help="Faculty id to request (default: the one with most groups).")
+        parser.add_argument('--requests', type=int, default=2000, help="Requests per mode.")
+        parser.add_argument('--json', action='store_true', help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        faculty_id = options['faculty'] or self._busiest_faculty()
+        url = reverse('education:get_groups')
+        data = {'faculty_id': faculty_id}
+        client = Client(HTTP_HOST=HOST)
+        results = []
+        for mode, cached in (('uncached', False), ('cached', True)):
+            with override_settings(GROUPS_CACHE=cached):
+                invalidate_groups()
+                scenario = Scenario(mode, client, 'get', url, data)
+                scenario.request()  # warm-up
+                results.append(throughput(scenario, options['requests']))
+        with override_settings(GROUPS_CACHE=True):
+            etag = faculty_groups(faculty_id).etag
+            scenario = Scenario('revalidated', client, 'get', url, data, headers={'If-None-Match': etag})
+            results.append(throughput(scenario, options['requests']))
+
+        if options['json']:
+            self.stdout.write(json.dumps({'faculty_id': faculty_id, 'results': results}, indent=2))
+            return
+        self.stdout.write(f"{'mode':>12} {'status':>7} {'req/s':>10}")
+        for result in results:
+            self.stdout.write(f"{result['view']:>12} {result['status']:>7} {result['requests_per_second']:>10}")
+
+    def _busiest_faculty(self):
+        faculty_id = (Faculty.objects.annotate(groups=Count('group')).order_by('-groups', 'pk')
+                      .values_list('pk', flat=True).first())
+        if faculty_id is None:
+            raise CommandError("No faculties found; run seed_university first.")
+        return faculty_id
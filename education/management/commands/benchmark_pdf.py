@@ -0,0 +1,85 @@
+import json
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+
+from education.pdf import render_transcript
+from education.reports import GradeFilters, GradeReport, GradeRow, academic_start_year, format_academic_year
+
+
+def synthetic_report(rows):
+    """A grade report with ``rows`` grades spread over six academic years, built without the database."""
+    student = SimpleNamespace(
+        full_name="Тестовий Студент",
+        faculty=SimpleNamespace(name="Факультет інформатики"),
+        group=SimpleNamespace(name="КН-11"),
+        study_year='2020-2021',
+    )
+    generated = []
+    for i in range(rows):
+        semester = i % 2 + 1
+        year = 2020 + (i // 2) % 6
+        date = datetime(year, 12, 20, tzinfo=timezone.utc) if semester == 1 else datetime(year + 1, 5, 20, tzinfo=timezone.utc)
+        row = GradeRow(
+            id=i + 1,
+            grade_value=Decimal(60 + i % 41),
+            exam_date=date,
+            exam_type='exam' if i % 3 else 'credit',
+            semester=semester,
+            discipline_name=f"Дисципліна з довгою назвою для перевірки перенесення рядків №{i + 1}",
+            hours=90 + 30 * (i % 4),
+            academic_year=format_academic_year(academic_start_year(date)),
+        )
+        generated.append(row)
+    # Rows reach the report in display order, as the database query returns them
+    generated.sort(key=lambda r: (r.academic_year, r.semester, r.exam_type, r.exam_date, r.discipline_name, r.id))
+    report = GradeReport(student, GradeFilters())
+    for row in generated:
+        report.add(row)
+    return student, report
+
+
+class Command(BaseCommand):
+    help = "Measures PDF transcript render time and peak Python memory for growing transcript sizes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10, 100, 1000], help="Transcript sizes to render.")
+        parser.add_argument('--repeat', type=int, default=3, help="Timed renders per size; the fastest run is reported.")
+        parser.add_argument('--json', action='store_true', help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        # Warm-up render so one-time font registration is not attributed to the first size
+        student, report = synthetic_report(1)
+        with tempfile.TemporaryFile() as output:
+            render_transcript(student, report, output)
+
+        results = []
+        for rows in options['rows']:
+            student, report = synthetic_report(rows)
+            best_time = None
+            for _ in range(options['repeat']):
+                with tempfile.TemporaryFile() as output:
+                    started = time.perf_counter()
+                    render_transcript(student, report, output)
+                    elapsed = time.perf_counter() - started
+                    size = output.tell()
+                best_time = elapsed if best_time is None else min(best_time, elapsed)
+            # Memory is traced in a separate run since tracemalloc slows rendering down
+            with tempfile.TemporaryFile() as output:
+                tracemalloc.start()
+                render_transcript(student, report, output)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            results.append({'rows': rows, 'seconds': round(best_time, 4), 'peak_kib': peak // 1024, 'pdf_kib': size // 1024})
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{'rows':>8} {'seconds':>10} {'peak KiB':>10} {'PDF KiB':>10}")
+        for result in results:
+            self.stdout.write(f"{result['rows']:>8} {result['seconds']:>10.4f} {result['peak_kib']:>10} {result['pdf_kib']:>10}")
@@ -0,0 +1,46 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from education.benchmarks import default_student, measure, view_scenarios
+
+SESSION_VIEWS = ('student_profile', 'student_grades')
+DEFAULT_MESSAGE_STORAGE = 'django.contrib.messages.storage.fallback.FallbackStorage'
+COOKIE_MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares DB round trips and wall time per request of student_profile and student_grades "
+        "for each session mode (see SESSION_MODE)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', default=list(settings.SESSION_ENGINES), choices=list(settings.SESSION_ENGINES))
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per view; the fastest one is reported.")
+        parser.add_argument('--json', action='store_true', help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        student = default_student()
+        if student is None:
+            raise CommandError("No students found; run seed_university first.")
+
+        results = []
+        for mode in options['modes']:
+            message_storage = DEFAULT_MESSAGE_STORAGE if mode == 'db' else COOKIE_MESSAGE_STORAGE
+            with override_settings(SESSION_ENGINE=settings.SESSION_ENGINES[mode], MESSAGE_STORAGE=message_storage):
+                # Clients are created here so their middleware picks up the session engine
+                for scenario in view_scenarios(student, None):
+                    if scenario.name not in SESSION_VIEWS:
+                        continue
+                    scenario.request()
+                    results.append({'session_mode': mode, **measure(scenario, options['repeat'])})
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{'mode':>16} {'view':>16} {'queries':>8} {'seconds':>10}")
+        for result in results:
+            self.stdout.write(f"{result['session_mode']:>16} {result['view']:>16} {result['queries']:>8} {result['seconds']:>10.4f}")
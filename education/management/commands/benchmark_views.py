@@ -0,0 +1,65 @@
+import json
+import platform
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from education.benchmarks import default_student, default_teacher, measure, view_scenarios
+from education.models import Grade, Student, Teacher
+
+
+class Command(BaseCommand):
+    help = (
+        "Drives the student and lecturer views through the test client against the current database and "
+        "records wall time, query count and peak Python memory per view. Run seed_university first for "
+        "realistic volumes. Note that save_grades writes to the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--student', help="Username of the student to benchmark as (default: first seeded student).")
+        parser.add_argument('--teacher', help="Username of the lecturer to benchmark as (default: first seeded lecturer with a course).")
+        parser.add_argument('--views', nargs='+', help="Only run these views.")
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per view; the fastest one is reported.")
+        parser.add_argument('--output', help="Write the JSON results to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        student = self._user(Student, options['student']) if options['student'] else default_student()
+        teacher = self._user(Teacher, options['teacher']) if options['teacher'] else default_teacher()
+        if student is None and teacher is None:
+            raise CommandError("No students or lecturers found; run seed_university first.")
+
+        scenarios = view_scenarios(student, teacher)
+        if options['views']:
+            scenarios = [scenario for scenario in scenarios if scenario.name in options['views']]
+        results = []
+        for scenario in scenarios:
+            scenario.request()  # warm-up: template loading, font registration, connection setup
+            results.append(measure(scenario, options['repeat']))
+            self.stderr.write(f"{scenario.name}: {results[-1]['seconds']:.4f} s, {results[-1]['queries']} queries")
+
+        report = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'pdf_export_mode': settings.PDF_EXPORT_MODE,
+            'student': student and student.user.username,
+            'teacher': teacher and teacher.user.username,
+            'student_grades': student and Grade.objects.filter(student=student).count(),
+            'repeat': options['repeat'],
+            'results': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Wrote {len(results)} results to {options['output']}."))
+        else:
+            self.stdout.write(output)
+
+    def _user(self, model, username):
+        try:
+            return model.objects.select_related('user').get(user__username=username)
+        except model.DoesNotExist:
+            raise CommandError(f"No {model.__name__.lower()} with username {username!r}.")
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from education.query_plans import full_scans, hot_queries
+
+
+class Command(BaseCommand):
+    help = "Runs EXPLAIN on the hot grade queries and fails if any of them scans a whole table."
+
+    def handle(self, *args, **options):
+        queries = hot_queries()
+        try:
+            scans = list(full_scans(queries))
+        except NotImplementedError as exc:
+            raise CommandError(str(exc))
+        if options['verbosity'] > 1:
+            for name, queryset in queries:
+                self.stdout.write(f"{name}:\n{queryset.explain()}\n")
+        for name, table, plan in scans:
+            self.stderr.write(f"{name}: full scan of {table}\n{plan}")
+        if scans:
+            raise CommandError(f"{len(scans)} full table scans found in hot queries.")
+        self.stdout.write(self.style.SUCCESS(f"All {len(queries)} hot queries use indexes."))
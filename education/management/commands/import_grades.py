@@ -0,0 +1,52 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from education.grade_import import CHUNK_SIZE, GradeImporter
+from education.models import Teacher
+from education.sharding import fan_out, use_shard
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports grades from a CSV file with the columns student (email or id), discipline (id or name), "
+        "semester_grade and exam_grade, as given by one lecturer. The file is streamed and upserted in "
+        "chunks; rejected rows are listed with their line number."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file (UTF-8, with a header row).")
+        parser.add_argument('--teacher', required=True, help="Username of the lecturer giving the grades.")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Rows upserted per transaction.")
+        parser.add_argument('--report', help="Also write the rejected rows (line, error) to this CSV file.")
+
+    def handle(self, *args, **options):
+        teacher = None
+        for teachers in fan_out(Teacher.objects.filter(user__username=options['teacher'])):
+            teacher = teachers.first()
+            if teacher is not None:
+                break
+        if teacher is None:
+            raise CommandError(f"No teacher with username {options['teacher']!r}.")
+
+        started = time.perf_counter()
+        try:
+            # The lecturer's courses, students and grades are on the shard of their faculty
+            with open(options['path'], newline='', encoding='utf-8-sig') as f, use_shard(teacher._state.db):
+                result = GradeImporter(teacher, options['chunk_size']).run(f)
+        except OSError as error:
+            raise CommandError(f"Cannot read {options['path']}: {error}")
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        for line, error in result.errors:
+            self.stdout.write(f"line {line}: {error}")
+        if options['report']:
+            with open(options['report'], 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['line', 'error'])
+                writer.writerows(result.errors)
+        summary = (f"{result.rows} rows in {time.perf_counter() - started:.1f} s: {result.created} created, "
+                   f"{result.updated} updated, {result.unchanged} unchanged, {len(result.errors)} rejected.")
+        self.stdout.write(self.style.WARNING(summary) if result.errors else self.style.SUCCESS(summary))
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from education.sharding import CHUNK_SIZE, FACULTY_PATHS, faculty_rows, move_faculty, reload_faculty_shards, shard_for_faculty
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves all data of a faculty to another shard (see DATABASE_SHARD_URLS): copies its groups, students, "
+        "teachers, courses, grades and registrations in one transaction, maps the faculty to the new shard and "
+        "deletes the rows from the old one. Stop writes to the faculty while it runs; other processes follow "
+        "the new map within DATABASE_SHARD_MAP_TTL seconds. If a move is interrupted, run it again to finish it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('faculty', type=int, help="Faculty id.")
+        parser.add_argument('shard', help="Target shard alias.")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Rows copied per INSERT.")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the faculty's rows.")
+
+    def handle(self, *args, **options):
+        if len(settings.DATABASE_SHARDS) < 2:
+            raise CommandError("Sharding is off: set DATABASE_SHARD_URLS.")
+        if options['shard'] not in settings.DATABASE_SHARDS:
+            raise CommandError(f"Unknown shard {options['shard']!r}; shards: {', '.join(settings.DATABASE_SHARDS)}.")
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+
+        if options['dry_run']:
+            reload_faculty_shards()
+            source = shard_for_faculty(options['faculty'])
+            for model in FACULTY_PATHS:
+                count = faculty_rows(model, options['faculty'], source).count()
+                self.stdout.write(f"{model._meta.db_table}: {count} on {source}")
+            return
+        try:
+            result = move_faculty(options['faculty'], options['shard'], options['chunk_size'])
+        except ValueError as error:
+            raise CommandError(str(error))
+        for table, count in result.rows.items():
+            self.stdout.write(f"{table}: {count}")
+        self.stdout.write(self.style.SUCCESS(f"{result}."))
@@ -0,0 +1,62 @@
+import csv
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from education.roster import CHUNK_SIZE, CREATED_BY, CREDENTIAL_COLUMNS, RosterProvisioner
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates active student accounts from a CSV roster with the columns full_name, email, faculty "
+        "(id or name) and group (id or name within the faculty), and optionally username (default: the "
+        "email) and study_year. Passwords are generated and hashed across a process pool, accounts are "
+        "bulk inserted in chunks and the generated credentials are written to a CSV file readable only "
+        "by its owner."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV roster (UTF-8, with a header row).")
+        parser.add_argument('--credentials', required=True,
+                            help="CSV file to write the username, email and password of every created student to.")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Processes hashing passwords (default: one per CPU; 1 hashes in this process).")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Students inserted per transaction.")
+        parser.add_argument('--study-year', help="Study year of rows without one (default: the model default).")
+        parser.add_argument('--created-by', default=CREATED_BY, help="Value recorded as the creating admin.")
+        parser.add_argument('--report', help="Also write the rejected rows (line, error) to this CSV file.")
+
+    def handle(self, *args, **options):
+        if options['workers'] is not None and options['workers'] < 1:
+            raise CommandError("--workers must be at least 1.")
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+
+        started = time.perf_counter()
+        provisioner = RosterProvisioner(options['workers'], options['chunk_size'], options['study_year'],
+                                        options['created_by'])
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as roster:
+                # The file holds plain-text passwords, so it is created readable by its owner only
+                descriptor = os.open(options['credentials'], os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with open(descriptor, 'w', newline='', encoding='utf-8') as output:
+                    credentials = csv.writer(output)
+                    credentials.writerow(CREDENTIAL_COLUMNS)
+                    result = provisioner.run(roster, credentials)
+        except OSError as error:
+            raise CommandError(str(error))
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        for line, error in result.errors:
+            self.stdout.write(f"line {line}: {error}")
+        if options['report']:
+            with open(options['report'], 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['line', 'error'])
+                writer.writerows(result.errors)
+        summary = (f"{result.rows} rows in {time.perf_counter() - started:.1f} s with {provisioner.workers} "
+                   f"hashing worker(s): {result.created} students created, {len(result.errors)} rejected. "
+                   f"Credentials written to {options['credentials']}.")
+        self.stdout.write(self.style.WARNING(summary) if result.errors else self.style.SUCCESS(summary))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from education.summaries import find_inconsistent_summaries, rebuild_all_summaries
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the per-student grade summary table from scratch and verifies it against the Grade table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help="Only compare the stored summaries with freshly computed ones; do not write anything.",
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            count = rebuild_all_summaries()
+            self.stdout.write(f"Rebuilt grade summaries for {count} students.")
+
+        mismatches = 0
+        for student_id, field, stored, expected in find_inconsistent_summaries():
+            mismatches += 1
+            self.stderr.write(f"Student {student_id}: {field} is {stored}, expected {expected}")
+        if mismatches:
+            raise CommandError(f"{mismatches} inconsistent summary values found.")
+        self.stdout.write(self.style.SUCCESS("Grade summaries are consistent."))
@@ -0,0 +1,48 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from education.sharding import use_shard
+from education.transcripts import claim_next_job, evict_transcripts, process_job, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = "Renders queued PDF transcript exports and evicts old cached transcripts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty instead of polling.")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to sleep while the queue is empty.")
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help="Requeue jobs that have been 'running' for longer than this many seconds.")
+        parser.add_argument('--evict-every', type=int, default=50, help="Run cache eviction after this many jobs.")
+
+    def requeue_stale_jobs(self, stale_after):
+        for alias in settings.DATABASE_SHARDS:
+            with use_shard(alias):
+                requeue_stale_jobs(stale_after)
+
+    def handle(self, *args, **options):
+        processed = 0
+        self.requeue_stale_jobs(options['stale_after'])
+        while True:
+            # One job per shard and pass, so a busy shard does not starve the others
+            claimed = False
+            for alias in settings.DATABASE_SHARDS:
+                with use_shard(alias):
+                    job = claim_next_job()
+                    if job is None:
+                        continue
+                    ok = process_job(job)
+                claimed = True
+                processed += 1
+                self.stdout.write(f"Transcript job {job.pk} {'done' if ok else 'failed'}.")
+                if processed % options['evict_every'] == 0:
+                    evict_transcripts()
+            if not claimed:
+                evict_transcripts()
+                if options['once']:
+                    break
+                self.requeue_stale_jobs(options['stale_after'])
+                time.sleep(options['poll_interval'])
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} transcript jobs."))
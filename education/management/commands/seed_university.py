@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from education.seeding import USERNAME_PREFIX, seed_university, seeded_data_exists
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates a deterministic synthetic university (faculties, groups, students, teachers, disciplines, "
+        "courses, exams and grades) with bulk inserts. The defaults produce 20,000 students with 60 grades each."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--faculties', type=int, default=10)
+        parser.add_argument('--groups-per-faculty', type=int, default=20)
+        parser.add_argument('--students-per-group', type=int, default=100)
+        parser.add_argument('--teachers-per-faculty', type=int, default=10)
+        parser.add_argument('--grades-per-student', type=int, default=60)
+        parser.add_argument('--seed', type=int, default=42, help="Random seed; the same seed gives the same data.")
+        parser.add_argument('--password', default='seed-password', help="Password of every seeded user.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if seeded_data_exists():
+            raise CommandError(f"Seeded users ({USERNAME_PREFIX}*) already exist; use a fresh database.")
+        started = time.perf_counter()
+        result = seed_university(
+            faculties=options['faculties'],
+            groups_per_faculty=options['groups_per_faculty'],
+            students_per_group=options['students_per_group'],
+            teachers_per_faculty=options['teachers_per_faculty'],
+            grades_per_student=options['grades_per_student'],
+            seed=options['seed'],
+            password=options['password'],
+            batch_size=options['batch_size'],
+        )
+        for model, count in result.counts.items():
+            self.stdout.write(f"{model:>16}: {count}")
+        self.stdout.write(self.style.SUCCESS(f"Seeded in {time.perf_counter() - started:.1f} s."))
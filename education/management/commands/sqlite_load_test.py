@@ -0,0 +1,128 @@
+import json
+import multiprocessing
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+
+from education.benchmarks import default_teacher
+from education.gradebook import save_grade_sheet
+from education.models import Exam, Student
+from education.reports import GradeFilters, build_grade_report
+
+# Students per saved grade sheet
+SHEET_SIZE = 30
+
+
+def _percentile(timings, fraction):
+    return round(sorted(timings)[int(fraction * (len(timings) - 1))] * 1000, 1) if timings else None
+
+
+def _worker(role, number, seconds, plan, results):
+    """Runs reads or grade sheet saves for ``seconds`` and puts its counts and latencies on ``results``."""
+    rng = random.Random(number)
+    timings, locked, failed = [], 0, 0
+    deadline = time.perf_counter() + seconds
+    try:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                if role == 'reader':
+                    student = Student.objects.select_related('grade_summary').get(pk=rng.choice(plan['students']))
+                    build_grade_report(student, GradeFilters.from_data({})).stats_context()
+                else:
+                    exam, student_ids = rng.choice(plan['sheets'])
+                    totals = {student_id: Decimal(rng.randint(6000, 10000)) / 100 for student_id in student_ids}
+                    save_grade_sheet(plan['teacher'], exam, totals)
+            except OperationalError as error:
+                if 'locked' in str(error):
+                    locked += 1
+                else:
+                    failed += 1
+                continue
+            except Exception:
+                failed += 1
+                continue
+            timings.append(time.perf_counter() - started)
+    finally:
+        connection.close()
+    results.put({
+        'role': role,
+        'process': number,
+        'operations': len(timings),
+        'per_second': round(len(timings) / seconds, 1),
+        'p50_ms': _percentile(timings, 0.5),
+        'p95_ms': _percentile(timings, 0.95),
+        'max_ms': _percentile(timings, 1),
+        'locked_errors': locked,
+        'other_errors': failed,
+    })
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs reader processes (grade reports of random students) and writer processes (grade sheet saves) "
+        "against the current database at the same time and reports the progress of each. Needs seeded data "
+        "(seed_university); writes change grades. Processes are forked, like gunicorn workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--json', action='store_true', help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise CommandError("The load test forks its worker processes, which this platform does not support.")
+        teacher = default_teacher()
+        if teacher is None:
+            raise CommandError("No teachers with courses found; run seed_university first.")
+        sheets = []
+        exams = Exam.objects.filter(course__teacher=teacher).select_related('course__discipline').order_by('pk')
+        for exam in exams[:20]:
+            student_ids = list(Student.objects.filter(faculty_id=exam.course.discipline.faculty_id, is_deleted=False)
+                               .order_by('group_id', 'pk').values_list('pk', flat=True)[:SHEET_SIZE])
+            if student_ids:
+                sheets.append((exam, student_ids))
+        if not sheets:
+            raise CommandError("The teacher's exams have no students to grade; run seed_university first.")
+        plan = {
+            'teacher': teacher,
+            'sheets': sheets,
+            'students': list(Student.objects.filter(is_deleted=False).values_list('pk', flat=True)[:10000]),
+        }
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+        # Forked children must open connections of their own
+        connections.close_all()
+
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        roles = ['reader'] * options['readers'] + ['writer'] * options['writers']
+        processes = [context.Process(target=_worker, args=(role, number, options['seconds'], plan, results))
+                     for number, role in enumerate(roles)]
+        for process in processes:
+            process.start()
+        rows = sorted((results.get() for _ in processes), key=lambda row: row['process'])
+        for process in processes:
+            process.join()
+
+        if options['json']:
+            self.stdout.write(json.dumps({'journal_mode': journal_mode, 'processes': rows}, indent=2))
+            return
+        self.stdout.write(f"journal_mode={journal_mode}, {options['seconds']:g} s")
+        self.stdout.write(f"{'role':>8} {'ops':>7} {'ops/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} "
+                          f"{'locked':>7} {'errors':>7}")
+        for row in rows:
+            self.stdout.write(f"{row['role']:>8} {row['operations']:>7} {row['per_second']:>8} {row['p50_ms']!s:>8} "
+                              f"{row['p95_ms']!s:>8} {row['max_ms']!s:>8} {row['locked_errors']:>7} "
+                              f"{row['other_errors']:>7}")
+        stalled = [row for row in rows if not row['operations']]
+        if stalled:
+            self.stdout.write(self.style.WARNING(f"{len(stalled)} process(es) made no progress."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Every reader and writer made progress."))
@@ -0,0 +1,141 @@
+"""
+Opt-in per-request instrumentation.
+
+When ``REQUEST_INSTRUMENTATION`` is enabled, every request records its query
+count, SQL time, duplicated query fingerprints (a sign of N+1 loops),
+template render time and total time. The numbers are sent back in a
+``Server-Timing`` header and logged as one JSON line; requests slower than
+``REQUEST_SLOW_THRESHOLD_MS`` are logged as warnings together with their
+slowest SQL statements. When disabled, the middleware removes itself from the
+chain at startup, so requests pay nothing for it.
+"""
+import contextvars
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import Template as DjangoTemplate
+
+logger = logging.getLogger(__name__)
+
+# Collector of the request being handled in the current thread or task
+_current = contextvars.ContextVar('request_metrics', default=None)
+_template_timing_installed = False
+
+_IN_LIST = re.compile(r'\((?:%s, )+%s\)')
+_LITERAL = re.compile(r"\b\d+\b|'(?:[^']|'')*'")
+
+
+def fingerprint(sql):
+    """SQL with literals and IN-list lengths normalized, so repeats of one query compare equal."""
+    return _LITERAL.sub('?', _IN_LIST.sub('(%s, ...)', sql))
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = []  # (sql, seconds)
+        self.template_seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Database execute wrapper
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    @property
+    def sql_seconds(self):
+        return sum(seconds for _, seconds in self.queries)
+
+    def duplicates(self):
+        """(fingerprint, count) of queries run more than once, most repeated first."""
+        counts = Counter(fingerprint(sql) for sql, _ in self.queries)
+        return [(sql, count) for sql, count in counts.most_common() if count > 1]
+
+    def slowest(self, limit):
+        return sorted(self.queries, key=lambda query: query[1], reverse=True)[:limit]
+
+
+def _install_template_timing():
+    """Wraps template rendering once so render time is added to the current request's metrics."""
+    global _template_timing_installed
+    if _template_timing_installed:
+        return
+    render = DjangoTemplate.render
+
+    def timed_render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return render(self, context, request)
+        started = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            metrics.template_seconds += time.perf_counter() - started
+
+    DjangoTemplate.render = timed_render
+    _template_timing_installed = True
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+class RequestInstrumentationMiddleware:
+    def __init__(self, get_response):
+        if not settings.REQUEST_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_threshold = settings.REQUEST_SLOW_THRESHOLD_MS / 1000
+        self.slow_query_count = settings.REQUEST_SLOW_QUERY_COUNT
+        _install_template_timing()
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - started
+        self.report(request, response, metrics, total)
+        return response
+
+    def report(self, request, response, metrics, total):
+        sql_seconds = metrics.sql_seconds
+        duplicates = metrics.duplicates()
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={_ms(sql_seconds)};desc="{len(metrics.queries)} queries"',
+            f'tpl;dur={_ms(metrics.template_seconds)}',
+            f'app;dur={_ms(max(total - sql_seconds - metrics.template_seconds, 0))}',
+            f'total;dur={_ms(total)}',
+        ])
+        match = request.resolver_match
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'total_ms': _ms(total),
+            'sql_ms': _ms(sql_seconds),
+            'template_ms': _ms(metrics.template_seconds),
+            'queries': len(metrics.queries),
+            'duplicate_queries': [{'sql': sql, 'count': count} for sql, count in duplicates],
+        }
+        if total >= self.slow_threshold:
+            record['slowest_queries'] = [{'sql': sql, 'ms': _ms(seconds)}
+                                         for sql, seconds in metrics.slowest(self.slow_query_count)]
+            logger.warning(json.dumps(record, ensure_ascii=False))
+        else:
+            logger.info(json.dumps(record, ensure_ascii=False))
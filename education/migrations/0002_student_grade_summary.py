@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:06
+
+import django.db.models.deletion
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, F, IntegerField, Max, Min, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_summaries(apps, schema_editor):
+    Grade = apps.get_model('education', 'Grade')
+    StudentGradeSummary = apps.get_model('education', 'StudentGradeSummary')
+    # The database being migrated, not the one the routers pick
+    db_alias = schema_editor.connection.alias
+    credits = F('exam__course__discipline__hours') / 30
+    grades = Grade.objects.using(db_alias).filter(student_id=OuterRef('student_id'))
+    rows = (Grade.objects.using(db_alias).values('student_id')
+            .annotate(
+                total_count=Count('id'),
+                exam_count=Count('id', filter=Q(exam__type='exam')),
+                credit_count=Count('id', filter=Q(exam__type='credit')),
+                grade_sum=Sum('grade_value'),
+                credits_total=Coalesce(Sum(credits, output_field=IntegerField()), 0),
+                weighted_grade_sum=Coalesce(Sum(F('grade_value') * credits, output_field=DecimalField()), Decimal(0)),
+                highest_value=Max('grade_value'),
+                lowest_value=Min('grade_value'),
+                highest_grade_id=Subquery(grades.order_by('-grade_value', 'id').values('id')[:1]),
+                lowest_grade_id=Subquery(grades.order_by('grade_value', 'id').values('id')[:1]),
+            )
+            .order_by())
+    StudentGradeSummary.objects.using(db_alias).bulk_create(
+        (StudentGradeSummary(**row) for row in rows.iterator()), batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('education', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentGradeSummary',
+            fields=[
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='grade_summary', serialize=False, to='education.student')),
+                ('total_count', models.PositiveIntegerField(default=0)),
+                ('exam_count', models.PositiveIntegerField(default=0)),
+                ('credit_count', models.PositiveIntegerField(default=0)),
+                ('grade_sum', models.DecimalField(decimal_places=2, default=0, max_digits=9)),
+                ('credits_total', models.PositiveIntegerField(default=0)),
+                ('weighted_grade_sum', models.DecimalField(decimal_places=2, default=0, max_digits=11)),
+                ('highest_value', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('lowest_value', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('highest_grade', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='education.grade')),
+                ('lowest_grade', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='education.grade')),
+            ],
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:09
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('education', '0002_student_grade_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentgradesummary',
+            name='grade_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='TranscriptJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filters_key', models.CharField(max_length=100)),
+                ('filters', models.JSONField()),
+                ('grade_version', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('file_path', models.CharField(blank=True, max_length=255)),
+                ('file_size', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('last_accessed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transcript_jobs', to='education.student')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='transcript_job_queue_idx')],
+                'constraints': [models.UniqueConstraint(fields=('student', 'filters_key', 'grade_version'), name='unique_transcript_job')],
+            },
+        ),
+    ]
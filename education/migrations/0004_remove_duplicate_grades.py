@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:18
+
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Count, DecimalField, F, IntegerField, Max, Min, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_grades(apps, schema_editor):
+    """
+    Keeps only the latest grade per (exam, student) so the unique constraint in
+    0005 can be added, then recomputes the summaries of the affected students.
+    """
+    Grade = apps.get_model('education', 'Grade')
+    StudentGradeSummary = apps.get_model('education', 'StudentGradeSummary')
+    db_alias = schema_editor.connection.alias
+    duplicated = (Grade.objects.using(db_alias).values('exam_id', 'student_id')
+                  .annotate(count=Count('id')).filter(count__gt=1).order_by())
+    student_ids = set()
+    for row in duplicated.iterator():
+        grades = Grade.objects.using(db_alias).filter(exam_id=row['exam_id'], student_id=row['student_id'])
+        latest = grades.order_by('-created_at', '-id').values_list('id', flat=True)[0]
+        grades.exclude(pk=latest).delete()
+        student_ids.add(row['student_id'])
+    if not student_ids:
+        return
+
+    credits = F('exam__course__discipline__hours') / 30
+    grades = Grade.objects.using(db_alias).filter(student_id=OuterRef('student_id'))
+    rows = (Grade.objects.using(db_alias).filter(student_id__in=student_ids)
+            .values('student_id')
+            .annotate(
+                total_count=Count('id'),
+                exam_count=Count('id', filter=Q(exam__type='exam')),
+                credit_count=Count('id', filter=Q(exam__type='credit')),
+                grade_sum=Sum('grade_value'),
+                credits_total=Coalesce(Sum(credits, output_field=IntegerField()), 0),
+                weighted_grade_sum=Coalesce(Sum(F('grade_value') * credits, output_field=DecimalField()), Decimal(0)),
+                highest_value=Max('grade_value'),
+                lowest_value=Min('grade_value'),
+                highest_grade_id=Subquery(grades.order_by('-grade_value', 'id').values('id')[:1]),
+                lowest_grade_id=Subquery(grades.order_by('grade_value', 'id').values('id')[:1]),
+            )
+            .order_by())
+    for row in rows:
+        StudentGradeSummary.objects.using(db_alias).filter(student_id=row.pop('student_id')).update(
+            grade_version=F('grade_version') + 1, **row
+        )
+
+
+class Migration(migrations.Migration):
+    # Runs in its own transaction: on PostgreSQL the deletes leave deferred FK
+    # trigger events that block adding the unique index in the same transaction.
+
+    dependencies = [
+        ('education', '0003_transcript_job'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_grades, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:31
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_academic_year(apps, schema_editor):
+    Exam = apps.get_model('education', 'Exam')
+    db_alias = schema_editor.connection.alias
+    exams = []
+    for exam in Exam.objects.using(db_alias).only('id', 'date').iterator(chunk_size=1000):
+        date = timezone.localtime(exam.date) if timezone.is_aware(exam.date) else exam.date
+        exam.academic_year = date.year if date.month >= 9 else date.year - 1
+        exams.append(exam)
+    Exam.objects.using(db_alias).bulk_update(exams, ['academic_year'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('education', '0005_grade_access_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exam',
+            name='academic_year',
+            field=models.PositiveSmallIntegerField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_academic_year, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='exam',
+            name='academic_year',
+            field=models.PositiveSmallIntegerField(db_index=True, editable=False),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('education', '0007_grade_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacultyShard',
+            fields=[
+                ('faculty', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='shard', serialize=False, to='education.faculty')),
+                ('alias', models.CharField(max_length=50)),
+            ],
+        ),
+    ]
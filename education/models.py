@@ -1,13 +1,32 @@
+from datetime import datetime
+
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
+from django.utils.functional import cached_property
+
+
+def academic_start_year(date):
+    """Start year of the academic year a date belongs to (September cutoff, local time)."""
+    if isinstance(date, datetime) and timezone.is_aware(date):
+        date = timezone.localtime(date)
+    return date.year if date.month >= 9 else date.year - 1
 
 class ApplicationUser(AbstractUser):
     full_name = models.CharField(max_length=255)
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(default=timezone.now)
 
+    @cached_property
+    def role(self):
+        """'student', 'teacher' or None; computed once per user object (i.e. per request)."""
+        if hasattr(self, 'student'):
+            return 'student'
+        if hasattr(self, 'teacher'):
+            return 'teacher'
+        return None
+
     def __str__(self):
         return self.username
 
@@ -21,6 +40,14 @@ class Faculty(models.Model):
     def __str__(self):
         return self.name
 
+class FacultyShard(models.Model):
+    """Database alias holding a faculty's data; faculties without a row live on ``default``."""
+    faculty = models.OneToOneField(Faculty, on_delete=models.CASCADE, primary_key=True, related_name='shard')
+    alias = models.CharField(max_length=50)
+
+    def __str__(self):
+        return f"{self.faculty_id} -> {self.alias}"
+
 class Group(models.Model):
     name = models.CharField(max_length=50)
     faculty = models.ForeignKey(Faculty, on_delete=models.CASCADE)
@@ -42,6 +69,12 @@ class Student(models.Model):
     updated_at = models.DateTimeField(default=timezone.now)
     is_deleted = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Group rosters (grade sheets) list the active students of one group
+            models.Index(fields=['group', 'is_deleted'], name='student_group_active_idx'),
+        ]
+
     def __str__(self):
         return self.full_name
 
@@ -84,6 +117,11 @@ class Course(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['teacher', 'discipline'], name='course_teacher_discipline_idx'),
+        ]
+
     def __str__(self):
         return f"{self.discipline.name} - {self.teacher.full_name}"
 
@@ -91,12 +129,67 @@ class Exam(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE, null=True, blank=True)
     date = models.DateTimeField()
     type = models.CharField(max_length=20, choices=[('exam', 'Exam'), ('credit', 'Credit')], default='exam')
+    # Start year of the academic year of ``date``, kept in sync on save (bulk writes must set it)
+    academic_year = models.PositiveSmallIntegerField(db_index=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    def save(self, *args, **kwargs):
+        self.academic_year = academic_start_year(self.date)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'date' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'academic_year'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.course} - {self.date}"
 
+class GradeQuerySet(models.QuerySet):
+    """Bulk write paths skip model signals, so they refresh grade summaries themselves."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Set while bulk_update runs its per-batch update(); it refreshes once at the end
+        self._refresh_deferred = False
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._refresh_deferred = self._refresh_deferred
+        return clone
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from .summaries import refresh_summaries
+        objs = super().bulk_create(objs, *args, **kwargs)
+        refresh_summaries({obj.student_id for obj in objs})
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        from .summaries import refresh_summaries
+        objs = list(objs)
+        student_ids = {obj.student_id for obj in objs}
+        if 'student' in fields or 'student_id' in fields:
+            # Students the rows are moved away from need a refresh as well
+            student_ids |= set(self.model.objects.filter(pk__in=[obj.pk for obj in objs])
+                               .values_list('student_id', flat=True))
+        deferred = self._clone()
+        deferred._refresh_deferred = True
+        rows = super(GradeQuerySet, deferred).bulk_update(objs, fields, *args, **kwargs)
+        refresh_summaries(student_ids)
+        return rows
+
+    def update(self, **kwargs):
+        from .summaries import refresh_summaries
+        # Like Grade.save(), every write moves the grade version on
+        kwargs.setdefault('version', models.F('version') + 1)
+        if self._refresh_deferred:
+            return super().update(**kwargs)
+        student_ids = set(self.values_list('student_id', flat=True))
+        rows = super().update(**kwargs)
+        if 'student' in kwargs or 'student_id' in kwargs:
+            student_ids.add(getattr(kwargs.get('student'), 'pk', kwargs.get('student_id')))
+        refresh_summaries(student_ids)
+        return rows
+
 class Grade(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     exam = models.ForeignKey(Exam, on_delete=models.CASCADE)
@@ -104,10 +197,70 @@ class Grade(models.Model):
     grade_value = models.DecimalField(max_digits=5, decimal_places=2, validators=[MinValueValidator(60), MaxValueValidator(100)])  # Updated min to 60
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Bumped on every write; grade sheets send it back so concurrent saves are detected
+    version = models.PositiveIntegerField(default=1)
+
+    objects = GradeQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Report and summary queries filter a student's grades by value range
+            models.Index(fields=['student', 'grade_value'], name='grade_student_value_idx'),
+        ]
+        constraints = [
+            # One grade per student and exam; its index also serves (exam, student, teacher) lookups
+            models.UniqueConstraint(fields=['exam', 'student'], name='unique_grade_exam_student'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored values so summary updates can apply a delta on save
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            self.version += 1
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'version'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.exam.course.discipline.name}, {self.student.group.name}, {self.student.full_name}, {self.grade_value}"
 
+class StudentGradeSummary(models.Model):
+    """
+    Denormalized grade statistics of one student, kept up to date by the
+    Grade signals and bulk queryset methods (see education/summaries.py).
+    """
+    student = models.OneToOneField(Student, on_delete=models.CASCADE, primary_key=True, related_name='grade_summary')
+    total_count = models.PositiveIntegerField(default=0)
+    exam_count = models.PositiveIntegerField(default=0)
+    credit_count = models.PositiveIntegerField(default=0)
+    grade_sum = models.DecimalField(max_digits=9, decimal_places=2, default=0)
+    credits_total = models.PositiveIntegerField(default=0)
+    weighted_grade_sum = models.DecimalField(max_digits=11, decimal_places=2, default=0)
+    highest_value = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    highest_grade = models.ForeignKey(Grade, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    lowest_value = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    lowest_grade = models.ForeignKey(Grade, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    # Bumped on every change to the student's grades; used as a cache key component
+    grade_version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def average(self):
+        return round(self.grade_sum / self.total_count) if self.total_count else 0
+
+    @property
+    def weighted_average(self):
+        return round(self.weighted_grade_sum / self.credits_total, 2) if self.credits_total else 0
+
+    def __str__(self):
+        return f"{self.student_id}: {self.total_count} grades"
+
 class PendingRegistration(models.Model):
     user = models.OneToOneField(ApplicationUser, on_delete=models.CASCADE)
     requested_faculty = models.ForeignKey(Faculty, on_delete=models.SET_NULL, null=True)
@@ -117,4 +270,36 @@ class PendingRegistration(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
 
     def __str__(self):
-        return f"{self.user.username} - {self.status}"
\ No newline at end of file
+        return f"{self.user.username} - {self.status}"
+
+class TranscriptJob(models.Model):
+    """
+    A PDF transcript export rendered by the ``run_transcript_worker`` command.
+    Jobs are unique per (student, filter set, grade version), so a finished job
+    doubles as a cache entry until the student's grades change.
+    """
+    STATUS_CHOICES = [('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')]
+
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='transcript_jobs')
+    filters_key = models.CharField(max_length=100)
+    filters = models.JSONField()
+    grade_version = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    file_path = models.CharField(max_length=255, blank=True)
+    file_size = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_accessed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'filters_key', 'grade_version'], name='unique_transcript_job'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='transcript_job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.student_id} v{self.grade_version} [{self.filters_key}] - {self.status}"
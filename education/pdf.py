@@ -0,0 +1,182 @@
+"""
+PDF rendering of tabular documents (grade transcripts, grade sheets).
+
+Fonts and paragraph styles are set up once per process. Each table gets one
+precomputed style command list, long tables are emitted as a sequence of
+row chunks that repeat the column header, and documents are written straight
+into the given file object instead of an in-memory buffer.
+"""
+import threading
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Table, TableStyle
+
+# Kinds of table rows
+SECTION = 'section'
+SUBSECTION = 'subsection'
+DATA = 'data'
+
+CHUNK_ROWS = 100
+CELL_PADDING = 12  # left + right cell padding used by ReportLab tables
+FONT_SIZE = 10
+HEADER_FONT_SIZE = 12
+ROW_HEIGHTS = {SECTION: 20, SUBSECTION: 15, DATA: None}
+
+_font_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def fonts():
+    """
+    Registers DejaVuSans (Cyrillic support) once per process and returns the
+    (regular, bold) font names, falling back to Helvetica when it is missing.
+    """
+    with _font_lock:
+        try:
+            pdfmetrics.registerFont(TTFont('DejaVuSans', str(settings.BASE_DIR / 'static' / 'fonts' / 'DejaVuSans.ttf')))
+        except Exception:
+            # Fallback to Helvetica if the font file is missing (Cyrillic won't work)
+            return 'Helvetica', 'Helvetica-Bold'
+        return 'DejaVuSans', 'DejaVuSans'
+
+
+@lru_cache(maxsize=None)
+def paragraph_styles():
+    regular, bold = fonts()
+    return {
+        'title': ParagraphStyle(name='Title', fontName=bold, fontSize=16, alignment=1, spaceAfter=12),
+        'normal': ParagraphStyle(name='Normal', fontName=regular, fontSize=12, alignment=1, spaceAfter=6),
+        'cell': ParagraphStyle(name='Cell', fontName=regular, fontSize=FONT_SIZE, leading=FONT_SIZE * 1.2),
+    }
+
+
+@lru_cache(maxsize=None)
+def _base_table_style():
+    regular, bold = fonts()
+    return (
+        ('FONT', (0, 0), (-1, -1), regular),
+        ('FONTSIZE', (0, 0), (-1, -1), FONT_SIZE),
+        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+        ('ALIGN', (0, 1), (0, -1), 'LEFT'),
+        ('ALIGN', (1, 1), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('FONTNAME', (0, 0), (-1, 0), bold),
+        ('FONTSIZE', (0, 0), (-1, 0), HEADER_FONT_SIZE),
+    )
+
+
+def _row_style(kind, index):
+    regular, bold = fonts()
+    if kind == SECTION:
+        return [
+            ('SPAN', (0, index), (-1, index)),
+            ('ALIGN', (0, index), (-1, index), 'CENTER'),
+            ('BACKGROUND', (0, index), (-1, index), colors.lightgrey),
+            ('FONTNAME', (0, index), (-1, index), bold),
+            ('FONTSIZE', (0, index), (-1, index), HEADER_FONT_SIZE),
+        ]
+    if kind == SUBSECTION:
+        return [
+            ('SPAN', (0, index), (-1, index)),
+            ('ALIGN', (0, index), (-1, index), 'CENTER'),
+            ('BACKGROUND', (0, index), (-1, index), colors.whitesmoke),
+        ]
+    return []
+
+
+def _wrap(text, width):
+    """Wraps text in a Paragraph only when it does not fit the column on one line."""
+    regular, _ = fonts()
+    if pdfmetrics.stringWidth(text, regular, FONT_SIZE) <= width - CELL_PADDING:
+        return text
+    return Paragraph(escape(text), paragraph_styles()['cell'])
+
+
+def build_tables(header, rows, col_widths, wrap_columns=(0,), chunk_rows=CHUNK_ROWS):
+    """
+    Yields Table flowables for ``rows`` (an iterable of (kind, cells) pairs),
+    ``chunk_rows`` rows at a time, each starting with ``header`` and allowed to
+    split across pages with the header repeated.
+    """
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_rows:
+            yield _build_table(header, chunk, col_widths, wrap_columns)
+            chunk = []
+    if chunk:
+        yield _build_table(header, chunk, col_widths, wrap_columns)
+
+
+def _build_table(header, rows, col_widths, wrap_columns):
+    data = [header]
+    heights = [None]
+    style = list(_base_table_style())
+    for index, (kind, cells) in enumerate(rows, start=1):
+        if kind == DATA:
+            cells = [_wrap(cell, col_widths[column]) if column in wrap_columns and cell else cell
+                     for column, cell in enumerate(cells)]
+        else:
+            cells = list(cells) + [''] * (len(header) - len(cells))
+        data.append(cells)
+        heights.append(ROW_HEIGHTS[kind])
+        style.extend(_row_style(kind, index))
+    return Table(data, colWidths=col_widths, rowHeights=heights, style=TableStyle(style), repeatRows=1)
+
+
+def render_table_document(output, title, lines, header, rows, col_widths, footer_lines=(), wrap_columns=(0,)):
+    """Writes an A4 document with a title block, a chunked table and footer lines into ``output``."""
+    styles = paragraph_styles()
+    doc = SimpleDocTemplate(output, pagesize=A4, rightMargin=inch, leftMargin=inch, topMargin=inch, bottomMargin=inch)
+    story = [Paragraph(escape(title), styles['title'])]
+    story.extend(Paragraph(escape(line), styles['normal']) for line in lines)
+    story.extend(build_tables(header, rows, col_widths, wrap_columns))
+    story.extend(Paragraph(escape(line), styles['normal']) for line in footer_lines)
+    doc.build(story)
+
+
+TRANSCRIPT_HEADER = ["Дисципліна", "Кредити", "Години", "Оцінка", "Бали"]
+TRANSCRIPT_COL_WIDTHS = [180, 50, 50, 70, 70]
+
+
+def transcript_rows(report):
+    """Table rows of a grade report, newest academic year first."""
+    for academic_year, semester_groups in report.grouped(newest_first=True, keep_empty=True):
+        for semester, type_groups in semester_groups:
+            yield SECTION, [f"{semester} семестр {academic_year}"]
+            if not type_groups:
+                yield DATA, ["(немає даних)", "", "", "", ""]
+            for exam_type, grades in type_groups:
+                yield SUBSECTION, ["Іспити" if exam_type == 'exam' else "Заліки"]
+                for grade in grades:
+                    yield DATA, [
+                        grade.discipline_name,
+                        str(grade.credits) if grade.credits else "-",
+                        str(grade.hours) if grade.hours else "-",
+                        grade.national_grade,
+                        f"{grade.grade_value:.2f}",
+                    ]
+
+
+def render_transcript(student, report, output):
+    """Writes the PDF transcript of a student's grade report into ``output``."""
+    render_table_document(
+        output,
+        title=f"Оцінки студента: {student.full_name}",
+        lines=[f"Факультет: {student.faculty.name}", f"Група: {student.group.name}"],
+        header=TRANSCRIPT_HEADER,
+        rows=transcript_rows(report),
+        col_widths=TRANSCRIPT_COL_WIDTHS,
+        footer_lines=[f"Середній бал: {report.average}"],
+    )
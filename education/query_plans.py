@@ -0,0 +1,74 @@
+"""
+Query plan checks for the hot grade access paths.
+
+Each hot query is built with the same ORM code the views use and run through
+EXPLAIN on the current database. A plan that reads a whole table (or a whole
+index) instead of searching one is reported as a full scan. SQLite and
+PostgreSQL plans are understood; on PostgreSQL sequential scans are disabled
+for the check so that small test tables do not hide a missing index.
+"""
+import re
+
+from django.db import connection, transaction
+from django.db.models import Max, Min
+
+from .gradebook import sheet_students
+from .models import Course, Exam, Grade, Group, Student, StudentGradeSummary
+from .reports import GradeFilters, grade_rows, stats_grades
+
+FULL_SCAN_PATTERNS = {
+    # Also matches "SCAN t USING COVERING INDEX i", a walk over a whole index
+    'sqlite': re.compile(r'\bSCAN (?!CONSTANT ROW)(\w+)'),
+    'postgresql': re.compile(r'\bSeq Scan on (\S+)'),
+}
+
+# Any id works: EXPLAIN only needs the shape of the query
+SAMPLE_ID = 1
+SAMPLE_STUDENT = Student(pk=SAMPLE_ID, study_year='2024-2025')
+
+
+def hot_queries():
+    """(name, queryset) pairs of the queries behind the grade pages."""
+    return [
+        ('student grade report', grade_rows(SAMPLE_STUDENT, GradeFilters())),
+        ('student grade report filtered', grade_rows(SAMPLE_STUDENT, GradeFilters(course_min=2, course_max=2, semester_2=False,
+                                                                                  type_exam=False, sort_type='desc'))),
+        ('student grade statistics', stats_grades(SAMPLE_STUDENT, GradeFilters()).values('id', 'grade_value')),
+        ('student grade summary', StudentGradeSummary.objects
+         .filter(student_id=SAMPLE_ID)
+         .select_related('highest_grade__exam__course__discipline', 'lowest_grade__exam__course__discipline')),
+        ('summary recompute', Grade.objects
+         .filter(student_id__in=[SAMPLE_ID])
+         .values('student_id')
+         .annotate(highest_value=Max('grade_value'), lowest_value=Min('grade_value'))
+         .order_by()),
+        ('lecturer courses', Course.objects.filter(teacher_id=SAMPLE_ID).select_related('discipline')),
+        ('lecturer course lookup', Course.objects.filter(teacher_id=SAMPLE_ID, discipline_id=SAMPLE_ID)),
+        ('lecturer groups', Group.objects
+         .filter(faculty_id__in=Course.objects.filter(teacher_id=SAMPLE_ID).values('discipline__faculty_id'))
+         .only('id', 'name')),
+        ('course exam', Exam.objects.filter(course_id=SAMPLE_ID).values_list('type', flat=True)),
+        ('grade sheet students', sheet_students(SAMPLE_ID, SAMPLE_ID, SAMPLE_ID, SAMPLE_ID)),
+        ('group roster', Student.objects.filter(group_id=SAMPLE_ID, is_deleted=False).only('id', 'full_name')),
+        ('grade sheet existing grades', Grade.objects
+         .filter(exam_id=SAMPLE_ID, student_id__in=[SAMPLE_ID])
+         .only('id', 'student_id', 'exam_id', 'teacher_id', 'grade_value')),
+    ]
+
+
+def full_scans(queries=None):
+    """
+    Yields (name, table, plan) for every hot query whose plan scans a whole
+    table. Raises NotImplementedError for databases whose plans are not understood.
+    """
+    pattern = FULL_SCAN_PATTERNS.get(connection.vendor)
+    if pattern is None:
+        raise NotImplementedError(f"Query plans of {connection.vendor} databases are not supported.")
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        for name, queryset in queries or hot_queries():
+            plan = queryset.explain()
+            for table in pattern.findall(plan):
+                yield name, table, plan
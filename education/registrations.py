@@ -0,0 +1,153 @@
+"""
+Bulk decisions on pending registrations.
+
+Approving a registration activates its user, records who approved it on the
+user's Student or Teacher row and marks the registration approved. Rather
+than saving each object, pending registrations are taken in primary key
+order, ``chunk_size`` at a time, and every chunk is decided by one UPDATE per
+table inside one transaction: an error rolls the whole chunk back, so no
+account is left half approved and a rerun picks up where the last committed
+chunk ended.
+
+Rules approve the registrations that match all of their conditions
+(faculty, group, email domain); ``REGISTRATION_AUTO_APPROVE_RULES`` holds the
+rules applied by ``approve_registrations --auto``.
+
+With sharding, every shard's registrations are decided in turn. The users
+activated on ``default`` are then copied to the shards, so each chunk's
+transaction spans all of them.
+"""
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ApplicationUser, PendingRegistration, Student, Teacher
+from .sharding import atomic_on_all_shards, fan_out, replicate, use_shard
+
+PENDING, APPROVED, REJECTED = 'Pending', 'Approved', 'Rejected'
+CHUNK_SIZE = 1000
+# Recorded as the approver of rule-based approvals
+SYSTEM = 'System'
+
+
+class ApprovalRule:
+    """Conditions a pending registration must all meet to be approved automatically."""
+
+    NAMES = ('faculty', 'group', 'email_domain')
+
+    def __init__(self, faculty=None, group=None, email_domain=None):
+        if faculty is None and group is None and not email_domain:
+            raise ValueError("An approval rule needs at least one condition.")
+        self.faculty = faculty
+        self.group = group
+        self.email_domain = email_domain.lstrip('@').lower() if email_domain else None
+
+    @classmethod
+    def parse(cls, text):
+        """A rule written as comma-separated ``name=value`` conditions, e.g. ``faculty=3,email_domain=knu.ua``."""
+        values = {}
+        for condition in text.split(','):
+            name, _, value = condition.partition('=')
+            name, value = name.strip(), value.strip()
+            if name not in cls.NAMES or not value:
+                raise ValueError(f"Invalid approval rule condition {condition.strip()!r}.")
+            if name != 'email_domain':
+                if not value.isdigit():
+                    raise ValueError(f"{name} must be a number")
+                value = int(value)
+            values[name] = value
+        return cls(**values)
+
+    def filter(self, registrations):
+        if self.faculty is not None:
+            registrations = registrations.filter(requested_faculty_id=self.faculty)
+        if self.group is not None:
+            registrations = registrations.filter(requested_group_id=self.group)
+        if self.email_domain:
+            registrations = registrations.filter(user__email__iendswith=f'@{self.email_domain}')
+        return registrations
+
+    def __str__(self):
+        return ','.join(f'{name}={getattr(self, name)}' for name in self.NAMES if getattr(self, name) is not None)
+
+
+def configured_rules():
+    """The ``REGISTRATION_AUTO_APPROVE_RULES`` setting, one rule per ``;``-separated entry."""
+    return [ApprovalRule.parse(rule) for rule in settings.REGISTRATION_AUTO_APPROVE_RULES.split(';') if rule.strip()]
+
+
+class DecisionResult:
+    """Registrations approved and rejected by a run, and how long it took."""
+
+    def __init__(self):
+        self.approved = 0
+        self.rejected = 0
+        self.seconds = 0.0
+
+    @property
+    def decided(self):
+        return self.approved + self.rejected
+
+    @property
+    def per_second(self):
+        return self.decided / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (f"{self.approved} approved, {self.rejected} rejected in {self.seconds:.2f} s "
+                f"({self.per_second:.0f} registrations/s)")
+
+
+def _decide_chunk(rows, status, decided_by):
+    registration_ids = [pk for pk, _ in rows]
+    user_ids = [user_id for _, user_id in rows]
+    now = timezone.now()
+    PendingRegistration.objects.filter(pk__in=registration_ids).update(status=status)
+    if status == APPROVED:
+        ApplicationUser.objects.filter(pk__in=user_ids).update(is_active=True, updated_at=now)
+        replicate(ApplicationUser, user_ids)
+        for model in (Student, Teacher):
+            model.objects.filter(user_id__in=user_ids).update(created_by_admin_id=decided_by, updated_at=now)
+
+
+def decide(registrations, status, decided_by, chunk_size=CHUNK_SIZE, result=None):
+    """
+    Sets ``status`` (APPROVED or REJECTED) on the pending registrations of
+    the ``registrations`` queryset and returns the DecisionResult.
+    ``decided_by`` is recorded on approved students and teachers.
+    """
+    if status not in (APPROVED, REJECTED):
+        raise ValueError(f"Unknown registration decision {status!r}.")
+    if result is None:
+        result = DecisionResult()
+    decided_by = decided_by[:Student._meta.get_field('created_by_admin_id').max_length]
+    started = time.perf_counter()
+    for pending in fan_out(registrations.filter(status=PENDING).order_by('pk')):
+        last_pk = 0
+        with use_shard(pending.db):
+            while True:
+                # The users are activated on default and their copies on the other shards, so
+                # all of them take part in the chunk's transaction
+                with atomic_on_all_shards():
+                    # Read inside the transaction, so rows decided meanwhile by another run are skipped
+                    rows = list(pending.select_for_update(of=('self',)).filter(pk__gt=last_pk)
+                                .values_list('pk', 'user_id')[:chunk_size])
+                    if not rows:
+                        break
+                    _decide_chunk(rows, status, decided_by)
+                last_pk = rows[-1][0]
+                if status == APPROVED:
+                    result.approved += len(rows)
+                else:
+                    result.rejected += len(rows)
+    result.seconds += time.perf_counter() - started
+    return result
+
+
+def auto_approve(rules, registrations=None, chunk_size=CHUNK_SIZE):
+    """Approves the pending registrations matching any of ``rules``, as the system."""
+    registrations = PendingRegistration.objects.all() if registrations is None else registrations
+    result = DecisionResult()
+    for rule in rules:
+        decide(rule.filter(registrations), APPROVED, SYSTEM, chunk_size, result)
+    return result
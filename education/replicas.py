@@ -0,0 +1,138 @@
+"""
+Read-replica routing for the student-facing read views.
+
+With ``DATABASE_REPLICA_URL`` set, the ``replica`` alias holds a read-only
+copy of the primary database. Views wrapped in ``replica_reads`` read from
+it; everything else, including authentication and sessions, stays on the
+primary. Reads return to the primary for the rest of a request once it has
+written anything (read-your-writes). After a request that writes, the user
+gets a cookie that keeps their reads on the primary for
+``DATABASE_REPLICA_LAG_SECONDS``, so they still see their own writes while
+the replica catches up.
+"""
+import contextvars
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICA = 'replica'
+PIN_COOKIE = 'db_primary_until'
+
+_state = contextvars.ContextVar('replica_routing', default=None)
+
+
+class RoutingState:
+    """Database routing state of one request."""
+
+    def __init__(self, pinned=False):
+        # The user wrote recently, so the replica may not have their writes yet
+        self.pinned = pinned
+        # Inside a view wrapped in replica_reads
+        self.replica_reads = False
+        self.wrote = False
+
+    @property
+    def use_replica(self):
+        return self.replica_reads and not self.pinned and not self.wrote
+
+
+def replica_configured():
+    return REPLICA in settings.DATABASES
+
+
+def reading_replica():
+    """Whether the current request's reads go to the replica."""
+    state = _state.get()
+    return state is not None and state.use_replica
+
+
+def reads_from(alias):
+    """
+    Where a read that other routing sent to ``alias`` goes: the replica when
+    ``alias`` is the primary and the current request may read from it.
+    """
+    if alias == DEFAULT_DB_ALIAS and reading_replica():
+        return REPLICA
+    return alias
+
+
+def primary_of(alias):
+    """The alias objects read from ``alias`` are written back to."""
+    return DEFAULT_DB_ALIAS if alias == REPLICA else alias
+
+
+def note_write():
+    """Records that the current request wrote, so its reads return to the primary."""
+    state = _state.get()
+    if state is not None:
+        state.wrote = True
+
+
+class ReplicaRouter:
+    """Sends the reads of replica_reads views to the replica and every write to the primary."""
+
+    def db_for_read(self, model, **hints):
+        alias = reads_from(DEFAULT_DB_ALIAS)
+        return alias if alias == REPLICA else None
+
+    def db_for_write(self, model, **hints):
+        note_write()
+        # Also for objects read from the replica, which Django would otherwise save back to it
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # The replica gets its schema from the primary
+        return db != REPLICA
+
+
+def replica_reads(view):
+    """Lets the view's own queries read from the replica (decorate inside the auth decorators)."""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        state = _state.get()
+        if state is None:
+            return view(request, *args, **kwargs)
+        state.replica_reads = True
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            state.replica_reads = False
+
+    return wrapper
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Tracks the routing state of each request and pins users who wrote to the
+    primary; removes itself from the chain when no replica is configured.
+    """
+
+    def __init__(self, get_response):
+        if not replica_configured():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            pinned = float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        state = RoutingState(pinned)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote and settings.DATABASE_REPLICA_LAG_SECONDS > 0:
+            lag = settings.DATABASE_REPLICA_LAG_SECONDS
+            response.set_cookie(PIN_COOKIE, f'{time.time() + lag:.3f}', max_age=lag, httponly=True,
+                                samesite='Lax', secure=request.is_secure())
+        return response
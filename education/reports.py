@@ -0,0 +1,289 @@
+"""
+Grade report pipeline shared by the student grade page and the PDF export.
+
+The rows of a report are loaded with a single joined query into compact row
+tuples. Grade range, study year (via the persisted ``Exam.academic_year``),
+semester, exam type and sort order are all applied in SQL, so only the shown
+rows are read; grouping and statistics are then done in one pass over them.
+Statistics ignore the semester/type view filters, so when those hide rows
+the statistics come from a separate aggregate query instead.
+"""
+from collections import defaultdict, namedtuple
+from decimal import Decimal
+
+from django.db.models import Count, Q, Sum
+from django.utils.functional import SimpleLazyObject
+
+from .models import Grade, academic_start_year
+
+SORT_TYPES = ('seq', 'asc', 'desc')
+SEMESTER_NAMES = {1: 'I', 2: 'II'}
+
+
+def format_academic_year(start_year):
+    return f"{start_year}-{str(start_year + 1)[-2:]}"
+
+
+def national_grade(grade_value, exam_type):
+    """National scale mark shown next to the 100-point grade."""
+    if exam_type == 'credit':
+        return "Зарахов."
+    if 90 <= grade_value <= 100:
+        return "5"
+    if 75 <= grade_value <= 89:
+        return "4"
+    if 60 <= grade_value <= 74:
+        return "3"
+    return f"{grade_value:.2f}"
+
+
+_ROW_FIELDS = (
+    'id',
+    'grade_value',
+    'exam__date',
+    'exam__type',
+    'exam__course__semester',
+    'exam__course__discipline__name',
+    'exam__course__discipline__hours',
+    'exam__academic_year',
+)
+
+
+class GradeRow(namedtuple('GradeRow', ['id', 'grade_value', 'exam_date', 'exam_type', 'semester',
+                                       'discipline_name', 'hours', 'academic_year'])):
+    __slots__ = ()
+
+    @property
+    def credits(self):
+        return int(self.hours / 30) if self.hours else 0
+
+    @property
+    def semester_name(self):
+        return SEMESTER_NAMES.get(self.semester, 'II')
+
+    @property
+    def national_grade(self):
+        return national_grade(self.grade_value, self.exam_type)
+
+
+def _int_param(data, name, default):
+    try:
+        return int(data.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class GradeFilters:
+    """Filter and sort options of the student grade page."""
+
+    def __init__(self, grade_min=60, grade_max=100, course_min=1, course_max=6,
+                 semester_1=True, semester_2=True, type_exam=True, type_credit=True, sort_type='seq'):
+        # No checkbox ticked means "no filter", same as all of them ticked
+        if not semester_1 and not semester_2:
+            semester_1 = semester_2 = True
+        if not type_exam and not type_credit:
+            type_exam = type_credit = True
+        self.grade_min = grade_min
+        self.grade_max = grade_max
+        self.course_min = course_min
+        self.course_max = course_max
+        self.semester_1 = semester_1
+        self.semester_2 = semester_2
+        self.type_exam = type_exam
+        self.type_credit = type_credit
+        self.sort_type = sort_type if sort_type in SORT_TYPES else 'seq'
+
+    @classmethod
+    def from_data(cls, data):
+        """Build filters from request GET/POST data."""
+        return cls(
+            grade_min=_int_param(data, 'grade_min', 60),
+            grade_max=_int_param(data, 'grade_max', 100),
+            course_min=_int_param(data, 'course_min', 1),
+            course_max=_int_param(data, 'course_max', 6),
+            semester_1=data.get('semester_1') == 'on',
+            semester_2=data.get('semester_2') == 'on',
+            type_exam=data.get('type_exam') == 'on',
+            type_credit=data.get('type_credit') == 'on',
+            sort_type=data.get('sort_type', 'seq'),
+        )
+
+    def key(self):
+        """Normalized, hashable representation of the filter set."""
+        return (self.grade_min, self.grade_max, self.course_min, self.course_max,
+                self.semester_1, self.semester_2, self.type_exam, self.type_credit, self.sort_type)
+
+    def cache_key(self):
+        """Short string form of ``key()`` for cache keys and DB lookups."""
+        return '-'.join(str(int(part)) if isinstance(part, bool) else str(part) for part in self.key())
+
+    @property
+    def hides_rows(self):
+        """Whether the semester/type filters hide rows that still count towards the statistics."""
+        return not (self.semester_1 and self.semester_2 and self.type_exam and self.type_credit)
+
+    def order_by(self):
+        """ORDER BY of the report rows: grouped by year, semester and type, then by the chosen sort."""
+        if self.sort_type == 'asc':
+            order = ['grade_value']
+        elif self.sort_type == 'desc':
+            order = ['-grade_value']
+        else:
+            order = ['exam__date', 'exam__course__discipline__name']
+        return ['exam__academic_year', 'exam__course__semester', 'exam__type', *order, 'id']
+
+    def context(self):
+        return {
+            'grade_min': self.grade_min,
+            'grade_max': self.grade_max,
+            'course_min': self.course_min,
+            'course_max': self.course_max,
+            'semester_1': self.semester_1,
+            'semester_2': self.semester_2,
+            'type_exam': self.type_exam,
+            'type_credit': self.type_credit,
+            'sort_type': self.sort_type,
+        }
+
+
+class GradeReport:
+    """Filtered, grouped and sorted grades of one student plus their statistics."""
+
+    def __init__(self, student, filters):
+        self.student = student
+        self.filters = filters
+        self.total = 0
+        self.exams = 0
+        self.credits = 0
+        self._highest = None
+        self._lowest = None
+        self._sum = Decimal(0)
+        # Set when the statistics come from an aggregate instead of the added rows
+        self._stats_rows = None
+        # academic year -> semester name -> exam type -> rows, in insertion order
+        self._by_year = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
+
+    @property
+    def average(self):
+        return round(self._sum / self.total) if self.total else 0
+
+    @property
+    def highest(self):
+        if self._highest is None and self._stats_rows is not None and self.total:
+            self._highest = _first_row(self._stats_rows.order_by('-grade_value', 'id'))
+        return self._highest
+
+    @property
+    def lowest(self):
+        if self._lowest is None and self._stats_rows is not None and self.total:
+            self._lowest = _first_row(self._stats_rows.order_by('grade_value', 'id'))
+        return self._lowest
+
+    def _add_to_stats(self, row):
+        self.total += 1
+        self._sum += row.grade_value
+        if row.exam_type == 'exam':
+            self.exams += 1
+        elif row.exam_type == 'credit':
+            self.credits += 1
+        # Ties resolve to the lowest id, like ``.filter(grade_value=...).first()``
+        if (self._highest is None or row.grade_value > self._highest.grade_value
+                or (row.grade_value == self._highest.grade_value and row.id < self._highest.id)):
+            self._highest = row
+        if (self._lowest is None or row.grade_value < self._lowest.grade_value
+                or (row.grade_value == self._lowest.grade_value and row.id < self._lowest.id)):
+            self._lowest = row
+
+    def add(self, row):
+        """Adds a row; rows must arrive in display order."""
+        if self._stats_rows is None:
+            self._add_to_stats(row)
+        self._by_year[row.academic_year][row.semester_name][row.exam_type].append(row)
+
+    def load_stats(self, rows):
+        """Takes the statistics from an aggregate over ``rows``; highest/lowest are fetched on access."""
+        self._stats_rows = rows
+        stats = rows.aggregate(
+            total=Count('id'),
+            grade_sum=Sum('grade_value'),
+            exams=Count('id', filter=Q(exam__type='exam')),
+            credits=Count('id', filter=Q(exam__type='credit')),
+        )
+        self.total = stats['total']
+        self._sum = stats['grade_sum'] or Decimal(0)
+        self.exams = stats['exams']
+        self.credits = stats['credits']
+
+    def grouped(self, newest_first=False, keep_empty=False):
+        """
+        Returns [(academic_year, [(semester, [(exam_type, rows), ...]), ...]), ...].
+        Semesters whose grades were all filtered out by type are kept with an
+        empty type list when ``keep_empty`` is set.
+        """
+        result = []
+        for academic_year in sorted(self._by_year, reverse=newest_first):
+            semesters = self._by_year[academic_year]
+            semester_list = []
+            for semester in sorted(semesters, key=lambda name: {'I': 1, 'II': 2}[name]):
+                type_list = [(exam_type, rows) for exam_type, rows in semesters[semester].items() if rows]
+                if type_list or keep_empty:
+                    semester_list.append((semester, type_list))
+            if semester_list:
+                result.append((academic_year, semester_list))
+        return result
+
+    def stats_context(self):
+        return {
+            'average_grade': self.average,
+            # Only queried if used when the statistics come from an aggregate
+            'highest_grade_exam': SimpleLazyObject(lambda: self.highest),
+            'lowest_grade_exam': SimpleLazyObject(lambda: self.lowest),
+            'total_disciplines': self.total,
+            'exams': self.exams,
+            'credits': self.credits,
+        }
+
+
+def student_start_year(student):
+    return int(student.study_year.split('-')[0])
+
+
+def _grade_row(values):
+    return GradeRow(*values[:-1], format_academic_year(values[-1]))
+
+
+def _first_row(rows):
+    values = rows.values_list(*_ROW_FIELDS).first()
+    return _grade_row(values) if values else None
+
+
+def stats_grades(student, filters):
+    """The student's grades counted by the statistics: grade range and study-year range."""
+    start_year = student_start_year(student)
+    return Grade.objects.filter(
+        student=student,
+        grade_value__gte=filters.grade_min,
+        grade_value__lte=filters.grade_max,
+        exam__academic_year__gte=start_year + filters.course_min - 1,
+        exam__academic_year__lte=start_year + filters.course_max - 1,
+    )
+
+
+def grade_rows(student, filters):
+    """Row values of the grades shown in the report, in display order."""
+    grades = stats_grades(student, filters)
+    if filters.semester_1 != filters.semester_2:
+        grades = grades.filter(exam__course__semester=1) if filters.semester_1 else grades.exclude(exam__course__semester=1)
+    if filters.type_exam != filters.type_credit:
+        grades = grades.filter(exam__type='exam') if filters.type_exam else grades.exclude(exam__type='exam')
+    return grades.order_by(*filters.order_by()).values_list(*_ROW_FIELDS)
+
+
+def build_grade_report(student, filters):
+    """Loads the shown grades in one query (plus one aggregate when view filters hide rows)."""
+    report = GradeReport(student, filters)
+    if filters.hides_rows:
+        report.load_stats(stats_grades(student, filters))
+    for values in grade_rows(student, filters):
+        report.add(_grade_row(values))
+    return report
@@ -0,0 +1,199 @@
+"""
+Bulk provisioning of student accounts from a CSV roster.
+
+Rows of ``full_name,email,faculty,group`` (plus optional ``username`` and
+``study_year`` columns) are read one at a time, so rosters of any size are
+provisioned in constant memory. Faculties are given by id or name and groups
+by id or name within the faculty; both are resolved through maps loaded with
+one query each. Every student gets a random password. Hashing it is by far
+the slowest step (PBKDF2 is deliberately expensive), so the passwords of a
+chunk are hashed across a process pool before the chunk's users and students
+are inserted with ``bulk_create`` in one transaction. Invalid and duplicate
+rows are skipped and reported with their line number.
+"""
+import csv
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.db.models import Q
+from django.utils.crypto import get_random_string
+
+from .models import ApplicationUser, Faculty, Group, Student
+from .sharding import atomic_on_all_shards, fan_out, replicate, shard_for_faculty
+
+COLUMNS = ('full_name', 'email', 'faculty', 'group')
+CREDENTIAL_COLUMNS = ('username', 'email', 'full_name', 'faculty', 'group', 'password')
+CHUNK_SIZE = 1000
+PASSWORD_LENGTH = 12
+# No look-alike characters (0/O, 1/l/I) in generated passwords
+PASSWORD_CHARS = 'abcdefghjkmnpqrstuvwxyzABCDEFGHJKLMNPQRSTUVWXYZ23456789'
+CREATED_BY = 'roster'
+
+
+class RosterEntry:
+    """A validated roster row and the password generated for it."""
+
+    def __init__(self, line, username, email, full_name, faculty, group, study_year):
+        self.line = line
+        self.username = username
+        self.email = email
+        self.full_name = full_name
+        self.faculty = faculty
+        self.group = group
+        self.study_year = study_year
+        self.password = get_random_string(PASSWORD_LENGTH, PASSWORD_CHARS)
+
+    def credentials(self):
+        return [self.username, self.email, self.full_name, self.faculty.name, self.group.name, self.password]
+
+
+class ProvisionResult:
+    """Row counts of a provisioning run and the (line, message) errors of its rejected rows."""
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.errors = []
+
+
+def hash_passwords(passwords, executor=None, workers=1):
+    """Encoded ``passwords``, in order; hashed across the ``workers`` processes of ``executor`` when given."""
+    if executor is None:
+        return [make_password(password) for password in passwords]
+    # make_password itself is mapped, so worker processes never import the app's models
+    return list(executor.map(make_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+
+class RosterProvisioner:
+    """
+    Creates active student accounts. ``workers`` processes hash the
+    passwords (default: one per CPU; with one they are hashed in this
+    process); ``study_year`` is used for rows that do not give their own.
+    """
+
+    def __init__(self, workers=None, chunk_size=CHUNK_SIZE, study_year=None, created_by=CREATED_BY):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.study_year = study_year or Student._meta.get_field('study_year').default
+        self.created_by = created_by
+        self.faculties = {}
+        for faculty in Faculty.objects.order_by('-id'):
+            self.faculties[str(faculty.pk)] = faculty
+            self.faculties[faculty.name.strip().lower()] = faculty
+        faculties_by_id = {faculty.pk: faculty for faculty in self.faculties.values()}
+        self.groups = {}
+        # Ordered so that the first of two same-named groups of a faculty wins
+        for groups in fan_out(Group.objects.order_by('-id')):
+            for group in groups:
+                group.faculty = faculties_by_id[group.faculty_id]
+                self.groups[group.faculty_id, str(group.pk)] = group
+                self.groups[group.faculty_id, group.name.strip().lower()] = group
+        # Usernames and emails taken by earlier rows of the roster
+        self.seen = set()
+
+    def parse_row(self, line, row):
+        """A RosterEntry of a CSV row, raising ValueError for invalid or repeated rows."""
+        full_name = (row.get('full_name') or '').strip()
+        if not full_name:
+            raise ValueError("Full name is required.")
+        email = (row.get('email') or '').strip().lower()
+        if '@' not in email:
+            raise ValueError(f"Invalid email {email!r}.")
+        # Students sign in with their email unless the roster gives a username
+        username = (row.get('username') or '').strip() or email
+        faculty_name = (row.get('faculty') or '').strip()
+        faculty = self.faculties.get(faculty_name.lower())
+        if faculty is None:
+            raise ValueError(f"Unknown faculty {faculty_name!r}.")
+        group_name = (row.get('group') or '').strip()
+        group = self.groups.get((faculty.pk, group_name.lower()))
+        if group is None:
+            raise ValueError(f"Faculty {faculty.name!r} has no group {group_name!r}.")
+        for key in (('email', email), ('username', username.lower())):
+            if key in self.seen:
+                raise ValueError(f"Duplicate {key[0]} {key[1]!r} in the roster.")
+        self.seen.update((('email', email), ('username', username.lower())))
+        study_year = (row.get('study_year') or '').strip() or self.study_year
+        return RosterEntry(line, username, email, full_name, faculty, group, study_year)
+
+    def run(self, lines, credentials=None):
+        """
+        Provisions the students of CSV text (a file opened with ``newline=''``
+        or any iterable of lines) and returns a ProvisionResult. The
+        credentials of every created student are written to the
+        ``credentials`` csv writer once their chunk is committed. Raises
+        ValueError when the header lacks a column.
+        """
+        reader = csv.DictReader(lines)
+        missing = [column for column in COLUMNS if column not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"Missing CSV columns: {', '.join(missing)}.")
+        result = ProvisionResult()
+        executor = ProcessPoolExecutor(self.workers) if self.workers != 1 else None
+        try:
+            chunk = []
+            for row in reader:
+                result.rows += 1
+                try:
+                    chunk.append(self.parse_row(reader.line_num, row))
+                except ValueError as error:
+                    result.errors.append((reader.line_num, str(error)))
+                    continue
+                if len(chunk) >= self.chunk_size:
+                    self.save(chunk, result, executor, credentials)
+                    chunk = []
+            self.save(chunk, result, executor, credentials)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        # Rows rejected while saving a chunk were added after its later invalid rows; list all by line
+        result.errors.sort()
+        return result
+
+    def taken(self, chunk):
+        """Lowercased usernames and emails of ``chunk`` that already belong to an account."""
+        usernames = [entry.username for entry in chunk]
+        emails = [entry.email for entry in chunk]
+        taken = set()
+        for username, email in (ApplicationUser.objects
+                                .filter(Q(username__in=usernames) | Q(email__in=emails))
+                                .values_list('username', 'email')):
+            taken.update((username.lower(), email.lower()))
+        for students in fan_out(Student.objects.filter(email__in=emails).values_list('email', flat=True)):
+            taken.update(email.lower() for email in students)
+        return taken
+
+    def save(self, chunk, result, executor, credentials):
+        if not chunk:
+            return
+        taken = self.taken(chunk)
+        entries = []
+        for entry in chunk:
+            if entry.username.lower() in taken or entry.email in taken:
+                result.errors.append((entry.line, f"An account with username {entry.username!r} "
+                                                  f"or email {entry.email!r} already exists."))
+            else:
+                entries.append(entry)
+        passwords = hash_passwords([entry.password for entry in entries], executor, self.workers)
+        # The users on default and their students on the shards are created together or not at all
+        with atomic_on_all_shards():
+            users = ApplicationUser.objects.bulk_create([
+                ApplicationUser(username=entry.username, email=entry.email, full_name=entry.full_name,
+                                password=password)
+                for entry, password in zip(entries, passwords)
+            ])
+            # bulk_create sends no signals, and the students' shards need the users
+            replicate(ApplicationUser, objs=users)
+            shards = defaultdict(list)
+            for entry, user in zip(entries, users):
+                shards[shard_for_faculty(entry.faculty.pk)].append(Student(
+                    user=user, full_name=entry.full_name, email=entry.email, faculty=entry.faculty,
+                    group=entry.group, study_year=entry.study_year, created_by_admin_id=self.created_by,
+                ))
+            for alias, students in shards.items():
+                Student.objects.using(alias).bulk_create(students)
+        result.created += len(entries)
+        if credentials is not None:
+            credentials.writerows(entry.credentials() for entry in entries)
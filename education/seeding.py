@@ -0,0 +1,122 @@
+"""
+Deterministic synthetic university data for benchmarks.
+
+Every faculty gets its groups, students, teachers and one discipline, course
+and exam per grade slot; each student is graded in every exam of their
+faculty. All rows are written with chunked bulk inserts and the same random
+seed always produces the same data. Seeded users share one password, hashed
+once.
+"""
+import random
+from datetime import datetime
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    ApplicationUser, Course, Discipline, Exam, Faculty, Grade, Group, Student, Teacher, academic_start_year,
+)
+
+USERNAME_PREFIX = 'seed_'
+FIRST_STUDY_YEAR = 2020
+STUDY_YEARS = 6
+
+
+class SeedResult:
+    """Number of rows created per model."""
+
+    def __init__(self):
+        self.counts = {}
+
+    def add(self, model, count):
+        self.counts[model.__name__] = self.counts.get(model.__name__, 0) + count
+
+
+def exam_date(slot):
+    """Exam date of a grade slot: slots cycle through semesters of the six study years."""
+    year = FIRST_STUDY_YEAR + (slot // 2) % STUDY_YEARS
+    if slot % 2 == 0:
+        return timezone.make_aware(datetime(year, 12, 20, 10, 0))
+    return timezone.make_aware(datetime(year + 1, 5, 20, 10, 0))
+
+
+def _bulk_create(model, objs, batch_size, result):
+    created = model.objects.bulk_create(objs, batch_size=batch_size)
+    result.add(model, len(created))
+    return created
+
+
+def seed_university(faculties=10, groups_per_faculty=20, students_per_group=100, teachers_per_faculty=10,
+                    grades_per_student=60, seed=42, password='seed-password', batch_size=5000):
+    """Creates the synthetic university in one transaction and returns a ``SeedResult``."""
+    rng = random.Random(seed)
+    result = SeedResult()
+    encoded_password = make_password(password)
+
+    def users(kind, count, start):
+        return [
+            ApplicationUser(username=f'{USERNAME_PREFIX}{kind}{number}', full_name=f'Seed {kind.upper()} {number}',
+                            email=f'{USERNAME_PREFIX}{kind}{number}@example.com', password=encoded_password)
+            for number in range(start, start + count)
+        ]
+
+    with transaction.atomic():
+        faculty_objs = _bulk_create(Faculty, [
+            Faculty(name=f'Seed Faculty {number}', dean_name=f'Seed Dean {number}') for number in range(faculties)
+        ], batch_size, result)
+
+        student_number = teacher_number = 0
+        for faculty in faculty_objs:
+            group_objs = _bulk_create(Group, [
+                Group(name=f'S{faculty.pk}-{number}', faculty=faculty) for number in range(groups_per_faculty)
+            ], batch_size, result)
+
+            teacher_users = _bulk_create(ApplicationUser, users('t', teachers_per_faculty, teacher_number),
+                                         batch_size, result)
+            teacher_number += teachers_per_faculty
+            teachers = _bulk_create(Teacher, [
+                Teacher(user=user, full_name=user.full_name, email=user.email, degree='PhD', faculty=faculty)
+                for user in teacher_users
+            ], batch_size, result)
+
+            disciplines = _bulk_create(Discipline, [
+                Discipline(name=f'Seed Discipline {faculty.pk}-{slot}', hours=rng.choice((60, 90, 120, 150)),
+                           faculty=faculty)
+                for slot in range(grades_per_student)
+            ], batch_size, result)
+            courses = _bulk_create(Course, [
+                Course(discipline=discipline, teacher=teachers[slot % len(teachers)],
+                       study_year=f'{exam_date(slot).year}-{exam_date(slot).year + 1}', semester=slot % 2 + 1,
+                       start_date=exam_date(slot), end_date=exam_date(slot))
+                for slot, discipline in enumerate(disciplines)
+            ], batch_size, result)
+            # Bulk inserts skip Exam.save(), so the academic year is set here
+            exams = _bulk_create(Exam, [
+                Exam(course=course, date=exam_date(slot), academic_year=academic_start_year(exam_date(slot)),
+                     type='credit' if rng.random() < 0.4 else 'exam')
+                for slot, course in enumerate(courses)
+            ], batch_size, result)
+
+            for group in group_objs:
+                student_users = _bulk_create(ApplicationUser, users('s', students_per_group, student_number),
+                                             batch_size, result)
+                student_number += students_per_group
+                students = _bulk_create(Student, [
+                    Student(user=user, full_name=user.full_name, email=user.email, group=group, faculty=faculty,
+                            study_year=f'{FIRST_STUDY_YEAR}-{FIRST_STUDY_YEAR + 1}', created_by_admin_id='seed')
+                    for user in student_users
+                ], batch_size, result)
+                # One insert per group keeps memory flat and refreshes the group's grade summaries once
+                _bulk_create(Grade, [
+                    Grade(student=student, exam=exam, teacher_id=exam.course.teacher_id,
+                          grade_value=Decimal(rng.randint(6000, 10000)) / 100)
+                    for student in students
+                    for exam in exams
+                ], batch_size, result)
+    return result
+
+
+def seeded_data_exists():
+    return ApplicationUser.objects.filter(username__startswith=USERNAME_PREFIX).exists()
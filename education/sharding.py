@@ -0,0 +1,460 @@
+"""
+Optional per-faculty sharding.
+
+With ``DATABASE_SHARD_URLS`` set, ``settings.DATABASE_SHARDS`` lists the
+shard aliases, ``default`` first, and all data of a faculty lives on one of
+them. FacultyShard rows on ``default`` map faculties to shards; faculties
+without one stay on ``default``, and ``move_faculty`` moves a faculty.
+
+Faculty-owned models (``FACULTY_PATHS``) are routed to the shard of the
+object itself, of the object it is built from or read through, or else of
+the current request: the middleware routes a request to the shard of the
+faculty stored in the session at login. Code outside requests picks a shard
+with ``use_shard`` or ``use_faculty``. ``create()``, ``bulk_create()``,
+``update()`` and ``delete()`` on a manager have no object to go by, so they
+always use the current shard.
+
+Users and faculties are reference rows: written to ``default`` and copied to
+every other shard when saved, so foreign keys hold within each shard and the
+session user is loaded with its student or teacher in one query on the
+shard. Bulk UPDATEs send no signals; call ``replicate`` after them.
+
+Reports spanning faculties run their query on every shard (``fan_out``)
+and merge the results. Maintenance outside requests goes through the shards
+in turn: the transcript worker and its eviction, summary rebuilds and checks,
+registration decisions and roster imports; grade imports run on the shard of
+their lecturer. Seeding, benchmarks, query plan checks and load tests act on
+``default`` only. Each shard numbers the rows of faculty-owned tables
+from its own block of ``ID_BLOCK`` ids, so ids stay unique across shards and
+rows keep them when their faculty moves.
+
+Without shard URLs there is a single shard and the router stays out of the
+way.
+"""
+import contextvars
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY as AUTH_SESSION_KEY
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+from django.db.models import Q
+
+from .models import (
+    ApplicationUser, Course, Discipline, Exam, Faculty, FacultyShard, Grade, Group, PendingRegistration, Student,
+    StudentGradeSummary, Teacher, TranscriptJob,
+)
+from .replicas import note_write, primary_of, reads_from
+
+ID_BLOCK = 10 ** 12
+# Faculty of the logged-in user, looked up once per session; None for users without one
+SESSION_KEY = '_shard_faculty_id'
+CHUNK_SIZE = 2000
+
+# Lookup of each faculty-owned model's faculty id, parents before children (the order rows are copied in)
+FACULTY_PATHS = {
+    Group: 'faculty_id',
+    Discipline: 'faculty_id',
+    Teacher: 'faculty_id',
+    Student: 'faculty_id',
+    Course: 'discipline__faculty_id',
+    Exam: 'course__discipline__faculty_id',
+    Grade: 'student__faculty_id',
+    StudentGradeSummary: 'student__faculty_id',
+    TranscriptJob: 'student__faculty_id',
+    PendingRegistration: 'requested_faculty_id',
+}
+REFERENCE_MODELS = (ApplicationUser, Faculty)
+
+_shard = contextvars.ContextVar('shard', default=None)
+_map = {'loaded': float('-inf'), 'shards': {}}
+
+
+def sharding_enabled():
+    return len(settings.DATABASE_SHARDS) > 1
+
+
+def other_shards():
+    return [alias for alias in settings.DATABASE_SHARDS if alias != DEFAULT_DB_ALIAS]
+
+
+def faculty_shards():
+    """``{faculty id: alias}`` of the faculties not on ``default``, reloaded every DATABASE_SHARD_MAP_TTL seconds."""
+    now = time.monotonic()
+    if now - _map['loaded'] > settings.DATABASE_SHARD_MAP_TTL:
+        _map['shards'] = dict(FacultyShard.objects.using(DEFAULT_DB_ALIAS).values_list('faculty_id', 'alias'))
+        _map['loaded'] = now
+    return _map['shards']
+
+
+def reload_faculty_shards():
+    _map['loaded'] = float('-inf')
+
+
+def shard_for_faculty(faculty_id):
+    if not sharding_enabled():
+        return DEFAULT_DB_ALIAS
+    return faculty_shards().get(faculty_id, DEFAULT_DB_ALIAS)
+
+
+def current_shard():
+    """The shard queries without an object to go by use."""
+    return _shard.get() or DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def use_shard(alias):
+    if alias not in settings.DATABASE_SHARDS:
+        raise ValueError(f"Unknown shard {alias!r}.")
+    token = _shard.set(alias)
+    try:
+        yield alias
+    finally:
+        _shard.reset(token)
+
+
+def use_faculty(faculty_id):
+    return use_shard(shard_for_faculty(faculty_id))
+
+
+def pin_shard(alias):
+    """Routes the rest of the current request to ``alias``; the middleware resets it when the request ends."""
+    if sharding_enabled():
+        _shard.set(alias)
+
+
+def pin_faculty(faculty_id):
+    if sharding_enabled():
+        _shard.set(shard_for_faculty(faculty_id))
+
+
+@contextmanager
+def atomic_on_all_shards():
+    """
+    A transaction on every shard, ``default`` included, for writes that span
+    them (a user on ``default``, its copies and its student on the shards):
+    an error in the block rolls all of them back. The commits run back to back
+    when the block ends, so only a failing commit can still leave them apart.
+    """
+    with ExitStack() as stack:
+        for alias in settings.DATABASE_SHARDS:
+            stack.enter_context(transaction.atomic(using=alias))
+        yield
+
+
+def is_faculty_owned(model):
+    return model._meta.concrete_model in FACULTY_PATHS
+
+
+def instance_shard(instance):
+    """Shard of an object, or None when it does not tell (users, and new objects without a faculty)."""
+    model = instance._meta.concrete_model
+    if model is Faculty:
+        return shard_for_faculty(instance.pk)
+    if model not in FACULTY_PATHS:
+        return None
+    if not instance._state.adding:
+        return primary_of(instance._state.db)
+    # A new object goes to the shard of its faculty, or of the object it was built from
+    field = model._meta.get_field(FACULTY_PATHS[model].split('__')[0].removesuffix('_id'))
+    if field.related_model is Faculty:
+        faculty_id = getattr(instance, field.attname)
+        return None if faculty_id is None else shard_for_faculty(faculty_id)
+    related = field.get_cached_value(instance, None)
+    if related is not None and not related._state.adding:
+        return primary_of(related._state.db)
+    return None
+
+
+class ShardRouter:
+    """
+    Routes faculty-owned models to their faculty's shard and reference rows to
+    ``default``. The read replica copies ``default`` only, so reads routed to
+    ``default`` may still go to it (see education/replicas.py), and writes are
+    recorded for its read-your-writes pinning.
+    """
+
+    def _shard(self, hints):
+        instance = hints.get('instance')
+        alias = instance_shard(instance) if instance is not None else None
+        return alias or current_shard()
+
+    def db_for_read(self, model, **hints):
+        if not sharding_enabled():
+            return None
+        if is_faculty_owned(model):
+            return reads_from(self._shard(hints))
+        if model._meta.concrete_model in REFERENCE_MODELS:
+            # Every shard holds a copy; reading it there lets it join the shard's tables
+            return reads_from(current_shard())
+        return None
+
+    def db_for_write(self, model, **hints):
+        if not sharding_enabled():
+            return None
+        if is_faculty_owned(model):
+            note_write()
+            return self._shard(hints)
+        if model._meta.concrete_model in REFERENCE_MODELS:
+            note_write()
+            # Also for objects read from a shard's copy; replicate() updates the copies
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not sharding_enabled():
+            return None
+        if obj1._meta.concrete_model in REFERENCE_MODELS or obj2._meta.concrete_model in REFERENCE_MODELS:
+            return True
+        if is_faculty_owned(obj1) and is_faculty_owned(obj2):
+            # A new object's alias is only a guess until it is saved
+            return (obj1._state.adding or obj2._state.adding
+                    or primary_of(obj1._state.db) == primary_of(obj2._state.db))
+        return None
+
+
+class ShardRoutingMiddleware:
+    """
+    Routes each request to the shard of the logged-in user's faculty;
+    removes itself from the chain when sharding is off.
+    """
+
+    def __init__(self, get_response):
+        if not sharding_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        session = request.session
+        if SESSION_KEY not in session and AUTH_SESSION_KEY in session:
+            # Logged in before sharding was turned on
+            session[SESSION_KEY] = user_faculty(session[AUTH_SESSION_KEY])
+        faculty_id = session.get(SESSION_KEY)
+        # Set even when None, so pin_shard() calls of the request end with it
+        token = _shard.set(None if faculty_id is None else shard_for_faculty(faculty_id))
+        try:
+            return self.get_response(request)
+        finally:
+            _shard.reset(token)
+
+
+def user_faculty(user_id):
+    """Faculty id of the user's student or teacher row on any shard, or None."""
+    for alias in settings.DATABASE_SHARDS:
+        for model in (Student, Teacher):
+            faculty_id = model.objects.using(alias).filter(user_id=user_id).values_list('faculty_id', flat=True).first()
+            if faculty_id is not None:
+                return faculty_id
+    return None
+
+
+def remember_faculty(request, user):
+    """Stores the user's faculty in the session at login and routes the rest of the request to its shard."""
+    faculty_id = user_faculty(user.pk)
+    request.session[SESSION_KEY] = faculty_id
+    if faculty_id is not None:
+        pin_faculty(faculty_id)
+
+
+def fan_out(queryset):
+    """``queryset`` once per shard (just ``queryset`` when sharding is off)."""
+    if not sharding_enabled():
+        return [queryset]
+    return [queryset.using(alias) for alias in settings.DATABASE_SHARDS]
+
+
+def _copies(model, objs):
+    fields = model._meta.concrete_fields
+    return [model(**{field.attname: getattr(obj, field.attname) for field in fields}) for obj in objs]
+
+
+def copy_reference_rows(model, objs, aliases):
+    """Inserts or updates the given users or faculties on each of ``aliases``."""
+    if not objs:
+        return
+    pk = model._meta.pk
+    update_fields = [field.name for field in model._meta.concrete_fields if not field.primary_key]
+    for alias in aliases:
+        model._base_manager.using(alias).bulk_create(
+            _copies(model, objs), update_conflicts=True, unique_fields=[pk.name], update_fields=update_fields,
+        )
+
+
+def replicate(model, pks=None, objs=None):
+    """Copies the given users or faculties (objects, or ids read from ``default``) to every other shard."""
+    aliases = other_shards()
+    if not aliases:
+        return
+    if objs is None:
+        objs = list(model._base_manager.using(DEFAULT_DB_ALIAS).filter(pk__in=pks))
+    copy_reference_rows(model, objs, aliases)
+
+
+def remove_replicas(model, pks):
+    for alias in other_shards():
+        model._base_manager.using(alias).filter(pk__in=pks).delete()
+
+
+def reserve_id_block(alias):
+    """Makes new rows of the shard's faculty-owned tables take ids from the shard's own block."""
+    if alias not in other_shards():
+        return
+    start = settings.DATABASE_SHARDS.index(alias) * ID_BLOCK
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        for model in FACULTY_PATHS:
+            if not isinstance(model._meta.pk, models.AutoField):
+                continue
+            table = model._meta.db_table
+            if connection.vendor == 'sqlite':
+                cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s', [start, table, start])
+                cursor.execute('INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s WHERE NOT EXISTS '
+                               '(SELECT 1 FROM sqlite_sequence WHERE name = %s)', [table, start, table])
+            elif connection.vendor == 'postgresql':
+                quoted = connection.ops.quote_name(table)
+                cursor.execute(f"SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                               f"GREATEST(%s, (SELECT COALESCE(MAX(id), 0) FROM {quoted})))", [table, start])
+
+
+def faculty_rows(model, faculty_id, using):
+    return model._base_manager.using(using).filter(**{FACULTY_PATHS[model]: faculty_id})
+
+
+def cross_faculty_rows(faculty_id, using):
+    """
+    ``{table: count}`` of the faculty's rows that reference another
+    faculty's rows; such a faculty cannot move, its rows would lose them.
+    """
+    checks = (
+        (Student, Q(group__faculty_id=faculty_id)),
+        (Course, Q(teacher__faculty_id=faculty_id)),
+        (Grade, Q(exam__course__discipline__faculty_id=faculty_id) & Q(teacher__faculty_id=faculty_id)),
+        (PendingRegistration, Q(requested_group__isnull=True) | Q(requested_group__faculty_id=faculty_id)),
+    )
+    counts = {}
+    for model, same_faculty in checks:
+        count = faculty_rows(model, faculty_id, using).exclude(same_faculty).count()
+        if count:
+            counts[model._meta.db_table] = count
+    return counts
+
+
+def _copy_rows(model, rows, target):
+    stamped = any(getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+                  for field in model._meta.concrete_fields)
+    if not stamped:
+        model._base_manager.using(target).bulk_create(rows)
+        return
+    # bulk_create would stamp auto_now(_add) fields with the current time; raw saves (as loaddata does) keep them
+    for row in rows:
+        row.save_base(raw=True, force_insert=True, using=target)
+
+
+def _has_faculty_rows(faculty_id, using):
+    return any(faculty_rows(model, faculty_id, using).exists() for model in FACULTY_PATHS)
+
+
+def _delete_faculty_rows(faculty_id, using):
+    """Deletes the faculty's rows from ``using`` and returns how many there were."""
+    deleted = 0
+    # Children first, so the deletes cascade to nothing; summary refreshes find no students left
+    with use_shard(using), transaction.atomic(using=using):
+        for model in reversed(FACULTY_PATHS):
+            deleted += faculty_rows(model, faculty_id, using).delete()[0]
+    return deleted
+
+
+class MoveResult:
+    """Rows of a faculty moved to another shard, per table, and the shards cleared of leftovers."""
+
+    def __init__(self, source, target):
+        self.source = source
+        self.target = target
+        self.rows = {}
+        self.cleaned = []
+        self.seconds = 0.0
+
+    def __str__(self):
+        text = f"{sum(self.rows.values())} rows moved from {self.source} to {self.target} in {self.seconds:.2f} s"
+        if self.cleaned:
+            text += f"; leftovers of an interrupted move removed from {', '.join(self.cleaned)}"
+        return text
+
+
+def move_faculty(faculty_id, target, chunk_size=CHUNK_SIZE):
+    """
+    Copies the faculty's rows to ``target`` in one transaction, maps the
+    faculty to it and then deletes the rows from the old shard. Writes to
+    the faculty must be stopped meanwhile: they would be left behind, and
+    other processes keep routing to the old shard for up to
+    DATABASE_SHARD_MAP_TTL seconds. Raises ValueError when the faculty
+    cannot move.
+
+    The three steps commit separately, so a move can be interrupted between
+    them; running it again finishes it. Rows on shards the faculty is not
+    mapped to are leftovers: a rerun deletes them from ``target`` before
+    copying and, once the faculty is mapped to ``target``, from the others.
+    """
+    if target not in settings.DATABASE_SHARDS:
+        raise ValueError(f"Unknown shard {target!r}.")
+    faculty = Faculty.objects.using(DEFAULT_DB_ALIAS).filter(pk=faculty_id).first()
+    if faculty is None:
+        raise ValueError(f"Faculty {faculty_id} does not exist.")
+    reload_faculty_shards()
+    source = shard_for_faculty(faculty_id)
+    started = time.perf_counter()
+    if source == target:
+        # Interrupted after the faculty was mapped to target: only the old rows are left to delete
+        leftovers = [alias for alias in settings.DATABASE_SHARDS
+                     if alias != target and _has_faculty_rows(faculty_id, alias)]
+        if not leftovers:
+            raise ValueError(f"Faculty {faculty_id} is already on {target}.")
+        result = MoveResult(', '.join(leftovers), target)
+        for alias in leftovers:
+            _delete_faculty_rows(faculty_id, alias)
+        result.cleaned = leftovers
+        result.seconds = time.perf_counter() - started
+        return result
+    foreign = cross_faculty_rows(faculty_id, source)
+    if foreign:
+        raise ValueError("Rows referencing other faculties: "
+                         + ', '.join(f'{table} ({count})' for table, count in foreign.items()))
+
+    result = MoveResult(source, target)
+    # The copied rows reference these users and the faculty itself
+    user_ids = set()
+    for model in (Student, Teacher, PendingRegistration):
+        user_ids.update(faculty_rows(model, faculty_id, source).values_list('user_id', flat=True))
+    user_ids = sorted(user_ids)
+    copy_reference_rows(Faculty, [faculty], [target])
+    for start in range(0, len(user_ids), chunk_size):
+        users = ApplicationUser.objects.using(DEFAULT_DB_ALIAS).filter(pk__in=user_ids[start:start + chunk_size])
+        copy_reference_rows(ApplicationUser, list(users), [target])
+
+    with transaction.atomic(using=target):
+        # Copied by a run interrupted before the faculty was mapped to target
+        if _delete_faculty_rows(faculty_id, target):
+            result.cleaned.append(target)
+        for model in FACULTY_PATHS:
+            rows = faculty_rows(model, faculty_id, source).order_by('pk')
+            copied, last_pk = 0, None
+            while True:
+                chunk = list((rows if last_pk is None else rows.filter(pk__gt=last_pk))[:chunk_size])
+                if not chunk:
+                    break
+                _copy_rows(model, chunk, target)
+                copied += len(chunk)
+                last_pk = chunk[-1].pk
+            result.rows[model._meta.db_table] = copied
+
+    if target == DEFAULT_DB_ALIAS:
+        FacultyShard.objects.using(DEFAULT_DB_ALIAS).filter(faculty_id=faculty_id).delete()
+    else:
+        FacultyShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(faculty_id=faculty_id,
+                                                                      defaults={'alias': target})
+    reload_faculty_shards()
+
+    _delete_faculty_rows(faculty_id, source)
+    result.seconds = time.perf_counter() - started
+    return result
@@ -0,0 +1,93 @@
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_in
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from .group_cache import invalidate_groups
+from .models import ApplicationUser, Course, Discipline, Exam, Faculty, Grade, Group, Student
+from .sharding import remember_faculty, remove_replicas, replicate, reserve_id_block, sharding_enabled, use_shard
+from .summaries import bump_grade_versions, catalog_changed, grade_deleted, grade_saved
+
+
+@receiver(post_save, sender=Grade)
+def update_summary_on_grade_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    grade_saved(instance, created)
+
+
+@receiver(post_delete, sender=Grade)
+def update_summary_on_grade_delete(sender, instance, origin=None, **kwargs):
+    grade_deleted(instance, origin)
+
+
+# Cached grade tables and page ETags go by the grade version, so edits of what the pages
+# show besides grades move it too. New rows are not shown anywhere yet, and deletes
+# cascade to the grades (refreshed by their own signals) or to the students themselves.
+@receiver(post_save, sender=Exam)
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Discipline)
+def refresh_graded_students(sender, instance, created, raw=False, using=None, **kwargs):
+    if created or raw:
+        return
+    with use_shard(using):
+        catalog_changed(instance)
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_save, sender=Group)
+def bump_shown_students(sender, instance, created, raw=False, using=None, **kwargs):
+    if created or raw:
+        return
+    lookup = {'pk': instance.pk} if sender is Student else {'group_id': instance.pk}
+    with use_shard(using):
+        bump_grade_versions(Student.objects.filter(**lookup))
+
+
+@receiver(post_save, sender=Faculty)
+@receiver(post_save, sender=ApplicationUser)
+def bump_students_on_every_shard(sender, instance, created, raw=False, using=None, update_fields=None, **kwargs):
+    # Logins save the user just to stamp last_login, which no page shows
+    if created or raw or using != DEFAULT_DB_ALIAS or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    lookup = {'faculty_id': instance.pk} if sender is Faculty else {'user_id': instance.pk}
+    for alias in settings.DATABASE_SHARDS:
+        with use_shard(alias):
+            bump_grade_versions(Student.objects.filter(**lookup))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=Faculty)
+@receiver(post_delete, sender=Faculty)
+def invalidate_group_lists(sender, **kwargs):
+    # After commit, so no request can cache the old lists again in between
+    transaction.on_commit(invalidate_groups, using=kwargs.get('using'))
+
+
+@receiver(post_save, sender=ApplicationUser)
+@receiver(post_save, sender=Faculty)
+def copy_reference_row(sender, instance, raw=False, using=None, **kwargs):
+    # Rows copied to the shards are written there directly, without signals
+    if not raw and using == DEFAULT_DB_ALIAS:
+        replicate(sender, objs=[instance])
+
+
+@receiver(post_delete, sender=ApplicationUser)
+@receiver(post_delete, sender=Faculty)
+def delete_reference_row(sender, instance, using=None, **kwargs):
+    if using == DEFAULT_DB_ALIAS:
+        remove_replicas(sender, [instance.pk])
+
+
+@receiver(user_logged_in)
+def route_to_faculty_shard(sender, request, user, **kwargs):
+    if sharding_enabled():
+        remember_faculty(request, user)
+
+
+@receiver(post_migrate)
+def reserve_shard_ids(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    if sender.name == 'education':
+        reserve_id_block(using)
@@ -0,0 +1,58 @@
+"""
+SQLite backend for production deployments with several worker processes.
+
+It is Django's SQLite backend with two additions, configured through the
+database OPTIONS:
+
+``pragmas``
+    ``{name: value}`` run on every new connection, e.g. WAL journaling
+    (readers no longer wait for the writer), ``synchronous=NORMAL`` and the
+    busy timeout.
+``begin_attempts``
+    Transactions start with ``BEGIN IMMEDIATE``, which takes the write lock
+    up front and waits for it for the busy timeout. A deferred BEGIN upgrades
+    to a write lock at the first write and fails at once with "database is
+    locked" when another connection is writing. If the lock is still held
+    after the busy timeout, BEGIN is retried this many times in total with a
+    short random backoff; nothing has run in the transaction yet, so a retry
+    is always safe.
+
+Read-only ``atomic()`` blocks take the write lock too, so reads belong
+outside transactions (Django's default autocommit).
+"""
+import random
+import time
+
+from django.db import OperationalError
+from django.db.backends.sqlite3 import base
+
+BEGIN_ATTEMPTS = 3
+# Upper bound of the random pause before the n-th retry is n times this
+RETRY_BACKOFF = 0.05
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        options = self.settings_dict['OPTIONS']
+        self.pragmas = dict(options.get('pragmas', {}))
+        self.begin_attempts = options.get('begin_attempts', BEGIN_ATTEMPTS)
+        kwargs = super().get_connection_params()
+        kwargs.pop('pragmas', None)
+        kwargs.pop('begin_attempts', None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        for attempt in range(1, self.begin_attempts + 1):
+            try:
+                self.cursor().execute('BEGIN IMMEDIATE')
+                return
+            except OperationalError as error:
+                if 'locked' not in str(error) or attempt == self.begin_attempts:
+                    raise
+            time.sleep(random.uniform(0, RETRY_BACKOFF * attempt))
@@ -0,0 +1,270 @@
+"""
+Maintenance of the denormalized StudentGradeSummary table.
+
+Single grade saves apply a delta to the student's summary row with one UPDATE
+built from F() expressions, so concurrent saves do not lose counts. Whenever a
+delta cannot be applied safely (the row is missing, the changed grade held the
+student's highest/lowest value, or the grade was deleted) the student's summary
+is recomputed from the Grade table instead.
+"""
+import contextvars
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, Count, DecimalField, F, IntegerField, Max, Min, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Course, Discipline, Exam, Grade, Student, StudentGradeSummary
+from .replicas import reading_replica
+from .sharding import use_shard
+
+SUMMARY_FIELDS = (
+    'total_count', 'exam_count', 'credit_count', 'grade_sum', 'credits_total', 'weighted_grade_sum',
+    'highest_value', 'highest_grade_id', 'lowest_value', 'lowest_grade_id',
+)
+CHUNK_SIZE = 1000
+# Lookup from a grade to the catalog rows its report row is built from
+CATALOG_PATHS = {Exam: 'exam', Course: 'exam__course', Discipline: 'exam__course__discipline'}
+
+# Student ids whose refresh is postponed by deferred_refresh()
+_deferred = contextvars.ContextVar('deferred_summary_refresh', default=None)
+
+
+def _exam_facts(exam_id):
+    """Exam type and discipline credits needed to classify a grade."""
+    exam_type, hours = Exam.objects.filter(pk=exam_id).values_list('type', 'course__discipline__hours').first()
+    return exam_type, int(hours / 30) if hours else 0
+
+
+def _decimal(value):
+    return Decimal(str(value)).quantize(Decimal('0.01'))
+
+
+def _delta(sign, value, exam_type, credits):
+    return {
+        'total_count': sign,
+        'exam_count': sign if exam_type == 'exam' else 0,
+        'credit_count': sign if exam_type == 'credit' else 0,
+        'grade_sum': sign * value,
+        'credits_total': sign * credits,
+        'weighted_grade_sum': sign * value * credits,
+    }
+
+
+def _extremes(grade_id, value):
+    """Case expressions that move highest/lowest to the given grade when it beats them."""
+    value = Value(value)
+    grade_ref = Value(grade_id)
+    beats_highest = (Q(highest_value__isnull=True) | Q(highest_value__lt=value)
+                     | Q(highest_value=value, highest_grade_id__gt=grade_id))
+    beats_lowest = (Q(lowest_value__isnull=True) | Q(lowest_value__gt=value)
+                    | Q(lowest_value=value, lowest_grade_id__gt=grade_id))
+    return {
+        'highest_value': Case(When(beats_highest, then=value), default=F('highest_value')),
+        'highest_grade_id': Case(When(beats_highest, then=grade_ref), default=F('highest_grade_id'), output_field=BigIntegerField()),
+        'lowest_value': Case(When(beats_lowest, then=value), default=F('lowest_value')),
+        'lowest_grade_id': Case(When(beats_lowest, then=grade_ref), default=F('lowest_grade_id'), output_field=BigIntegerField()),
+    }
+
+
+def grade_saved(grade, created):
+    """Applies a saved grade to its student's summary."""
+    value = _decimal(grade.grade_value)
+    exam_type, credits = _exam_facts(grade.exam_id)
+    delta = _delta(1, value, exam_type, credits)
+    summaries = StudentGradeSummary.objects.filter(student_id=grade.student_id)
+
+    if not created:
+        old = getattr(grade, '_loaded_values', None)
+        if old is None or old.get('student_id') != grade.student_id:
+            refresh_summaries({grade.student_id, old and old.get('student_id')})
+            _remember(grade)
+            return
+        old_value = _decimal(old['grade_value'])
+        if old_value == value and old['exam_id'] == grade.exam_id:
+            return
+        old_facts = (exam_type, credits) if old['exam_id'] == grade.exam_id else _exam_facts(old['exam_id'])
+        for field, change in _delta(-1, old_value, *old_facts).items():
+            delta[field] += change
+        # The grade may have been the one holding the highest/lowest value
+        summaries = summaries.exclude(highest_grade_id=grade.pk).exclude(lowest_grade_id=grade.pk)
+
+    changes = {field: F(field) + change for field, change in delta.items()}
+    changes['grade_version'] = F('grade_version') + 1
+    changes.update(_extremes(grade.pk, value))
+    if not summaries.update(**changes):
+        refresh_summaries({grade.student_id})
+    _remember(grade)
+
+
+def _remember(grade):
+    grade._loaded_values = {'student_id': grade.student_id, 'exam_id': grade.exam_id, 'grade_value': grade.grade_value}
+
+
+def grade_deleted(grade, origin=None):
+    """
+    Recomputes the student's summary after the deleting transaction commits,
+    since the deleted grade may have held the highest/lowest value. Students
+    touched by one multi-row or cascading delete are refreshed together.
+    """
+    holder = origin if origin is not None else grade
+    pending = getattr(holder, '_summary_student_ids', None)
+    if pending is None:
+        pending = holder._summary_student_ids = set()
+        transaction.on_commit(lambda: refresh_summaries(pending), using=grade._state.db)
+    pending.add(grade.student_id)
+
+
+def compute_summaries(student_ids):
+    """Builds unsaved summaries for the given students straight from the Grade table."""
+    student_ids = [student_id for student_id in student_ids if student_id is not None]
+    credits = F('exam__course__discipline__hours') / 30
+    grades = Grade.objects.filter(student_id=OuterRef('student_id'))
+    rows = (Grade.objects.filter(student_id__in=student_ids)
+            .values('student_id')
+            .annotate(
+                total_count=Count('id'),
+                exam_count=Count('id', filter=Q(exam__type='exam')),
+                credit_count=Count('id', filter=Q(exam__type='credit')),
+                grade_sum=Sum('grade_value'),
+                credits_total=Coalesce(Sum(credits, output_field=IntegerField()), 0),
+                weighted_grade_sum=Coalesce(Sum(F('grade_value') * credits, output_field=DecimalField()), Decimal(0)),
+                highest_value=Max('grade_value'),
+                lowest_value=Min('grade_value'),
+                highest_grade_id=Subquery(grades.order_by('-grade_value', 'id').values('id')[:1]),
+                lowest_grade_id=Subquery(grades.order_by('grade_value', 'id').values('id')[:1]),
+            )
+            .order_by())
+    summaries = {student_id: StudentGradeSummary(student_id=student_id) for student_id in student_ids}
+    for row in rows:
+        summary = summaries[row.pop('student_id')]
+        for field, value in row.items():
+            setattr(summary, field, value)
+    return summaries
+
+
+@contextmanager
+def deferred_refresh():
+    """
+    Collects the summary refreshes of the bulk grade writes in the block and
+    runs them once when it ends, for imports writing many sheets per student.
+    """
+    if _deferred.get() is not None:
+        yield
+        return
+    pending = set()
+    token = _deferred.set(pending)
+    try:
+        yield
+    finally:
+        _deferred.reset(token)
+    refresh_summaries(pending)
+
+
+def refresh_summaries(student_ids):
+    """Recomputes and upserts the summaries of the given (still existing) students."""
+    pending = _deferred.get()
+    if pending is not None:
+        pending.update(student_ids)
+        return
+    student_ids = list({student_id for student_id in student_ids if student_id is not None})
+    for start in range(0, len(student_ids), CHUNK_SIZE):
+        chunk = Student.objects.filter(pk__in=student_ids[start:start + CHUNK_SIZE]).values_list('pk', flat=True)
+        summaries = compute_summaries(list(chunk))
+        StudentGradeSummary.objects.bulk_create(
+            summaries.values(),
+            update_conflicts=True,
+            unique_fields=['student'],
+            update_fields=[field.removesuffix('_id') for field in SUMMARY_FIELDS],
+        )
+        StudentGradeSummary.objects.filter(student_id__in=summaries).update(grade_version=F('grade_version') + 1)
+
+
+def catalog_changed(instance):
+    """
+    Refreshes the students graded under an edited exam, course or discipline:
+    their rows show its type, date, semester, name and hours, and the counts
+    and credits depend on them. The refresh also moves their grade versions.
+    """
+    lookup = CATALOG_PATHS[instance._meta.concrete_model]
+    refresh_summaries(Grade.objects.filter(**{lookup: instance.pk}).values_list('student_id', flat=True).distinct())
+
+
+def bump_grade_versions(students):
+    """
+    Moves the given students (a queryset) to a new grade version after an edit
+    their pages show that is not a grade, such as their name or group.
+    """
+    # Students without a summary are at version 0; creating it moves them to 1
+    refresh_summaries(students.filter(grade_summary__isnull=True).values_list('pk', flat=True))
+    StudentGradeSummary.objects.filter(student__in=students).update(grade_version=F('grade_version') + 1)
+
+
+def grade_version(student):
+    """Current grade version of a student; 0 when no summary exists yet."""
+    return StudentGradeSummary.objects.filter(student=student).values_list('grade_version', flat=True).first() or 0
+
+
+def loaded_grade_version(student):
+    """
+    Grade version from the student's summary relation, which RoleModelBackend
+    loads together with the session user; queried only when it was not loaded.
+    That summary comes from the primary, so a request reading from the replica
+    reads the version there instead (once), matching the rows it shows.
+    """
+    if reading_replica():
+        if not hasattr(student, '_replica_grade_version'):
+            student._replica_grade_version = grade_version(student)
+        return student._replica_grade_version
+    try:
+        return student.grade_summary.grade_version
+    except StudentGradeSummary.DoesNotExist:
+        return 0
+
+
+def _student_id_chunks():
+    student_ids = list(Student.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(student_ids), CHUNK_SIZE):
+        yield student_ids[start:start + CHUNK_SIZE]
+
+
+def rebuild_all_summaries():
+    """
+    Recomputes every student's summary, shard by shard. Rows are upserted
+    rather than recreated so grade versions keep increasing. Returns the
+    number of students processed.
+    """
+    count = 0
+    for alias in settings.DATABASE_SHARDS:
+        with use_shard(alias), transaction.atomic(using=alias):
+            for chunk in _student_id_chunks():
+                refresh_summaries(chunk)
+                count += len(chunk)
+    return count
+
+
+def _chunk_mismatches(chunk):
+    stored = StudentGradeSummary.objects.in_bulk(chunk)
+    for student_id, expected in compute_summaries(chunk).items():
+        summary = stored.get(student_id)
+        for field in SUMMARY_FIELDS:
+            expected_value = getattr(expected, field)
+            stored_value = getattr(summary, field) if summary else None
+            if summary is None and not expected.total_count:
+                continue
+            if stored_value != expected_value:
+                yield student_id, field, stored_value, expected_value
+
+
+def find_inconsistent_summaries():
+    """Yields (student_id, field, stored, expected) for every summary that drifted, on every shard."""
+    for alias in settings.DATABASE_SHARDS:
+        with use_shard(alias):
+            chunks = list(_student_id_chunks())
+        for chunk in chunks:
+            # Compared under the shard, but yielded outside it, so the caller's queries are not rerouted
+            with use_shard(alias):
+                mismatches = list(_chunk_mismatches(chunk))
+            yield from mismatches
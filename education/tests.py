@@ -1,8 +1,44 @@
+import contextlib
+import contextvars
+import csv
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.test import TestCase, Client
+from django.db import DatabaseError, IntegrityError, OperationalError, connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth import get_user_model
-from education.models import Teacher, Course, Discipline, Group, Student, Exam, Grade, Faculty
+from django.contrib.sessions.models import Session
+from django.core.files.uploadedfile import SimpleUploadedFile
+from education.models import Teacher, Course, Discipline, Group, Student, Exam, Grade, Faculty, FacultyShard, StudentGradeSummary, TranscriptJob, PendingRegistration
+from education.admin import estimated_row_count
+from education.replicas import PIN_COOKIE, RoutingState, _state as replica_state
+from education.sqlite_backend.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from education.query_plans import full_scans
+from education.exports import COLUMNS as EXPORT_COLUMNS, ExportFilters, export_rows
+from education.group_cache import invalidate_groups
+from education.gradebook import save_grade_sheet
+from education.grade_tables import GradeTable, GradeTableCache, table_cache
+from education.middleware import RequestMetrics, fingerprint
+from education.seeding import seed_university
+from education.sharding import (
+    ID_BLOCK, SESSION_KEY as SHARD_SESSION_KEY, ShardRouter, move_faculty, reload_faculty_shards, reserve_id_block,
+    use_faculty, use_shard,
+)
+from django.core.management import call_command
+from django.db.models import QuerySet
+from django.core.management.base import CommandError
 from django.utils import timezone
 
 class EducationAppTests(TestCase):
@@ -153,3 +189,1586 @@ def test_reset_dropdowns_on_cancel(self):
         })
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, 'Оберіть дисципліну та групу для відображення студентів.')
+
+
+class StudentGradesTestMixin:
+    """Logged-in student with helpers to create graded courses."""
+
+    def setUp(self):
+        # Tables cached by earlier tests may share student ids and grade versions
+        table_cache().clear()
+        cache.clear()
+        User = get_user_model()
+        self.faculty = Faculty.objects.create(name='Report Faculty', dean_name='Report Dean')
+        self.teacher = Teacher.objects.create(
+            user=User.objects.create_user(username='report_lecturer', password='testpass123'),
+            full_name='Report Lecturer', faculty=self.faculty, email='report_lecturer@example.com', degree='PhD'
+        )
+        self.group = Group.objects.create(name='Group R', faculty=self.faculty)
+        self.student = Student.objects.create(
+            user=User.objects.create_user(username='report_student', password='testpass123'),
+            full_name='Report Student',
+            email='report_student@example.com',
+            group=self.group,
+            faculty=self.faculty,
+            study_year='2024-2025'
+        )
+        self.client.login(username='report_student', password='testpass123')
+
+    def add_grade(self, grade_value, semester=1, exam_type='credit', date=None):
+        number = Discipline.objects.count() + 1
+        discipline = Discipline.objects.create(name=f'Discipline {number}', hours=90, faculty=self.faculty)
+        course = Course.objects.create(
+            discipline=discipline, teacher=self.teacher, study_year='2024-2025', semester=semester,
+            start_date=timezone.now(), end_date=timezone.now()
+        )
+        exam_date = date or datetime(2024 if semester == 1 else 2025, 12 if semester == 1 else 5, 1, tzinfo=dt_timezone.utc)
+        exam = Exam.objects.create(course=course, date=exam_date, type=exam_type)
+        return Grade.objects.create(student=self.student, exam=exam, teacher=self.teacher, grade_value=grade_value)
+
+    def add_grades(self, count):
+        for i in range(count):
+            self.add_grade(60 + i % 40, semester=i % 2 + 1, exam_type='exam' if i % 2 else 'credit')
+
+    def count_queries(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data or {})
+        self.assertEqual(response.status_code, 200)
+        return len(queries.captured_queries)
+
+
+class StudentGradeReportTests(StudentGradesTestMixin, TestCase):
+    def test_student_grades_query_count_is_constant(self):
+        self.add_grades(2)
+        url = reverse('education:student_grades')
+        few = self.count_queries('get', url)
+        self.add_grades(40)
+        self.assertEqual(self.count_queries('get', url), few)
+
+    def test_export_grades_pdf_query_count_is_constant(self):
+        self.add_grades(2)
+        url = reverse('education:export_grades_pdf')
+        few = self.count_queries('post', url)
+        self.add_grades(40)
+        self.assertEqual(self.count_queries('post', url), few)
+
+    def test_student_grades_grouping_sorting_and_stats(self):
+        low = self.add_grade(65, semester=1, exam_type='credit')
+        self.add_grade(80, semester=1, exam_type='credit')
+        high = self.add_grade(95, semester=2, exam_type='exam')
+        self.add_grade(99, semester=1, date=datetime(2031, 10, 1, tzinfo=dt_timezone.utc))  # 8th study year
+
+        response = self.client.get(reverse('education:student_grades'), {'sort_type': 'desc'})
+        grouped = response.context['grouped_grades']
+        self.assertEqual([year for year, _ in grouped], ['2024-25'])
+        semesters = dict(grouped[0][1])
+        self.assertEqual([row.grade_value for row in dict(semesters['I'])['credit']], [80, 65])
+        self.assertEqual(dict(semesters['II'])['exam'][0].national_grade, '5')
+        self.assertEqual(response.context['total_disciplines'], 3)
+        self.assertEqual(response.context['exams'], 1)
+        self.assertEqual(response.context['credits'], 2)
+        self.assertEqual(response.context['average_grade'], 80)
+        self.assertEqual(response.context['highest_grade_exam'].id, high.id)
+        self.assertEqual(response.context['lowest_grade_exam'].id, low.id)
+
+        response = self.client.get(reverse('education:student_grades'), {'semester_2': 'on'})
+        self.assertEqual([semester for semester, _ in response.context['grouped_grades'][0][1]], ['II'])
+        # View filters hide rows but the statistics still cover them
+        self.assertEqual(response.context['total_disciplines'], 3)
+        self.assertEqual(response.context['highest_grade_exam'].id, high.id)
+
+    def test_exam_academic_year_follows_date(self):
+        exam = self.add_grade(70, date=datetime(2025, 8, 31, 22, 0, tzinfo=dt_timezone.utc)).exam
+        self.assertEqual(exam.academic_year, 2025)  # 1 September in Kyiv
+        exam.date = datetime(2026, 3, 1, tzinfo=dt_timezone.utc)
+        exam.save(update_fields=['date'])
+        exam.refresh_from_db()
+        self.assertEqual(exam.academic_year, 2025)
+
+    def test_filters_are_applied_in_sql(self):
+        self.add_grade(70, semester=1)
+        second_year = self.add_grade(75, semester=2, exam_type='exam', date=datetime(2026, 5, 1, tzinfo=dt_timezone.utc))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('education:student_grades'), {
+                'course_min': 2, 'course_max': 2, 'semester_2': 'on', 'type_exam': 'on', 'sort_type': 'asc',
+            })
+        report_sql = [query['sql'] for query in queries.captured_queries if 'education_grade' in query['sql']]
+        self.assertEqual(len(report_sql), 2)  # shown rows + statistics
+        self.assertTrue(all('"academic_year"' in sql for sql in report_sql))
+        self.assertIn('ORDER BY', report_sql[-1])
+        grouped = response.context['grouped_grades']
+        self.assertEqual([row.id for row in dict(dict(grouped[0][1])['II'])['exam']], [second_year.id])
+        self.assertEqual(response.context['total_disciplines'], 1)
+
+
+class StudentGradeSummaryTests(StudentGradesTestMixin, TestCase):
+    def summary(self):
+        return StudentGradeSummary.objects.get(student=self.student)
+
+    def test_summary_follows_single_grade_changes(self):
+        first = self.add_grade(70, exam_type='credit')
+        second = self.add_grade(90, semester=2, exam_type='exam')
+        summary = self.summary()
+        self.assertEqual((summary.total_count, summary.exam_count, summary.credit_count), (2, 1, 1))
+        self.assertEqual(summary.average, 80)
+        self.assertEqual(summary.credits_total, 6)
+        self.assertEqual((summary.highest_grade_id, summary.lowest_grade_id), (second.id, first.id))
+
+        first = Grade.objects.get(pk=first.pk)
+        first.grade_value = 95
+        first.save()
+        summary = self.summary()
+        self.assertEqual(summary.grade_sum, 185)
+        self.assertEqual((summary.highest_grade_id, summary.lowest_grade_id), (first.id, second.id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        summary = self.summary()
+        self.assertEqual(summary.total_count, 1)
+        self.assertEqual((summary.highest_grade_id, summary.lowest_grade_id), (second.id, second.id))
+
+    def test_summary_follows_bulk_paths(self):
+        grade = self.add_grade(70)
+        exam = Exam.objects.create(course=grade.exam.course, date=timezone.now(), type='exam')
+        Grade.objects.bulk_create([Grade(student=self.student, exam=exam, teacher=self.teacher, grade_value=100)])
+        self.assertEqual(self.summary().total_count, 2)
+        grade.grade_value = 60
+        Grade.objects.bulk_update([grade], ['grade_value'])
+        self.assertEqual(self.summary().lowest_value, 60)
+        Grade.objects.filter(exam=exam).update(grade_value=80)
+        self.assertEqual(self.summary().highest_value, 80)
+        call_command('rebuild_grade_summaries', '--check', stdout=io.StringIO())
+
+    def test_bulk_update_refreshes_summaries_once(self):
+        self.add_grades(4)
+        grades = list(Grade.objects.filter(student=self.student))
+        for grade in grades:
+            grade.grade_value = 99
+
+        def count(batch_size):
+            with CaptureQueriesContext(connection) as queries:
+                Grade.objects.bulk_update(grades, ['grade_value'], batch_size=batch_size)
+            return len(queries.captured_queries)
+
+        # Each extra batch costs its UPDATE only, not another refresh
+        self.assertEqual(count(1), count(4) + 3)
+        self.assertEqual(self.summary().lowest_value, 99)
+        self.assertEqual({grade.version for grade in Grade.objects.filter(student=self.student)}, {3})
+
+    def test_profile_reads_summary_in_constant_queries(self):
+        self.add_grades(2)
+        url = reverse('education:student_profile')
+        few = self.count_queries('get', url)
+        self.add_grades(20)
+        self.assertEqual(self.count_queries('get', url), few)
+        self.assertEqual(self.client.get(url).context['total_disciplines'], 22)
+
+    def test_rebuild_command_repairs_drift(self):
+        self.add_grades(3)
+        StudentGradeSummary.objects.filter(student=self.student).update(total_count=99)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_grade_summaries', '--check', stdout=io.StringIO(), stderr=io.StringIO())
+        call_command('rebuild_grade_summaries', stdout=io.StringIO())
+        self.assertEqual(self.summary().total_count, 3)
+
+
+class BackgroundTranscriptTests(StudentGradesTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        settings_override = override_settings(PDF_EXPORT_MODE='background', TRANSCRIPT_CACHE_DIR=cache_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.add_grades(3)
+
+    def export(self, data=None):
+        return self.client.post(reverse('education:export_grades_pdf'), data or {'sort_type': 'asc'})
+
+    def test_export_is_queued_rendered_and_then_served_from_cache(self):
+        response = self.export()
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertEqual(job['status'], 'pending')
+        # Same filters, posted differently, map to the same job
+        self.assertEqual(self.export({'sort_type': 'asc', 'semester_1': 'on', 'semester_2': 'on'}).json()['id'], job['id'])
+
+        call_command('run_transcript_worker', '--once', stdout=io.StringIO())
+        status = self.client.get(job['status_url']).json()
+        self.assertEqual(status['status'], 'done')
+        download = self.client.get(status['download_url'])
+        self.assertEqual(download['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(download.streaming_content).startswith(b'%PDF'))
+        download.close()
+
+        cached = self.export()
+        self.assertEqual(cached.status_code, 200)
+        cached.close()
+        self.assertEqual(TranscriptJob.objects.count(), 1)
+
+        # A grade change moves the student to a new version and a new job
+        self.add_grade(77)
+        self.assertEqual(self.export().status_code, 202)
+        self.assertEqual(TranscriptJob.objects.count(), 2)
+
+    def test_eviction_drops_outdated_and_oversized_entries(self):
+        from education.transcripts import evict_transcripts
+        self.export()
+        call_command('run_transcript_worker', '--once', stdout=io.StringIO())
+        path = TranscriptJob.objects.get().file_path
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(evict_transcripts(max_bytes=0), 1)
+        self.assertFalse(os.path.exists(path))
+
+        self.export()
+        call_command('run_transcript_worker', '--once', stdout=io.StringIO())
+        self.add_grade(88)
+        self.assertEqual(evict_transcripts(), 1)
+        self.assertFalse(TranscriptJob.objects.exists())
+
+    def test_file_evicted_after_the_existence_check_is_requeued(self):
+        self.export()
+        call_command('run_transcript_worker', '--once', stdout=io.StringIO())
+        with mock.patch('education.transcripts.os.path.exists', return_value=True):
+            os.remove(TranscriptJob.objects.get().file_path)
+            response = self.export()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'pending')
+        self.assertEqual(TranscriptJob.objects.get().status, 'pending')
+
+    def test_get_never_queues_and_only_serves_finished_exports(self):
+        url = reverse('education:export_grades_pdf')
+        self.assertEqual(self.client.get(url, {'sort_type': 'asc'}).status_code, 404)
+        self.assertFalse(TranscriptJob.objects.exists())
+
+        self.export()
+        call_command('run_transcript_worker', '--once', stdout=io.StringIO())
+        response = self.client.get(url, {'sort_type': 'asc'})
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        revalidated = self.client.get(url, {'sort_type': 'asc'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_queueing_requires_the_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.login(username='report_student', password='testpass123')
+        self.assertEqual(client.post(reverse('education:export_grades_pdf'), {'sort_type': 'asc'}).status_code, 403)
+        self.assertFalse(TranscriptJob.objects.exists())
+
+    def test_status_of_other_students_job_is_hidden(self):
+        job = self.export().json()
+        self.client.logout()
+        other = get_user_model().objects.create_user(username='other_student', password='testpass123')
+        Student.objects.create(user=other, full_name='Other', email='other@example.com', group=self.group,
+                               faculty=self.faculty, study_year='2024-2025')
+        self.client.login(username='other_student', password='testpass123')
+        self.assertEqual(self.client.get(job['status_url']).status_code, 404)
+
+
+class PdfLayoutTests(SimpleTestCase):
+    def test_long_tables_are_chunked_with_repeated_header_and_one_style(self):
+        from education import pdf
+        rows = [(pdf.SECTION, ['I семестр 2024-25'])] + [(pdf.DATA, [f'Discipline {i}', '3', '90', '5', '95.00']) for i in range(249)]
+        tables = list(pdf.build_tables(pdf.TRANSCRIPT_HEADER, rows, pdf.TRANSCRIPT_COL_WIDTHS, chunk_rows=100))
+        self.assertEqual([len(table._cellvalues) for table in tables], [101, 101, 51])
+        self.assertTrue(all(table.repeatRows == 1 and table._cellvalues[0] == pdf.TRANSCRIPT_HEADER for table in tables))
+        # Short names stay plain strings, long ones are wrapped
+        self.assertIsInstance(tables[0]._cellvalues[2][0], str)
+        wrapped = list(pdf.build_tables(pdf.TRANSCRIPT_HEADER, [(pdf.DATA, ['Very ' * 20, '', '', '', ''])], pdf.TRANSCRIPT_COL_WIDTHS))
+        self.assertNotIsInstance(wrapped[0]._cellvalues[1][0], str)
+
+    def test_fonts_are_registered_once(self):
+        from education import pdf
+        self.assertIs(pdf.paragraph_styles(), pdf.paragraph_styles())
+        self.assertEqual(pdf.fonts.cache_info().misses, 1)
+
+
+class GradeSheetTestMixin:
+    def setUp(self):
+        User = get_user_model()
+        self.faculty = Faculty.objects.create(name='Sheet Faculty')
+        self.teacher = Teacher.objects.create(
+            user=User.objects.create_user(username='sheet_lecturer', password='testpass123'),
+            full_name='Sheet Lecturer', faculty=self.faculty, email='sheet_lecturer@example.com', degree='PhD'
+        )
+        self.discipline = Discipline.objects.create(name='Algebra', hours=120, faculty=self.faculty)
+        self.course = Course.objects.create(
+            discipline=self.discipline, teacher=self.teacher, study_year='2024-2025', semester=2,
+            start_date=timezone.now(), end_date=timezone.now()
+        )
+        self.exam = Exam.objects.create(course=self.course, date=timezone.now(), type='exam')
+        self.group = Group.objects.create(name='Group S', faculty=self.faculty)
+        self.client.login(username='sheet_lecturer', password='testpass123')
+
+    def add_students(self, count):
+        User = get_user_model()
+        start = Student.objects.count()
+        for i in range(start, start + count):
+            Student.objects.create(
+                user=User.objects.create_user(username=f'sheet_student{i}', password='x'),
+                full_name=f'Sheet Student {i}', email=f'sheet_student{i}@example.com',
+                group=self.group, faculty=self.faculty
+            )
+
+    def submit(self, points):
+        data = {'discipline': self.discipline.id, 'group': self.group.id}
+        for student in Student.objects.filter(group=self.group):
+            data[f'semester_grade_{student.id}'] = points
+            data[f'exam_grade_{student.id}'] = 30
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('education:save_grades'), data)
+        self.assertEqual(response.status_code, 302)
+        return len(queries.captured_queries)
+
+
+class SaveGradesBulkTests(GradeSheetTestMixin, TestCase):
+    def test_sheet_is_saved_in_constant_queries(self):
+        self.add_students(3)
+        small = self.submit(40)
+        Grade.objects.all().delete()
+        self.add_students(27)
+        self.assertEqual(self.submit(40), small)
+        self.assertEqual(Grade.objects.count(), 30)
+        self.assertEqual(StudentGradeSummary.objects.filter(total_count=1).count(), 30)
+
+    def test_unchanged_rows_are_not_rewritten(self):
+        self.add_students(2)
+        self.submit(40)
+        stamps = dict(Grade.objects.values_list('id', 'updated_at'))
+        first, second = Student.objects.order_by('id')
+        response = self.client.post(reverse('education:save_grades'), {
+            'discipline': self.discipline.id, 'group': self.group.id,
+            f'semester_grade_{first.id}': 50, f'exam_grade_{first.id}': 30,
+            f'semester_grade_{second.id}': 40, f'exam_grade_{second.id}': 30,
+        })
+        self.assertEqual(response.status_code, 302)
+        changed = [grade_id for grade_id, stamp in Grade.objects.values_list('id', 'updated_at') if stamp != stamps[grade_id]]
+        self.assertEqual(len(changed), 1)
+        self.assertEqual(sorted(Grade.objects.values_list('grade_value', flat=True)), [70, 80])
+
+
+class LecturerGradeSheetTests(GradeSheetTestMixin, TestCase):
+    def view_sheet(self):
+        url = reverse('education:lecturer_grades')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'discipline': self.discipline.id, 'group': self.group.id})
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries.captured_queries)
+
+    def test_sheet_is_read_in_constant_queries(self):
+        self.add_students(3)
+        self.submit(40)
+        _, small = self.view_sheet()
+        self.add_students(27)
+        self.submit(40)
+        response, large = self.view_sheet()
+        self.assertEqual(large, small)
+        self.assertEqual(len(response.context['students']), 30)
+        self.assertEqual({student.total_grade for student in response.context['students']}, {70.0})
+
+    def test_sheet_shows_latest_grade_and_lecturer_groups(self):
+        self.add_students(1)
+        student = Student.objects.get()
+        retake = Exam.objects.create(course=self.course, date=timezone.now(), type='exam')
+        Grade.objects.create(student=student, exam=self.exam, teacher=self.teacher, grade_value=65)
+        Grade.objects.create(student=student, exam=retake, teacher=self.teacher, grade_value=92)
+        other_faculty = Faculty.objects.create(name='Other Faculty')
+        Group.objects.create(name='Group X', faculty=other_faculty)
+        response, _ = self.view_sheet()
+        row = response.context['students'][0]
+        self.assertEqual((row.total_grade, row.exam_type, row.national_grade), (92.0, 'exam', '5'))
+        self.assertEqual([group.name for group in response.context['groups']], ['Group S'])
+
+    def test_viewing_sheet_does_not_create_exam(self):
+        self.exam.delete()
+        self.add_students(1)
+        response, _ = self.view_sheet()
+        self.assertFalse(Exam.objects.exists())
+        self.assertEqual(response.context['students'][0].exam_type, 'exam')
+        self.submit(40)
+        self.assertEqual(Exam.objects.get().type, 'exam')
+
+
+class QueryPlanTests(GradeSheetTestMixin, TestCase):
+    def test_hot_queries_use_indexes(self):
+        self.assertEqual(list(full_scans()), [])
+        call_command('check_query_plans', stdout=io.StringIO())
+
+    def test_full_scan_is_reported(self):
+        scans = list(full_scans([('by value', Grade.objects.filter(grade_value=70))]))
+        self.assertEqual([(name, table) for name, table, plan in scans], [('by value', 'education_grade')])
+
+    def test_one_grade_per_student_and_exam(self):
+        self.add_students(1)
+        student = Student.objects.get()
+        Grade.objects.create(student=student, exam=self.exam, teacher=self.teacher, grade_value=70)
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Grade.objects.create(student=student, exam=self.exam, teacher=self.teacher, grade_value=80)
+
+
+class SeedAndBenchmarkTests(TestCase):
+    def seed(self, **options):
+        defaults = {'faculties': 2, 'groups_per_faculty': 2, 'students_per_group': 3,
+                    'teachers_per_faculty': 2, 'grades_per_student': 4}
+        return seed_university(**{**defaults, **options})
+
+    def test_seed_is_deterministic_and_consistent(self):
+        result = self.seed()
+        self.assertEqual(result.counts['Student'], 12)
+        self.assertEqual(result.counts['Grade'], 48)
+        self.assertFalse(Exam.objects.filter(academic_year__isnull=True).exists())
+        call_command('rebuild_grade_summaries', '--check', stdout=io.StringIO())
+        values = list(Grade.objects.order_by('student__user__username', 'exam__course__discipline__name')
+                      .values_list('grade_value', flat=True))
+        Faculty.objects.all().delete()
+        get_user_model().objects.all().delete()
+        self.seed()
+        self.assertEqual(list(Grade.objects.order_by('student__user__username', 'exam__course__discipline__name')
+                              .values_list('grade_value', flat=True)), values)
+        with self.assertRaises(CommandError):
+            call_command('seed_university', stdout=io.StringIO())
+
+    def test_benchmark_writes_json_per_view(self):
+        self.seed()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.json')
+            call_command('benchmark_views', '--repeat', '1', '--output', path, stdout=io.StringIO(), stderr=io.StringIO())
+            with open(path, encoding='utf-8') as f:
+                report = json.load(f)
+        results = {result['view']: result for result in report['results']}
+        self.assertEqual(set(results), {'student_profile', 'student_grades', 'export_grades_pdf',
+                                        'lecturer_grades', 'save_grades', 'save_grade_cells', 'get_groups'})
+        self.assertEqual(results['save_grades']['status'], 302)
+        self.assertTrue(all(result['seconds'] > 0 for result in results.values()))
+        self.assertGreater(results['student_grades']['queries'], 0)
+
+
+class RequestInstrumentationTests(StudentGradesTestMixin, TestCase):
+    @override_settings(REQUEST_INSTRUMENTATION=True, REQUEST_SLOW_THRESHOLD_MS=0)
+    def test_timings_are_reported_in_header_and_log(self):
+        self.add_grades(3)
+        client = Client()
+        client.login(username='report_student', password='testpass123')
+        with self.assertLogs('education.middleware', 'WARNING') as logs:
+            response = client.get(reverse('education:student_grades'))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, app;dur=[\d.]+, total;dur=[\d.]+$')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'education:student_grades')
+        self.assertGreater(record['queries'], 0)
+        self.assertGreater(record['template_ms'], 0)
+        self.assertTrue(record['slowest_queries'])
+
+    def test_duplicate_queries_are_fingerprinted(self):
+        metrics = RequestMetrics()
+        metrics.queries = [
+            ('SELECT * FROM "education_grade" WHERE "student_id" = %s', 0.001),
+            ('SELECT * FROM "education_grade" WHERE "student_id" = %s', 0.002),
+            ('SELECT * FROM "education_exam" WHERE "id" IN (%s, %s)', 0.001),
+            ('SELECT * FROM "education_exam" WHERE "id" IN (%s, %s, %s) LIMIT 21', 0.001),
+            ('SELECT * FROM "education_course" LIMIT 21', 0.001),
+        ]
+        self.assertEqual([count for _, count in metrics.duplicates()], [2])
+        self.assertEqual(fingerprint('SELECT 1 FROM t WHERE a IN (%s, %s, %s) LIMIT 21'),
+                         'SELECT ? FROM t WHERE a IN (%s, ...) LIMIT ?')
+
+    def test_disabled_by_default(self):
+        response = self.client.get(reverse('education:student_grades'))
+        self.assertNotIn('Server-Timing', response)
+
+
+class GroupListCacheTests(TestCase):
+    def setUp(self):
+        invalidate_groups()
+        self.faculty = Faculty.objects.create(name='Cache Faculty')
+        Group.objects.create(name='C-1', faculty=self.faculty)
+        self.url = reverse('education:get_groups')
+
+    def test_groups_are_cached_and_revalidated(self):
+        response = self.client.get(self.url, {'faculty_id': self.faculty.id})
+        self.assertEqual([group['name'] for group in response.json()], ['C-1'])
+        self.assertIn('must-revalidate', response['Cache-Control'])
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {'faculty_id': self.faculty.id}, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_group_changes_invalidate_the_list(self):
+        etag = self.client.get(self.url, {'faculty_id': self.faculty.id})['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Group.objects.create(name='C-2', faculty=self.faculty)
+        response = self.client.get(self.url, {'faculty_id': self.faculty.id}, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([group['name'] for group in response.json()], ['C-1', 'C-2'])
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_faculty_id_is_validated(self):
+        self.assertEqual(self.client.get(self.url, {'faculty_id': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+
+
+class RoleBackendTests(StudentGradesTestMixin, TestCase):
+    def test_student_pages_start_with_one_auth_query(self):
+        self.add_grades(2)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('education:student_profile'))
+        self.assertContains(response, 'Report Student')
+        # Session, user with student/group/faculty joined, grade summary
+        self.assertEqual(len(queries), 3)
+        self.assertIn('"education_student"', queries[1]['sql'])
+        self.assertIn('"education_group"', queries[1]['sql'])
+
+    def test_role_is_memoized_and_enforced(self):
+        self.client.logout()
+        self.client.login(username='report_lecturer', password='testpass123')
+        response = self.client.get(reverse('education:student_grades'))
+        self.assertEqual(response.status_code, 302)
+        user = get_user_model().objects.get(username='report_lecturer')
+        self.assertEqual(user.role, 'teacher')
+        with self.assertNumQueries(0):
+            self.assertEqual(user.role, 'teacher')
+
+
+class SessionModeTests(StudentGradesTestMixin, TestCase):
+    def test_cache_sessions_skip_the_session_table(self):
+        out = io.StringIO()
+        call_command('benchmark_sessions', '--modes', 'db', 'cache', '--repeat', '1', '--json', stdout=out)
+        queries = {(result['session_mode'], result['view']): result['queries'] for result in json.loads(out.getvalue())}
+        for view in ('student_profile', 'student_grades'):
+            self.assertEqual(queries['cache', view], queries['db', view] - 1)
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cache',
+                       MESSAGE_STORAGE='django.contrib.messages.storage.cookie.CookieStorage')
+    def test_login_with_cache_sessions_writes_no_session_rows(self):
+        sessions = Session.objects.count()
+        client = Client()
+        response = client.post(reverse('education:login'), {'username': 'report_student', 'password': 'testpass123'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Session.objects.count(), sessions)
+        self.assertEqual(client.get(reverse('education:student_profile')).status_code, 200)
+
+
+class ConditionalGetTests(StudentGradesTestMixin, TestCase):
+    def revalidate(self, name, etag, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name), data or {}, headers={'If-None-Match': etag})
+        return response, len(queries)
+
+    def test_unchanged_pages_answer_304_without_running_the_report(self):
+        self.add_grades(3)
+        for name in ('education:student_grades', 'education:student_profile', 'education:export_grades_pdf'):
+            response = self.client.get(reverse(name), {'sort_type': 'asc'})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('no-cache', response['Cache-Control'])
+            response, queries = self.revalidate(name, response['ETag'], {'sort_type': 'asc'})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(queries, 2)  # session and user (with the grade summary joined)
+
+    def test_etag_varies_on_filters_and_grade_changes(self):
+        grade = self.add_grade(70)
+        etag = self.client.get(reverse('education:student_grades'))['ETag']
+        response, _ = self.revalidate('education:student_grades', etag, {'sort_type': 'desc'})
+        self.assertEqual(response.status_code, 200)
+        grade.grade_value = 75
+        grade.save()
+        response, _ = self.revalidate('education:student_grades', etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_profile_etag_moves_when_the_shown_student_data_changes(self):
+        def edits():
+            yield lambda: Student.objects.filter(pk=self.student.pk).first().save()
+            self.group.name = 'Group R2'
+            yield self.group.save
+            self.faculty.name = 'Renamed Faculty'
+            yield self.faculty.save
+            self.student.user.email = 'renamed@example.com'
+            yield self.student.user.save
+
+        etag = self.client.get(reverse('education:student_profile'))['ETag']
+        for edit in edits():
+            edit()
+            response, _ = self.revalidate('education:student_profile', etag)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+        self.assertContains(response, 'Renamed Faculty')
+
+
+class GradeTableCacheTests(StudentGradesTestMixin, TestCase):
+    def grade_queries(self, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('education:student_grades'), data or {})
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in queries.captured_queries if 'education_grade"' in query['sql']]
+
+    def test_repeated_reads_are_served_from_the_cache(self):
+        grade = self.add_grade(70)
+        response, report_sql = self.grade_queries()
+        self.assertEqual(len(report_sql), 1)
+        cached, report_sql = self.grade_queries()
+        self.assertEqual(report_sql, [])
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached.context['total_disciplines'], 1)
+        # Other filters and a new grade version miss
+        self.assertEqual(len(self.grade_queries({'sort_type': 'desc'})[1]), 1)
+        grade.grade_value = 88
+        grade.save()
+        response, report_sql = self.grade_queries()
+        self.assertEqual(len(report_sql), 1)
+        self.assertContains(response, '88.00')
+
+    def test_catalog_edits_are_not_served_from_the_cache(self):
+        grade = self.add_grade(70, exam_type='credit')
+        self.grade_queries()
+        exam = grade.exam
+        exam.type = 'exam'
+        exam.save()
+        response, report_sql = self.grade_queries()
+        self.assertEqual(len(report_sql), 1)
+        self.assertEqual(response.context['exams'], 1)
+        discipline = exam.course.discipline
+        discipline.name = 'Renamed Discipline'
+        discipline.save()
+        self.assertContains(self.grade_queries()[0], 'Renamed Discipline')
+        course = exam.course
+        course.semester = 2
+        course.save()
+        self.assertContains(self.grade_queries()[0], 'II семестр')
+
+    def test_least_recently_used_tables_are_evicted(self):
+        cache = GradeTableCache(max_bytes=3 * GradeTable('x' * 100, {}).size)
+        for key in 'abc':
+            cache.put(key, GradeTable('x' * 100, {}))
+        cache.get('a')
+        cache.put('d', GradeTable('x' * 100, {}))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(len(cache), 3)
+        self.assertLessEqual(cache.size, cache.max_bytes)
+        cache.put('e', GradeTable('x' * 10000, {}))  # larger than the whole cache
+        self.assertIsNone(cache.get('e'))
+        self.assertIsNotNone(cache.get('a'))
+
+    @override_settings(GRADE_TABLE_PREWARM='sync')
+    def test_saved_sheet_prewarms_the_default_table(self):
+        discipline = Discipline.objects.create(name='Warm Discipline', hours=90, faculty=self.faculty)
+        Course.objects.create(discipline=discipline, teacher=self.teacher, study_year='2024-2025', semester=1,
+                              start_date=timezone.now(), end_date=timezone.now())
+        lecturer = Client()
+        lecturer.login(username='report_lecturer', password='testpass123')
+        with self.captureOnCommitCallbacks(execute=True):
+            lecturer.post(reverse('education:save_grades'), {
+                'discipline': discipline.id, 'group': self.group.id,
+                f'semester_grade_{self.student.id}': 50, f'exam_grade_{self.student.id}': 35,
+            })
+        # Other processes find the table in the shared cache
+        table_cache().clear()
+        response, report_sql = self.grade_queries()
+        self.assertEqual(report_sql, [])
+        self.assertContains(response, 'Warm Discipline')
+        self.assertEqual(response.context['total_disciplines'], 1)
+
+
+class GradeSheetConflictTests(GradeSheetTestMixin, TestCase):
+    def sheet_row(self):
+        response = self.client.get(reverse('education:lecturer_grades'), {'discipline': self.discipline.id,
+                                                                          'group': self.group.id})
+        return response.context['students'][0]
+
+    def post_sheet(self, points, version):
+        student = Student.objects.get()
+        return self.client.post(reverse('education:save_grades'), {
+            'discipline': self.discipline.id, 'group': self.group.id,
+            f'semester_grade_{student.id}': points, f'exam_grade_{student.id}': 30, f'version_{student.id}': version,
+        })
+
+    def test_stale_sheet_is_shown_again_with_the_conflicting_row(self):
+        self.add_students(1)
+        self.assertEqual(self.sheet_row().grade_version, 0)
+        self.submit(40)
+        version = self.sheet_row().grade_version
+        self.assertEqual(version, 1)
+        # Another lecturer saves in between
+        grade = Grade.objects.get()
+        grade.grade_value = 95
+        grade.save()
+
+        response = self.post_sheet(50, version)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.context['conflicts'], 1)
+        row = response.context['students'][0]
+        self.assertTrue(row.conflict)
+        self.assertEqual((row.current_grade, row.submitted_total, row.grade_version), (95, 80, 2))
+        self.assertContains(response, 'name="version_%d" value="2"' % row.id, status_code=409)
+        self.assertEqual(Grade.objects.get().grade_value, 95)
+
+        # Saving the re-rendered sheet overwrites deliberately
+        self.assertEqual(self.post_sheet(50, row.grade_version).status_code, 302)
+        grade = Grade.objects.get()
+        self.assertEqual((grade.grade_value, grade.version), (80, 3))
+
+    def test_sheet_created_meanwhile_is_a_conflict(self):
+        self.add_students(1)
+        Grade.objects.create(student=Student.objects.get(), exam=self.exam, teacher=self.teacher, grade_value=75)
+        self.assertEqual(self.post_sheet(40, 0).status_code, 409)
+        self.assertEqual(Grade.objects.get().grade_value, 75)
+
+    def test_conflict_redisplays_invalid_points_of_ungraded_students_as_zero(self):
+        self.add_students(2)
+        graded, ungraded = Student.objects.order_by('id')
+        Grade.objects.create(student=graded, exam=self.exam, teacher=self.teacher, grade_value=75)
+        response = self.client.post(reverse('education:save_grades'), {
+            'discipline': self.discipline.id, 'group': self.group.id,
+            f'semester_grade_{graded.id}': 40, f'exam_grade_{graded.id}': 30, f'version_{graded.id}': 0,
+            f'semester_grade_{ungraded.id}': 'abc', f'exam_grade_{ungraded.id}': 30,
+        })
+        self.assertEqual(response.status_code, 409)
+        row = next(student for student in response.context['students'] if student.id == ungraded.id)
+        self.assertEqual((row.semester_grade, row.exam_grade), (0.0, 30.0))
+
+
+class GradeCellAutosaveTests(GradeSheetTestMixin, TestCase):
+    def autosave(self, cells, **payload):
+        payload = {'discipline': self.discipline.id, 'group': self.group.id, 'cells': cells, **payload}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('education:save_grade_cells'), json.dumps(payload),
+                                        content_type='application/json')
+        self.query_count = len(queries)
+        return response
+
+    def test_cells_are_validated_upserted_and_recomputed(self):
+        self.add_students(3)
+        first, second, third = Student.objects.order_by('id')
+        response = self.autosave([
+            {'student': first.id, 'semester_grade': 40, 'exam_grade': 30, 'version': 0},
+            {'student': second.id, 'semester_grade': 20, 'exam_grade': 30},  # below 60
+            {'student': third.id, 'semester_grade': 'x', 'exam_grade': 30},
+        ])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['cells'], [{'student': first.id, 'status': 'created', 'total_grade': 70.0,
+                                          'national_grade': '3', 'version': 1,
+                                          'semester_grade': 35.0, 'exam_grade': 35.0}])
+        self.assertEqual([error['student'] for error in data['errors']], [second.id, third.id])
+        self.assertEqual(Grade.objects.count(), 1)
+
+        cell = self.autosave([{'student': first.id, 'semester_grade': 60, 'exam_grade': 35, 'version': 1}]).json()['cells'][0]
+        self.assertEqual((cell['status'], cell['total_grade'], cell['national_grade'], cell['version']),
+                         ('updated', 95.0, '5', 2))
+        # A stale version returns the stored grade instead of overwriting it
+        cell = self.autosave([{'student': first.id, 'semester_grade': 40, 'exam_grade': 35, 'version': 1}]).json()['cells'][0]
+        self.assertEqual((cell['status'], cell['total_grade'], cell['version']), ('conflict', 95.0, 2))
+        # with the points to reload the row with, as the sheet would show them
+        self.assertEqual((cell['semester_grade'], cell['exam_grade']), (47.5, 47.5))
+        self.assertEqual(Grade.objects.get().grade_value, 95)
+
+    def test_batches_take_constant_queries(self):
+        self.add_students(20)
+        students = list(Student.objects.order_by('id'))
+
+        def cells(students):
+            return [{'student': student.id, 'semester_grade': 40, 'exam_grade': 30} for student in students]
+
+        self.autosave(cells(students[:2]))
+        small = self.query_count
+        self.autosave(cells(students[2:]))
+        self.assertEqual(self.query_count, small)
+        self.assertEqual(Grade.objects.count(), 20)
+
+    def test_invalid_requests_are_rejected(self):
+        self.add_students(1)
+        other_group = Group.objects.create(name='Group T', faculty=self.faculty)
+        self.assertEqual(self.autosave('not a list').status_code, 400)
+        self.assertEqual(self.autosave([], discipline='x').status_code, 400)
+        other_discipline = Discipline.objects.create(name='Other', hours=60, faculty=self.faculty)
+        self.assertEqual(self.autosave([], discipline=other_discipline.id).status_code, 404)
+        student = Student.objects.get()
+        data = self.autosave([{'student': student.id, 'semester_grade': 40, 'exam_grade': 30}],
+                             group=other_group.id).json()
+        self.assertEqual((data['cells'], data['errors'][0]['student']), ([], student.id))
+        self.assertEqual(self.client.get(reverse('education:save_grade_cells')).status_code, 405)
+
+    def test_batches_without_valid_cells_do_not_create_the_exam(self):
+        self.add_students(1)
+        discipline = Discipline.objects.create(name='Unexamined', hours=60, faculty=self.faculty)
+        Course.objects.create(discipline=discipline, teacher=self.teacher, study_year='2024-2025', semester=1,
+                              start_date=timezone.now(), end_date=timezone.now())
+        student = Student.objects.get()
+        data = self.autosave([{'student': student.id, 'semester_grade': 'x', 'exam_grade': 30}],
+                             discipline=discipline.id).json()
+        self.assertEqual((data['cells'], data['errors'][0]['student']), ([], student.id))
+        self.assertFalse(Exam.objects.filter(course__discipline=discipline).exists())
+
+
+class GradeImportTests(GradeSheetTestMixin, TestCase):
+    def csv_text(self, rows):
+        return '\n'.join(['student,discipline,semester_grade,exam_grade', *(','.join(map(str, row)) for row in rows)]) + '\n'
+
+    def upload(self, rows):
+        upload = SimpleUploadedFile('grades.csv', self.csv_text(rows).encode(), content_type='text/csv')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('education:import_grades'), {'file': upload})
+        self.query_count = len(queries)
+        return response
+
+    def test_command_imports_valid_rows_and_reports_the_rest(self):
+        self.add_students(3)
+        first, second, third = Student.objects.order_by('id')
+        rows = [
+            (first.email.upper(), 'algebra', 40, 30),
+            (second.id, self.discipline.id, 50, 45),
+            ('nobody@example.com', self.discipline.id, 40, 30),
+            (third.id, 'Geometry', 40, 30),
+            (third.id, self.discipline.id, 20, 30),
+            (third.id, self.discipline.id, 'x', 30),
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'grades.csv')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(self.csv_text(rows))
+            out = io.StringIO()
+            call_command('import_grades', path, '--teacher', 'sheet_lecturer', '--chunk-size', '1', stdout=out)
+            self.assertEqual([line.split(':')[0] for line in out.getvalue().splitlines()[:-1]],
+                             ['line 4', 'line 5', 'line 6', 'line 7'])
+            self.assertIn('6 rows', out.getvalue())
+            self.assertEqual({grade.student_id: grade.grade_value for grade in Grade.objects.filter(exam=self.exam)},
+                             {first.id: 70, second.id: 95})
+
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(self.csv_text([(first.id, 'Algebra', 45, 30), (second.id, 'Algebra', 50, 45)]))
+            out = io.StringIO()
+            call_command('import_grades', path, '--teacher', 'sheet_lecturer', stdout=out)
+            self.assertIn('0 created, 1 updated, 1 unchanged, 0 rejected', out.getvalue())
+        self.assertEqual(Grade.objects.get(student=first).grade_value, 75)
+
+    def test_upload_takes_constant_queries(self):
+        self.add_students(20)
+        students = list(Student.objects.order_by('id'))
+        response = self.upload([(student.id, 'Algebra', 40, 30) for student in students[:2]])
+        self.assertEqual(response.json()['created'], 2)
+        small = self.query_count
+        response = self.upload([(student.id, 'Algebra', 40, 30) for student in students[2:]])
+        self.assertEqual(response.json()['created'], 18)
+        self.assertEqual(self.query_count, small)
+
+    def test_upload_needs_the_columns(self):
+        upload = SimpleUploadedFile('grades.csv', b'student,grade\n1,70\n', content_type='text/csv')
+        response = self.client.post(reverse('education:import_grades'), {'file': upload})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('discipline', response.json()['error'])
+
+
+class GradeExportTests(StudentGradesTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        get_user_model().objects.create_user(username='registrar', password='testpass123', is_staff=True)
+        self.client.login(username='registrar', password='testpass123')
+
+    def export(self, export_format, data):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(f'education:export_grades_{export_format}'), data)
+            self.assertTrue(response.streaming)
+            pieces = iter(response.streaming_content)
+            first = next(pieces)
+            # The first bytes are out before the grade query has run
+            self.assertFalse([query for query in queries if 'education_grade' in query['sql']])
+            body = (first + b''.join(pieces)).decode()
+        self.query_count = len(queries)
+        return response, body
+
+    def test_csv_export_streams_the_selected_grades(self):
+        first = self.add_grade(70)
+        second = self.add_grade(85, semester=2)
+        other_group = Group.objects.create(name='Group Q', faculty=self.faculty)
+        # Exports follow the student's current group
+        Student.objects.filter(pk=self.student.pk).update(group=other_group)
+        self.add_grade(90)
+
+        response, body = self.export('csv', {'group': self.group.id})
+        self.assertEqual(list(csv.reader(io.StringIO(body))), [[column for column, _ in EXPORT_COLUMNS]])
+        response, body = self.export('csv', {'group': other_group.id, 'faculty': self.faculty.id})
+        self.assertEqual(response['Content-Disposition'],
+                         f'attachment; filename="grades-faculty-{self.faculty.id}-group-{other_group.id}.csv"')
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual([int(row['grade_id']) for row in rows][:2], [first.id, second.id])
+        self.assertEqual((rows[0]['student_email'], rows[0]['group'], rows[0]['grade']),
+                         ('report_student@example.com', 'Group Q', '70.00'))
+
+    def test_json_export_by_academic_year_in_constant_queries(self):
+        self.add_grade(70)
+        later = self.add_grade(80, date=datetime(2026, 3, 1, tzinfo=dt_timezone.utc))
+        _, body = self.export('json', {'academic_year': 2025})
+        self.assertEqual([row['grade_id'] for row in json.loads(body)], [later.id])
+        few = self.query_count
+        for _ in range(30):
+            self.add_grade(75)
+        _, body = self.export('json', {})
+        self.assertEqual(len(json.loads(body)), 32)
+        self.assertEqual(self.query_count, few)
+
+    def test_export_is_for_staff_with_valid_filters(self):
+        self.assertEqual(self.client.get(reverse('education:export_grades_csv'), {'faculty': 'x'}).status_code, 400)
+        self.client.login(username='report_student', password='testpass123')
+        self.assertEqual(self.client.get(reverse('education:export_grades_csv')).status_code, 302)
+
+
+class RosterProvisioningTests(TestCase):
+    def setUp(self):
+        self.faculty = Faculty.objects.create(name='Roster Faculty')
+        self.group = Group.objects.create(name='R-1', faculty=self.faculty)
+        Group.objects.create(name='R-2', faculty=self.faculty)
+        get_user_model().objects.create_user(username='taken', email='taken@example.com', password='x')
+
+    def provision(self, lines, *options):
+        with tempfile.TemporaryDirectory() as directory:
+            roster, credentials = os.path.join(directory, 'roster.csv'), os.path.join(directory, 'credentials.csv')
+            with open(roster, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+            out = io.StringIO()
+            call_command('provision_roster', roster, '--credentials', credentials, *options, stdout=out)
+            self.assertEqual(os.stat(credentials).st_mode & 0o777, 0o600)
+            with open(credentials, newline='', encoding='utf-8') as f:
+                return out.getvalue(), list(csv.DictReader(f))
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_command_creates_students_and_writes_their_credentials(self):
+        output, credentials = self.provision([
+            'full_name,email,faculty,group,username',
+            'Ivan Petrenko,Ivan@Example.com,Roster Faculty,R-1,',
+            f'Olena Koval,olena@example.com,{self.faculty.id},r-2,okoval',
+            'Nobody,nobody@example.com,Missing Faculty,R-1,',
+            'No Group,nogroup@example.com,Roster Faculty,R-9,',
+            'Again,ivan@example.com,Roster Faculty,R-1,',
+            'Taken,taken@example.com,Roster Faculty,R-1,',
+            'Bad Email,not-an-email,Roster Faculty,R-1,',
+            f'Petro Bondar,petro@example.com,Roster Faculty,{self.group.id},',
+        ], '--workers', '2', '--chunk-size', '2', '--study-year', '2025-2026')
+        self.assertEqual([line.split(':')[0] for line in output.splitlines()[:-1]],
+                         ['line 4', 'line 5', 'line 6', 'line 7', 'line 8'])
+        self.assertIn('8 rows', output)
+        self.assertEqual([row['username'] for row in credentials], ['ivan@example.com', 'okoval', 'petro@example.com'])
+        for row in credentials:
+            student = Student.objects.select_related('user', 'group').get(email=row['email'])
+            self.assertTrue(student.user.check_password(row['password']))
+            self.assertTrue(student.user.is_active)
+            self.assertEqual((student.user.username, student.group.name, student.study_year, student.faculty),
+                             (row['username'], row['group'], '2025-2026', self.faculty))
+        self.assertEqual(Student.objects.count(), 3)
+
+    def test_command_needs_the_columns(self):
+        with self.assertRaisesMessage(CommandError, 'faculty, group'):
+            self.provision(['full_name,email', 'Ivan Petrenko,ivan@example.com'], '--workers', '1')
+        self.assertFalse(Student.objects.exists())
+
+
+class AdminChangelistTests(StudentGradesTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(get_user_model().objects.create_superuser(username='admin', password='x'))
+
+    def add_registrations(self, count):
+        User = get_user_model()
+        start = PendingRegistration.objects.count()
+        for i in range(start, start + count):
+            group = Group.objects.create(name=f'Pending Group {i}', faculty=self.faculty)
+            PendingRegistration.objects.create(user=User.objects.create_user(username=f'pending{i}', password='x'),
+                                               requested_faculty=self.faculty, requested_group=group)
+
+    def admin_query_counts(self):
+        counts = {model: self.count_queries('get', reverse(f'admin:education_{model}_changelist'))
+                  for model in ('grade', 'student', 'exam', 'course', 'group', 'pendingregistration')}
+        for field in ('student', 'exam', 'teacher'):
+            counts[field] = self.count_queries('get', reverse('admin:autocomplete'), {
+                'app_label': 'education', 'model_name': 'grade', 'field_name': field,
+            })
+        return counts
+
+    def test_changelists_and_autocompletes_take_constant_queries(self):
+        self.add_grades(2)
+        self.add_registrations(1)
+        small = self.admin_query_counts()
+        self.add_grades(10)
+        self.add_registrations(5)
+        other_group = Group.objects.create(name='Group Q', faculty=self.faculty)
+        for i in range(5):
+            Student.objects.create(user=get_user_model().objects.create_user(username=f'admin_student{i}', password='x'),
+                                   full_name=f'Admin Student {i}', email=f'admin_student{i}@example.com',
+                                   group=other_group, faculty=self.faculty)
+        self.assertEqual(self.admin_query_counts(), small)
+
+    def test_unfiltered_grade_count_comes_from_table_statistics(self):
+        self.add_grades(3)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(estimated_row_count(Grade), 3)
+        Grade.objects.filter(pk=Grade.objects.order_by('pk').first().pk).delete()
+        url = reverse('admin:education_grade_changelist')
+        with mock.patch('education.admin.ESTIMATED_COUNT_THRESHOLD', 0):
+            # The statistics are stale until the next ANALYZE; filtered lists are counted
+            self.assertEqual(self.client.get(url).context['cl'].result_count, 3)
+            self.assertEqual(self.client.get(url, {'exam__type__exact': 'credit'}).context['cl'].result_count, 1)
+        self.assertEqual(self.client.get(url).context['cl'].result_count, 2)
+
+
+class RegistrationDecisionTests(TestCase):
+    def setUp(self):
+        self.faculty = Faculty.objects.create(name='Enrolment Faculty')
+        self.group = Group.objects.create(name='E-1', faculty=self.faculty)
+        self.other_group = Group.objects.create(name='E-2', faculty=self.faculty)
+
+    def register(self, count, domain='knu.ua', group=None, role='student'):
+        """Pending registrations of ``count`` new inactive users, as made by the registration form."""
+        User = get_user_model()
+        start = User.objects.count()
+        for i in range(start, start + count):
+            email = f'applicant{i}@{domain}'
+            user = User.objects.create_user(username=f'applicant{i}', email=email, is_active=False)
+            if role == 'student':
+                Student.objects.create(user=user, full_name=f'Applicant {i}', email=email,
+                                       group=group or self.group, faculty=self.faculty)
+            else:
+                Teacher.objects.create(user=user, full_name=f'Applicant {i}', email=email, degree='PhD',
+                                       faculty=self.faculty)
+            PendingRegistration.objects.create(user=user, requested_faculty=self.faculty,
+                                               requested_group=(group or self.group) if role == 'student' else None)
+
+    def assertDecided(self, registrations, status, active, created_by):
+        for registration in registrations:
+            registration.refresh_from_db()
+            registration.user.refresh_from_db()
+            account = getattr(registration.user, 'student', None) or registration.user.teacher
+            account.refresh_from_db()
+            self.assertEqual((registration.status, registration.user.is_active, account.created_by_admin_id),
+                             (status, active, created_by))
+
+    def test_command_approves_filtered_registrations_in_constant_queries(self):
+        self.register(2)
+        self.register(1, role='teacher')
+        self.register(2, domain='gmail.com')
+        with CaptureQueriesContext(connection) as queries:
+            call_command('approve_registrations', '--email-domain', 'KNU.ua', stdout=io.StringIO())
+        small = len(queries)
+        self.assertDecided(PendingRegistration.objects.filter(user__email__endswith='knu.ua'), 'Approved', True, 'System')
+        self.assertDecided(PendingRegistration.objects.filter(user__email__endswith='gmail.com'), 'Pending', False, 'Pending')
+
+        self.register(20)
+        out = io.StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('approve_registrations', '--email-domain', 'knu.ua', '--decided-by', 'registrar', stdout=out)
+        self.assertEqual(len(queries), small)
+        self.assertIn('20 approved, 0 rejected', out.getvalue())
+        self.assertEqual(Student.objects.filter(created_by_admin_id='registrar').count(), 20)
+
+    def test_command_rejects_and_auto_approves_by_rules(self):
+        self.register(2, domain='gmail.com')
+        self.register(2, domain='gmail.com', group=self.other_group)
+        self.register(1, domain='knu.ua', group=self.other_group)
+        call_command('approve_registrations', '--group', str(self.group.id), '--reject', stdout=io.StringIO())
+        self.assertEqual(PendingRegistration.objects.filter(status='Rejected').count(), 2)
+        self.assertFalse(get_user_model().objects.filter(pendingregistration__status='Rejected', is_active=True).exists())
+
+        with override_settings(REGISTRATION_AUTO_APPROVE_RULES=f'group={self.group.id};email_domain=knu.ua'):
+            out = io.StringIO()
+            call_command('approve_registrations', '--auto', '--rule', f'faculty={self.faculty.id},group={self.other_group.id}',
+                         '--chunk-size', '1', stdout=out)
+        # Rejected registrations stay rejected; both rules match the knu.ua registration, which is approved once
+        self.assertIn('3 approved, 0 rejected', out.getvalue())
+        self.assertEqual(PendingRegistration.objects.filter(status='Approved').count(), 3)
+        with self.assertRaisesMessage(CommandError, 'Invalid approval rule'):
+            call_command('approve_registrations', '--auto', '--rule', 'campus=1')
+        with self.assertRaises(CommandError):
+            call_command('approve_registrations')
+
+    def test_failed_chunk_leaves_no_half_approved_accounts(self):
+        self.register(1, role='teacher')
+        self.register(1, role='teacher')
+        update_teachers = Teacher.objects.filter
+        calls = []
+
+        def fail_second_chunk(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 2:
+                raise DatabaseError('connection lost')
+            return update_teachers(*args, **kwargs)
+
+        with mock.patch.object(Teacher.objects, 'filter', side_effect=fail_second_chunk):
+            with self.assertRaises(DatabaseError):
+                call_command('approve_registrations', '--all', '--chunk-size', '1', stdout=io.StringIO())
+        first, second = PendingRegistration.objects.order_by('pk')
+        self.assertDecided([first], 'Approved', True, 'System')
+        self.assertDecided([second], 'Pending', False, 'Pending')
+
+    def test_admin_actions_decide_selected_registrations(self):
+        self.register(3)
+        first, second, third = PendingRegistration.objects.order_by('pk')
+        self.client.force_login(get_user_model().objects.create_superuser(username='registrar', password='x'))
+        url = reverse('admin:education_pendingregistration_changelist')
+        response = self.client.post(url, {'action': 'approve_registrations', '_selected_action': [first.pk, second.pk]},
+                                    follow=True)
+        self.assertContains(response, '2 approved, 0 rejected')
+        self.client.post(url, {'action': 'reject_registrations', '_selected_action': [second.pk, third.pk]})
+        self.assertDecided([first, second], 'Approved', True, 'registrar')
+        self.assertDecided([third], 'Rejected', False, 'Pending')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite only')
+class SQLiteBackendTests(SimpleTestCase):
+    def open_connection(self, path, **options):
+        options = {**settings.SQLITE_PRODUCTION_OPTIONS, **options}
+        settings_dict = {**connection.settings_dict, 'NAME': path, 'OPTIONS': options}
+        return SQLiteDatabaseWrapper(settings_dict, alias='load')
+
+    def test_new_connections_get_the_pragmas(self):
+        with tempfile.TemporaryDirectory() as directory:
+            wrapper = self.open_connection(os.path.join(directory, 'db.sqlite3'))
+            try:
+                with wrapper.cursor() as cursor:
+                    pragmas = {}
+                    for name in ('journal_mode', 'synchronous', 'busy_timeout', 'temp_store'):
+                        cursor.execute(f'PRAGMA {name}')
+                        pragmas[name] = cursor.fetchone()[0]
+            finally:
+                wrapper.close()
+        # synchronous=NORMAL is 1, temp_store=MEMORY is 2
+        self.assertEqual(pragmas, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 5000, 'temp_store': 2})
+
+    def test_transactions_begin_immediate_and_retry_while_locked(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'db.sqlite3')
+            writer = sqlite3.connect(path, isolation_level=None, timeout=0)
+            writer.execute('PRAGMA journal_mode = WAL')
+            writer.execute('CREATE TABLE t (x)')
+            wrapper = connections['load'] = self.open_connection(path, pragmas={'busy_timeout': 0},
+                                                                 begin_attempts=2)
+            try:
+                writer.execute('BEGIN IMMEDIATE')
+                with mock.patch('education.sqlite_backend.base.time.sleep') as sleep:
+                    with self.assertRaisesMessage(OperationalError, 'locked'):
+                        with transaction.atomic(using='load'):
+                            pass
+                self.assertEqual(sleep.call_count, 1)
+                writer.execute('COMMIT')
+                with transaction.atomic(using='load'):
+                    # The write lock is taken at BEGIN, so another writer cannot start
+                    with self.assertRaises(sqlite3.OperationalError):
+                        writer.execute('BEGIN IMMEDIATE')
+            finally:
+                wrapper.close()
+                del connections['load']
+                writer.close()
+
+
+@skipUnless(connection.vendor == 'sqlite', 'The replica is made as a copy of the SQLite test database')
+class ReplicaRoutingTests(StudentGradesTestMixin, TransactionTestCase):
+    """The replica is a second SQLite file that sync_replica() makes a copy of the primary."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        connections.settings['replica'] = {**connections.settings['default'],
+                                           'NAME': os.path.join(cls.directory.name, 'replica.sqlite3')}
+        # Declared only now: the test runner sets up (and checks) the aliases of settings.DATABASES
+        cls.databases = {'default', 'replica'}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        cls.directory.cleanup()
+
+    def sync_replica(self):
+        connections['replica'].close()
+        source = connections['default']
+        source.ensure_connection()
+        target = sqlite3.connect(connections.settings['replica']['NAME'])
+        try:
+            source.connection.backup(target)
+        finally:
+            target.close()
+
+    def get(self, name, data=None):
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            with CaptureQueriesContext(connection) as primary_queries:
+                response = self.client.get(reverse(f'education:{name}'), data)
+        self.assertEqual(response.status_code, 200)
+        self.replica_queries, self.primary_queries = replica_queries, primary_queries
+        return response
+
+    def test_student_read_views_read_from_the_replica(self):
+        self.add_grade(75)
+        self.sync_replica()
+        Grade.objects.update(grade_value=95)
+        # The replica lags behind: the page shows its grade, and only session and user lookups hit the primary
+        response = self.get('student_grades')
+        self.assertContains(response, '75.00')
+        self.assertNotContains(response, '95.00')
+        self.assertFalse([query for query in self.primary_queries if 'education_grade' in query['sql']])
+        for name, data in (('student_profile', None), ('export_grades_pdf', None),
+                           ('get_groups', {'faculty_id': self.faculty.id})):
+            self.get(name, data)
+            self.assertTrue(self.replica_queries, name)
+        self.assertNotIn(PIN_COOKIE, self.client.cookies)
+
+    def test_lagging_replica_pages_are_cached_under_the_replica_version(self):
+        grade = self.add_grade(75)
+        self.sync_replica()
+        grade.grade_value = 95
+        grade.save()
+        stale = self.get('student_grades')
+        self.assertContains(stale, '75.00')
+        # Once the replica catches up, neither the cached table nor the ETag of the old rows is served
+        self.sync_replica()
+        response = self.client.get(reverse('education:student_grades'), headers={'If-None-Match': stale['ETag']})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '95.00')
+
+    @override_settings(PDF_EXPORT_MODE='background', DATABASE_REPLICA_LAG_SECONDS=30)
+    def test_own_writes_pin_reads_to_the_primary(self):
+        self.add_grade(75)
+        self.sync_replica()
+        # Queueing a transcript writes, so the user reads from the primary for the lag window
+        response = self.client.post(reverse('education:export_grades_pdf'))
+        self.assertEqual(response.status_code, 202)
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 30)
+        self.get('student_grades')
+        self.assertFalse(self.replica_queries)
+        self.client.cookies[PIN_COOKIE] = '0'
+        table_cache().clear()
+        cache.clear()
+        self.get('student_grades')
+        self.assertTrue(self.replica_queries)
+
+    def test_reads_after_a_write_in_the_same_request_use_the_primary(self):
+        self.sync_replica()
+        state = RoutingState()
+        state.replica_reads = True
+        token = replica_state.set(state)
+        try:
+            student = Student.objects.get(pk=self.student.pk)
+            self.assertEqual(student._state.db, 'replica')
+            student.full_name = 'Renamed Student'
+            # Saved to the primary even though it was read from the replica
+            student.save(update_fields=['full_name'])
+            self.assertEqual(Student.objects.get(pk=self.student.pk)._state.db, 'default')
+        finally:
+            replica_state.reset(token)
+        self.assertEqual(Student.objects.get(pk=self.student.pk).full_name, 'Renamed Student')
+        self.assertEqual(Student.objects.using('replica').get(pk=self.student.pk).full_name, 'Report Student')
+
+
+class ConcurrentGradeSaveTests(GradeSheetTestMixin, TransactionTestCase):
+    def test_concurrent_saves_lose_no_updates(self):
+        self.add_students(1)
+        student = Student.objects.get()
+        Grade.objects.create(student=student, exam=self.exam, teacher=self.teacher, grade_value=60)
+        lecturers, increments = 4, 5
+        # The shared-cache SQLite test database fails concurrent transactions instead of waiting,
+        # so there each database call takes its turn; sheets still go stale between read and save
+        turn = threading.Lock() if connection.vendor == 'sqlite' else contextlib.nullcontext()
+        first_read = threading.Barrier(lecturers, timeout=30)
+        conflicts = []
+        errors = []
+
+        def lecturer(number):
+            # Lecturers add different amounts, so no two saves write the same value
+            step = Decimal('0.01') * (number + 1)
+            try:
+                with turn:
+                    grade = Grade.objects.get(exam=self.exam, student=student)
+                first_read.wait()  # everyone starts from the same version
+                for _ in range(increments):
+                    # Add a step and save with the version read; reread and retry when another lecturer won
+                    while True:
+                        with turn:
+                            result = save_grade_sheet(self.teacher, self.exam, {student.id: grade.grade_value + step},
+                                                      {student.id: grade.version})
+                        if result.updated:
+                            grade.grade_value += step
+                            grade.version += 1
+                            break
+                        conflicts.extend(result.conflicts)
+                        with turn:
+                            grade = Grade.objects.get(exam=self.exam, student=student)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=lecturer, args=(number,)) for number in range(lecturers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        grade = Grade.objects.get()
+        self.assertEqual(grade.grade_value, 60 + increments * Decimal('0.01') * sum(range(1, lecturers + 1)))
+        self.assertEqual(grade.version, 1 + lecturers * increments)
+        # The first round alone makes all but one lecturer conflict
+        self.assertGreaterEqual(len(conflicts), lecturers - 1)
+        self.assertEqual(set(conflicts), {student.id})
+
+
+@skipUnless(connection.vendor == 'sqlite', 'The shards are made as copies of the SQLite test database')
+class ShardingTests(TransactionTestCase):
+    """Two shards besides the default database: SQLite files copied from the empty test database."""
+
+    SHARDS = ('shard1', 'shard2')
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        source = connections['default']
+        source.ensure_connection()
+        for alias in cls.SHARDS:
+            name = os.path.join(cls.directory.name, f'{alias}.sqlite3')
+            connections.settings[alias] = {**connections.settings['default'], 'NAME': name}
+            target = sqlite3.connect(name)
+            try:
+                source.connection.backup(target)
+            finally:
+                target.close()
+        cls.shard_settings = override_settings(DATABASE_SHARDS=['default', *cls.SHARDS])
+        cls.shard_settings.enable()
+        # Declared only now: the test runner sets up (and checks) the aliases of settings.DATABASES
+        cls.databases = {'default', *cls.SHARDS}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.shard_settings.disable()
+        for alias in cls.SHARDS:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        cls.directory.cleanup()
+
+    def setUp(self):
+        table_cache().clear()
+        cache.clear()
+        for alias in self.SHARDS:
+            reserve_id_block(alias)
+        self.faculty = Faculty.objects.create(name='Shard One Faculty')
+        self.other_faculty = Faculty.objects.create(name='Shard Two Faculty')
+        FacultyShard.objects.create(faculty=self.faculty, alias='shard1')
+        FacultyShard.objects.create(faculty=self.other_faculty, alias='shard2')
+        reload_faculty_shards()
+        self.student, self.grade = self.add_student(self.faculty, 'one', 87)
+        self.other_student, self.other_grade = self.add_student(self.other_faculty, 'two', 64)
+
+    def tearDown(self):
+        reload_faculty_shards()
+
+    def add_student(self, faculty, name, grade_value):
+        User = get_user_model()
+        with use_faculty(faculty.pk):
+            group = Group.objects.create(name=f'Group {name}', faculty=faculty)
+            student = Student.objects.create(
+                user=User.objects.create_user(username=f'student_{name}', password='testpass123'),
+                full_name=f'Student {name}', email=f'student_{name}@example.com', group=group, faculty=faculty,
+            )
+            teacher = Teacher.objects.create(
+                user=User.objects.create_user(username=f'lecturer_{name}', password='testpass123'),
+                full_name=f'Lecturer {name}', email=f'lecturer_{name}@example.com', faculty=faculty, degree='PhD',
+            )
+            discipline = Discipline.objects.create(name=f'Discipline {name}', hours=90, faculty=faculty)
+            course = Course.objects.create(discipline=discipline, teacher=teacher, study_year='2024-2025',
+                                           semester=1, start_date=timezone.now(), end_date=timezone.now())
+            exam = Exam.objects.create(course=course, date=datetime(2024, 12, 1, tzinfo=dt_timezone.utc),
+                                       type='exam')
+            grade = Grade.objects.create(student=student, exam=exam, teacher=teacher, grade_value=grade_value)
+        return student, grade
+
+    def test_faculty_rows_live_on_the_faculty_shard(self):
+        self.assertEqual(self.student._state.db, 'shard1')
+        self.assertFalse(Student.objects.using('default').exists())
+        self.assertEqual(Student.objects.using('shard1').get().pk, self.student.pk)
+        self.assertEqual(Grade.objects.using('shard2').get().pk, self.other_grade.pk)
+        # Ids come from each shard's own block
+        self.assertGreater(self.student.pk, ID_BLOCK)
+        self.assertGreater(self.other_grade.pk, 2 * ID_BLOCK)
+        self.assertEqual(StudentGradeSummary.objects.using('shard1').get().total_count, 1)
+        # Related objects are read from the shard of the object they are reached through
+        self.assertEqual(Student.objects.using('shard1').get().group.name, 'Group one')
+        # Users and faculties are copied to every shard, also when they change
+        user = self.student.user
+        user.full_name = 'Renamed'
+        user.save()
+        for alias in ('shard1', 'shard2'):
+            self.assertEqual(get_user_model().objects.using(alias).get(pk=user.pk).full_name, 'Renamed')
+            self.assertEqual(Faculty.objects.using(alias).count(), 2)
+
+    def test_student_pages_read_the_faculty_shard(self):
+        self.client.login(username='student_one', password='testpass123')
+        self.assertEqual(self.client.session[SHARD_SESSION_KEY], self.faculty.pk)
+        with CaptureQueriesContext(connections['shard1']) as shard_queries:
+            with CaptureQueriesContext(connection) as default_queries:
+                response = self.client.get(reverse('education:student_grades'))
+        self.assertContains(response, '87.00')
+        self.assertNotContains(response, '64.00')
+        self.assertTrue(shard_queries.captured_queries)
+        self.assertFalse([query for query in default_queries if 'education_' in query['sql']])
+
+    def test_registration_and_approval_use_the_faculty_shard(self):
+        response = self.client.post(reverse('education:register'), {
+            'username': 'newcomer', 'email': 'newcomer@example.com', 'password': 'testpass123',
+            'full_name': 'New Comer', 'role': 'Student', 'faculty_id': self.other_faculty.pk,
+            'group_id': self.other_student.group_id,
+        })
+        self.assertRedirects(response, reverse('education:register'))
+        self.assertTrue(Student.objects.using('shard2').filter(email='newcomer@example.com').exists())
+        self.assertEqual(PendingRegistration.objects.using('shard2').get().requested_faculty, self.other_faculty)
+
+        call_command('approve_registrations', '--all', stdout=io.StringIO())
+        self.assertEqual(PendingRegistration.objects.using('shard2').get().status, 'Approved')
+        for alias in ('default', 'shard2'):
+            self.assertTrue(get_user_model().objects.using(alias).get(username='newcomer').is_active)
+
+    def failing(self, model, method, using=None):
+        original = getattr(QuerySet, method)
+
+        def fail(queryset, *args, **kwargs):
+            if queryset.model is model and using in (None, queryset.db):
+                raise IntegrityError(f'{model._meta.db_table} write failed')
+            return original(queryset, *args, **kwargs)
+        return mock.patch.object(QuerySet, method, fail)
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_roster_users_are_rolled_back_with_their_students(self):
+        with tempfile.TemporaryDirectory() as directory:
+            roster = os.path.join(directory, 'roster.csv')
+            with open(roster, 'w', encoding='utf-8') as f:
+                f.write(f'full_name,email,faculty,group\nIvan Petrenko,ivan@example.com,{self.faculty.pk},Group one\n')
+            with self.failing(Student, 'bulk_create'), self.assertRaises(IntegrityError):
+                call_command('provision_roster', roster, '--workers', '1', '--credentials',
+                             os.path.join(directory, 'credentials.csv'), stdout=io.StringIO())
+        for alias in ('default', *self.SHARDS):
+            self.assertFalse(get_user_model().objects.using(alias).filter(email='ivan@example.com').exists())
+
+    def test_approval_is_rolled_back_on_every_shard(self):
+        user = self.student.user
+        get_user_model().objects.filter(pk=user.pk).update(is_active=False)
+        with use_faculty(self.faculty.pk):
+            PendingRegistration.objects.create(user=user, requested_faculty=self.faculty)
+        with self.failing(Student, 'update'), self.assertRaises(IntegrityError):
+            call_command('approve_registrations', '--all', stdout=io.StringIO())
+        self.assertFalse(get_user_model().objects.get(pk=user.pk).is_active)
+        self.assertEqual(PendingRegistration.objects.using('shard1').get().status, 'Pending')
+
+    def test_replica_serves_the_reads_routed_to_default(self):
+        router = ShardRouter()
+        state = RoutingState()
+        state.replica_reads = True
+        token = replica_state.set(state)
+        try:
+            with use_shard('default'):
+                self.assertEqual(router.db_for_read(Student), 'replica')
+                self.assertEqual(router.db_for_read(get_user_model()), 'replica')
+            with use_shard('shard1'):
+                # The replica only copies default
+                self.assertEqual(router.db_for_read(Student), 'shard1')
+                self.assertEqual(router.db_for_read(get_user_model()), 'shard1')
+                self.assertEqual(router.db_for_write(Student), 'shard1')
+            self.assertTrue(state.wrote)
+            with use_shard('default'):
+                self.assertEqual(router.db_for_read(Student), 'default')
+        finally:
+            replica_state.reset(token)
+
+    def test_transcript_worker_serves_every_shard(self):
+        from education.reports import GradeFilters
+        from education.transcripts import enqueue_transcript, evict_transcripts
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        with use_faculty(self.faculty.pk):
+            job = enqueue_transcript(self.student, GradeFilters.from_data({}))
+        out = io.StringIO()
+        # Outside a request, as the worker runs: no shard is pinned
+        with override_settings(TRANSCRIPT_CACHE_DIR=cache_dir.name):
+            contextvars.Context().run(call_command, 'run_transcript_worker', '--once', stdout=out)
+        self.assertIn('Processed 1 transcript jobs', out.getvalue())
+        self.assertEqual(TranscriptJob.objects.using('shard1').get(pk=job.pk).status, 'done')
+
+        with use_faculty(self.faculty.pk):
+            self.grade.grade_value = 90
+            self.grade.save()
+        self.assertEqual(contextvars.Context().run(evict_transcripts), 1)
+        self.assertFalse(TranscriptJob.objects.using('shard1').exists())
+
+    def test_summaries_are_checked_and_rebuilt_on_every_shard(self):
+        StudentGradeSummary.objects.using('shard2').filter(student=self.other_student).update(total_count=5)
+        with self.assertRaisesMessage(CommandError, '1 inconsistent'):
+            contextvars.Context().run(call_command, 'rebuild_grade_summaries', '--check',
+                                      stdout=io.StringIO(), stderr=io.StringIO())
+        out = io.StringIO()
+        contextvars.Context().run(call_command, 'rebuild_grade_summaries', stdout=out)
+        self.assertIn('for 2 students', out.getvalue())
+        self.assertEqual(StudentGradeSummary.objects.using('shard2').get().total_count, 1)
+
+    def test_exports_merge_every_shard(self):
+        rows = list(export_rows(ExportFilters()))
+        self.assertEqual([row[0] for row in rows], [self.grade.pk, self.other_grade.pk])
+        self.assertEqual([row[5] for row in rows], ['Shard One Faculty', 'Shard Two Faculty'])
+        self.assertEqual(len(list(export_rows(ExportFilters(faculty=self.other_faculty.pk)))), 1)
+
+    def test_admin_change_page_finds_objects_on_any_shard(self):
+        self.client.force_login(get_user_model().objects.create_superuser(username='admin', password='x'))
+        response = self.client.get(reverse('admin:education_student_change', args=[self.other_student.pk]))
+        self.assertContains(response, 'Student two')
+        response = self.client.get(reverse('admin:education_student_changelist'), {'shard': 'shard1'})
+        self.assertContains(response, 'Student one')
+        self.assertNotContains(response, 'Student two')
+
+    def test_move_faculty_moves_its_rows_and_keeps_their_ids(self):
+        updated_at = Grade.objects.using('shard1').get().updated_at
+        out = io.StringIO()
+        call_command('move_faculty', self.faculty.pk, 'shard2', stdout=out)
+        self.assertIn('education_grade: 1', out.getvalue())
+        self.assertFalse(Student.objects.using('shard1').exists())
+        moved = Grade.objects.using('shard2').get(pk=self.grade.pk)
+        self.assertEqual(moved.updated_at, updated_at)
+        self.assertEqual(StudentGradeSummary.objects.using('shard2').get(student_id=self.student.pk).total_count, 1)
+        self.assertEqual(FacultyShard.objects.get(faculty=self.faculty).alias, 'shard2')
+
+        self.client.login(username='student_one', password='testpass123')
+        self.assertContains(self.client.get(reverse('education:student_grades')), '87.00')
+        with self.assertRaisesMessage(CommandError, 'already on shard2'):
+            call_command('move_faculty', self.faculty.pk, 'shard2')
+
+    def test_interrupted_moves_are_finished_by_a_rerun(self):
+        # Copied, but not mapped to the target: the copies are replaced
+        with self.failing(FacultyShard, 'update_or_create'), self.assertRaises(IntegrityError):
+            move_faculty(self.faculty.pk, 'shard2')
+        self.assertTrue(Grade.objects.using('shard2').filter(pk=self.grade.pk).exists())
+        result = move_faculty(self.faculty.pk, 'shard2')
+        self.assertEqual((result.rows['education_grade'], result.cleaned), (1, ['shard2']))
+        self.assertFalse(Grade.objects.using('shard1').exists())
+        self.assertEqual(Grade.objects.using('shard2').filter(student=self.student).count(), 1)
+
+        # Mapped to the target, but not deleted from the source: the rerun deletes them
+        with self.failing(Student, 'delete', using='shard2'), self.assertRaises(IntegrityError):
+            move_faculty(self.faculty.pk, 'default')
+        self.assertFalse(FacultyShard.objects.filter(faculty=self.faculty).exists())
+        self.assertTrue(Grade.objects.using('shard2').filter(student=self.student).exists())
+        out = io.StringIO()
+        call_command('move_faculty', self.faculty.pk, 'default', stdout=out)
+        self.assertIn('leftovers of an interrupted move removed from shard2', out.getvalue())
+        self.assertFalse(Student.objects.using('shard2').filter(faculty=self.faculty).exists())
+        self.assertEqual(Grade.objects.using('default').filter(student=self.student).count(), 1)
+        with self.assertRaisesMessage(CommandError, 'already on default'):
+            call_command('move_faculty', self.faculty.pk, 'default')
+
+    def test_move_faculty_refuses_rows_of_other_faculties(self):
+        with use_faculty(self.faculty.pk):
+            Course.objects.create(discipline=Discipline.objects.get(), teacher=Teacher.objects.get(),
+                                  study_year='2024-2025', semester=2, start_date=timezone.now(),
+                                  end_date=timezone.now())
+        # A course of the faculty taught by a lecturer of another faculty (possible while both share a shard)
+        Teacher.objects.using('shard1').update(faculty=self.other_faculty)
+        with self.assertRaisesMessage(CommandError, 'education_course (2)'):
+            call_command('move_faculty', self.faculty.pk, 'default')
+        self.assertTrue(Student.objects.using('shard1').exists())
@@ -0,0 +1,166 @@
+"""
+DB-backed background job queue for PDF transcript exports.
+
+In ``PDF_EXPORT_MODE = 'background'`` the export view only enqueues a
+TranscriptJob keyed on (student, normalized filters, grade version). The
+``run_transcript_worker`` command renders pending jobs into
+``TRANSCRIPT_CACHE_DIR``; finished jobs are served as cached files until the
+student's grade version changes, and are evicted by age and total size.
+
+Jobs live on the shard of their student. The queue functions work on the
+current shard, so the worker polls each shard in turn under ``use_shard``;
+eviction covers every shard by itself.
+"""
+import heapq
+import logging
+import os
+from collections import defaultdict
+from datetime import timedelta
+from operator import itemgetter
+
+from django.conf import settings
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from .models import StudentGradeSummary, TranscriptJob
+from .pdf import render_transcript
+from .reports import GradeFilters, build_grade_report
+from .sharding import use_shard
+from .summaries import grade_version
+
+logger = logging.getLogger(__name__)
+
+
+def transcript_filename(student):
+    return f"grades_{student.full_name}.pdf"
+
+
+def enqueue_transcript(student, filters):
+    """
+    Returns the job for the student's current grades and filter set, creating
+    it (or requeueing a failed one) when needed.
+    """
+    lookup = {
+        'student': student,
+        'filters_key': filters.cache_key(),
+        'grade_version': grade_version(student),
+    }
+    job, created = TranscriptJob.objects.get_or_create(**lookup, defaults={'filters': filters.context()})
+    if job.status == 'failed':
+        TranscriptJob.objects.filter(pk=job.pk, status='failed').update(status='pending', error='')
+        job.status = 'pending'
+    elif job.status == 'done' and not os.path.exists(job.file_path):
+        # The cached file was removed behind our back; render it again
+        requeue_missing_file(job)
+    return job
+
+
+def finished_transcript(student, filters):
+    """Returns the done job for the student's current grades and filter set, or None; never queues one."""
+    job = TranscriptJob.objects.filter(
+        student=student, filters_key=filters.cache_key(), grade_version=grade_version(student), status='done'
+    ).first()
+    if job is None or not os.path.exists(job.file_path):
+        return None
+    return job
+
+
+def requeue_missing_file(job):
+    """Queues a done job whose file has been deleted (e.g. by eviction) for rendering again."""
+    TranscriptJob.objects.filter(pk=job.pk, status='done').update(status='pending', file_path='', file_size=0)
+    job.status = 'pending'
+
+
+def touch(job):
+    TranscriptJob.objects.filter(pk=job.pk).update(last_accessed_at=timezone.now())
+
+
+def claim_next_job():
+    """
+    Atomically moves the oldest pending job to 'running'. The conditional
+    UPDATE makes concurrent workers skip jobs another worker already claimed.
+    """
+    for job_id in TranscriptJob.objects.filter(status='pending').order_by('created_at').values_list('pk', flat=True)[:10]:
+        if TranscriptJob.objects.filter(pk=job_id, status='pending').update(status='running', started_at=timezone.now()):
+            return TranscriptJob.objects.select_related('student__faculty', 'student__group').get(pk=job_id)
+    return None
+
+
+def process_job(job):
+    """Renders the job's transcript into the cache directory."""
+    try:
+        report = build_grade_report(job.student, GradeFilters(**job.filters))
+        os.makedirs(settings.TRANSCRIPT_CACHE_DIR, exist_ok=True)
+        path = os.path.join(settings.TRANSCRIPT_CACHE_DIR, f"{job.pk}-{job.student_id}-v{job.grade_version}.pdf")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as output:
+            render_transcript(job.student, report, output)
+        os.replace(tmp_path, path)
+    except Exception as exc:
+        logger.exception("Transcript job %s failed", job.pk)
+        TranscriptJob.objects.filter(pk=job.pk).update(status='failed', error=str(exc), finished_at=timezone.now())
+        return False
+    TranscriptJob.objects.filter(pk=job.pk).update(
+        status='done', file_path=path, file_size=os.path.getsize(path), finished_at=timezone.now(), last_accessed_at=timezone.now()
+    )
+    return True
+
+
+def requeue_stale_jobs(stale_after):
+    """Puts jobs left 'running' by a crashed worker back in the queue."""
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    return TranscriptJob.objects.filter(status='running', started_at__lt=cutoff).update(status='pending')
+
+
+def _delete_jobs(jobs):
+    deleted = 0
+    for job_id, path in jobs.values_list('pk', 'file_path'):
+        if path:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        deleted += TranscriptJob.objects.filter(pk=job_id).delete()[0]
+    return deleted
+
+
+def _finished_jobs():
+    return TranscriptJob.objects.filter(status__in=['done', 'failed'])
+
+
+def evict_transcripts(max_age=None, max_bytes=None):
+    """
+    Drops cached transcripts that are outdated (the student's grades changed),
+    older than ``max_age`` seconds since last access, and then the least
+    recently used ones until the cache fits in ``max_bytes``. Runs on every
+    shard; they share the one cache directory, so also its size budget.
+    """
+    max_age = settings.TRANSCRIPT_CACHE_MAX_AGE if max_age is None else max_age
+    max_bytes = settings.TRANSCRIPT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    evicted = total = 0
+    for alias in settings.DATABASE_SHARDS:
+        with use_shard(alias):
+            current_version = StudentGradeSummary.objects.filter(student=OuterRef('student')).values('grade_version')
+            evicted += _delete_jobs(_finished_jobs().annotate(current_version=Subquery(current_version))
+                                    .filter(grade_version__lt=F('current_version')))
+            evicted += _delete_jobs(_finished_jobs().filter(
+                last_accessed_at__lt=timezone.now() - timedelta(seconds=max_age)))
+            total += _finished_jobs().aggregate(total=Sum('file_size'))['total'] or 0
+
+    if total > max_bytes:
+        # Least recently used first, across the shards
+        by_access = heapq.merge(*(
+            ((accessed, alias, job_id, size) for accessed, job_id, size in
+             _finished_jobs().using(alias).order_by('last_accessed_at').values_list('last_accessed_at', 'pk', 'file_size'))
+            for alias in settings.DATABASE_SHARDS
+        ), key=itemgetter(0))
+        victims = defaultdict(list)
+        for _, alias, job_id, size in by_access:
+            if total <= max_bytes:
+                break
+            victims[alias].append(job_id)
+            total -= size
+        for alias, job_ids in victims.items():
+            with use_shard(alias):
+                evicted += _delete_jobs(TranscriptJob.objects.filter(pk__in=job_ids))
+    return evicted
@@ -10,9 +10,15 @@ urlpatterns = [
     path('student/profile/', views.student_profile, name='student_profile'),
     path('student/grades/', views.student_grades, name='student_grades'),
     path('student/grades/export_pdf/', views.export_grades_pdf, name='export_grades_pdf'),
+    path('student/grades/export_pdf/<int:job_id>/', views.export_grades_pdf_status, name='export_grades_pdf_status'),
+    path('student/grades/export_pdf/<int:job_id>/download/', views.export_grades_pdf_download, name='export_grades_pdf_download'),
     path('lecturer/profile/', views.lecturer_profile, name='lecturer_profile'),
     path('lecturer/grades/', views.lecturer_grades, name='lecturer_grades'),
     path('lecturer/save-grades/', views.save_grades, name='save_grades'),
+    path('lecturer/save-grades/cells/', views.save_grade_cells, name='save_grade_cells'),
+    path('lecturer/grades/import/', views.import_grades, name='import_grades'),
+    path('exports/grades.csv', views.export_grades, {'export_format': 'csv'}, name='export_grades_csv'),
+    path('exports/grades.json', views.export_grades, {'export_format': 'json'}, name='export_grades_json'),
     path('login/', CustomLoginView.as_view(), name='login'),
     path('logout/', views.logout_view, name='logout'),
     path('register/', views.register, name='register'),
@@ -1,35 +1,72 @@
 from django.contrib.auth.views import LoginView
-from django.core.exceptions import ObjectDoesNotExist
-from django.http import JsonResponse, HttpResponse
+from django.conf import settings
+from django.http import JsonResponse, HttpResponse, FileResponse, Http404, StreamingHttpResponse
 from django.shortcuts import render, redirect
 from django.contrib.auth import login, authenticate, logout, get_user_model
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.urls import reverse_lazy
-from collections import defaultdict
-
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-import io
-
-from .models import ApplicationUser, Student, Teacher, Faculty, Group, Grade, PendingRegistration, Course, Exam
+from django.urls import reverse, reverse_lazy
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.functional import SimpleLazyObject
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
+
+from .models import ApplicationUser, Student, Teacher, Faculty, Group, Grade, PendingRegistration, Course, Exam, StudentGradeSummary, TranscriptJob
+from .reports import GradeFilters, academic_start_year, build_grade_report, student_start_year
+from .exports import ExportFilters, csv_stream, json_stream
+from .group_cache import faculty_groups
+from .grade_import import GradeImporter
+from .grade_tables import grade_table, prewarm_grade_tables
+from .gradebook import (
+    MAX_AUTOSAVE_CELLS, SheetSaveConflict, default_exam_type, grade_sheet, parse_cells, parse_version, save_grade_sheet,
+    sheet_national_grade, sheet_points, total_grade,
+)
+from .pdf import render_transcript
+from .replicas import replica_reads
+from .sharding import pin_faculty
+from .summaries import loaded_grade_version
+from .transcripts import enqueue_transcript, finished_transcript, requeue_missing_file, touch, transcript_filename
 from django.contrib import messages
-from django.db.models import Avg, Count, Q, Max, Min
-from datetime import datetime, timezone
+from datetime import datetime
+import hashlib
+import io
+import json
+import tempfile
 
 User = get_user_model()
 
+# Rejected rows listed in a grade import response; the count covers all of them
+IMPORT_ERRORS_SHOWN = 1000
+
 # Role checks
+# The role is memoized on the user, which RoleModelBackend loads with its student/teacher rows
 def is_student(user):
-    return hasattr(user, 'student') and user.is_active
+    return getattr(user, 'role', None) == 'student' and user.is_active
 
 def is_teacher(user):
-    return hasattr(user, 'teacher') and user.is_active
+    return getattr(user, 'role', None) == 'teacher' and user.is_active
+
+def is_registrar(user):
+    return user.is_staff and user.is_active
+
+# Conditional GET: student pages change only when the student's grade version
+# (bumped on every grade change) or the requested filters change
+def _student_etag(page, student, *parts):
+    key = ':'.join(str(part) for part in (settings.RELEASE_VERSION, page, student.pk, loaded_grade_version(student), *parts))
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+def _profile_etag(request):
+    # The study year shown on the profile moves on every September
+    return _student_etag('profile', request.user.student, academic_start_year(datetime.now()))
+
+def _grades_etag(request):
+    return _student_etag('grades', request.user.student, GradeFilters.from_data(request.GET).cache_key(),
+                         settings.PDF_EXPORT_MODE)
+
+def _export_etag(request):
+    # Background-mode GETs only serve finished jobs, which are fixed by the same version and filters
+    if request.method != 'GET':
+        return None
+    return _student_etag('pdf', request.user.student, GradeFilters.from_data(request.GET).cache_key())
 
 class CustomLoginView(LoginView):
     template_name = 'education/login.html'
@@ -58,437 +95,131 @@ def privacy(request):
 
 @login_required
 @user_passes_test(is_student, login_url='education:home')
+@replica_reads
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_profile_etag)
 def student_profile(request):
     student = request.user.student
-    grades = Grade.objects.filter(student=student).order_by('exam__date')
+    # All statistics come from the denormalized summary row, joined to the
+    # grades holding the highest and lowest values
+    summary = (StudentGradeSummary.objects
+               .select_related('highest_grade__exam__course__discipline', 'lowest_grade__exam__course__discipline')
+               .filter(student=student)
+               .first()) or StudentGradeSummary(student=student)
 
-    # Calculate statistics for all grades
-    average_grade = grades.aggregate(Avg('grade_value'))['grade_value__avg'] or 0
-    highest_grade = grades.aggregate(Max('grade_value'))['grade_value__max']
-    lowest_grade = grades.aggregate(Min('grade_value'))['grade_value__min']
-
-    # Get highest and lowest grade exams for display
-    highest_grade_exam = grades.filter(grade_value=highest_grade).first() if highest_grade else None
-    lowest_grade_exam = grades.filter(grade_value=lowest_grade).first() if lowest_grade else None
-
-    # Total subjects, exams, and credits
-    total_disciplines = grades.count()
-    exams = grades.filter(exam__type='exam').count()
-    credits = grades.filter(exam__type='credit').count()
-
-    # Calculate current academic year based on date
-    current_date = datetime.now()
-    current_year = current_date.year
-    if current_date.month < 9:  # Before September, use previous year for academic year start
-        current_academic_year = f"{current_year - 1}-{str(current_year)[-2:]}"
-    else:
-        current_academic_year = f"{current_year}-{str(current_year + 1)[-2:]}"
-
-    # Use student's study_year as the starting academic year
-    study_start_year = student.study_year  # e.g., "2023-2024"
-
-    # Calculate study year (number of years completed)
-    start_year = int(study_start_year.split('-')[0])
-    current_start_year = int(current_academic_year.split('-')[0])
-    study_year = current_start_year - start_year + 1
-
-    # Round average grade
-    average_grade = round(average_grade) if average_grade else 0
+    # Study year counted from the student's first academic year (September cutoff)
+    study_year = academic_start_year(datetime.now()) - student_start_year(student) + 1
 
     context = {
         'student': student,
-        'grades': grades,
-        'average_grade': average_grade,
-        'highest_grade_exam': highest_grade_exam,
-        'lowest_grade_exam': lowest_grade_exam,
-        'total_disciplines': total_disciplines,
-        'exams': exams,
-        'credits': credits,
+        'average_grade': summary.average,
+        'highest_grade_exam': summary.highest_grade,
+        'lowest_grade_exam': summary.lowest_grade,
+        'total_disciplines': summary.total_count,
+        'exams': summary.exam_count,
+        'credits': summary.credit_count,
         'study_year': study_year,
     }
     return render(request, 'education/student_profile.html', context)
 
 @login_required
 @user_passes_test(is_student, login_url='education:home')
+@replica_reads
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_grades_etag)
 def student_grades(request):
     student = request.user.student
-    grades = Grade.objects.filter(student=student)
-
-    # Calculate student's current study year
-    current_date = datetime.now()
-    current_year = current_date.year
-    if current_date.month < 9:
-        current_academic_year = f"{current_year - 1}-{str(current_year)[-2:]}"
-    else:
-        current_academic_year = f"{current_year}-{str(current_year + 1)[-2:]}"
-    study_start_year = student.study_year
-    start_year = int(study_start_year.split('-')[0])
-    current_start_year = int(current_academic_year.split('-')[0])
-    student_study_year = current_start_year - start_year + 1
-
-    # Apply filters
-    grade_min = int(request.GET.get('grade_min', 60))
-    grade_max = int(request.GET.get('grade_max', 100))
-    course_min = int(request.GET.get('course_min', 1))
-    course_max = int(request.GET.get('course_max', 6))
-    semester_1 = request.GET.get('semester_1') == 'on'
-    semester_2 = request.GET.get('semester_2') == 'on'
-    type_exam = request.GET.get('type_exam') == 'on'
-    type_credit = request.GET.get('type_credit') == 'on'
-    sort_type = request.GET.get('sort_type', 'seq')
-
-    # Filter by grade range
-    grades = grades.filter(grade_value__gte=grade_min, grade_value__lte=grade_max)
-
-    # Filter by course year and group by academic year, semester, and type
-    grades_by_year = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
-    filtered_grades = []
-    for grade in grades:
-        exam_year = grade.exam.date.year
-        if grade.exam.date.month >= 9:
-            academic_year = f"{exam_year}-{str(exam_year + 1)[-2:]}"
-        else:
-            academic_year = f"{exam_year - 1}-{str(exam_year)[-2:]}"
-        grade.academic_year = academic_year
-        study_year = int(academic_year.split('-')[0]) - start_year + 1
-        if course_min <= study_year <= course_max:
-            filtered_grades.append(grade)
-            semester = grade.exam.course.semester
-            semester_name = "I" if semester == 1 else "II"
-            grades_by_year[academic_year][semester_name][grade.exam.type].append(grade)
-
-    # Apply semester filter
-    if semester_1 and not semester_2:
-        grades_by_year = {
-            year: {sem: types for sem, types in semesters.items() if sem == "I"}
-            for year, semesters in grades_by_year.items()
-        }
-    elif semester_2 and not semester_1:
-        grades_by_year = {
-            year: {sem: types for sem, types in semesters.items() if sem == "II"}
-            for year, semesters in grades_by_year.items()
-        }
-    elif not semester_1 and not semester_2:
-        semester_1 = True
-        semester_2 = True
-
-    # Apply discipline type filter
-    if type_exam and not type_credit:
-        grades_by_year = {
-            year: {sem: {typ: grades for typ, grades in types.items() if typ == 'exam'}
-                   for sem, types in semesters.items()}
-            for year, semesters in grades_by_year.items()
-        }
-    elif type_credit and not type_exam:
-        grades_by_year = {
-            year: {sem: {typ: grades for typ, grades in types.items() if typ == 'credit'}
-                   for sem, types in semesters.items()}
-            for year, semesters in grades_by_year.items()
-        }
-    elif not type_exam and not type_credit:
-        type_exam = True
-        type_credit = True
-
-    # Apply sorting within each group
-    for academic_year in grades_by_year:
-        for semester in grades_by_year[academic_year]:
-            for exam_type in grades_by_year[academic_year][semester]:
-                grades_list = grades_by_year[academic_year][semester][exam_type]
-                if sort_type == 'asc':
-                    grades_list.sort(key=lambda g: g.grade_value)
-                elif sort_type == 'desc':
-                    grades_list.sort(key=lambda g: g.grade_value, reverse=True)
-                else:  # 'seq'
-                    grades_list.sort(key=lambda g: (g.exam.date, g.exam.course.discipline.name))
-
-    # Convert to template-friendly structure with chronological order and preserved sorting
-    grouped_grades = []
-    sorted_years = sorted(grades_by_year.keys(), key=lambda x: [int(y) for y in x.split('-')])
-    for academic_year in sorted_years:
-        semester_list = []
-        semester_groups = grades_by_year[academic_year]
-        for semester in sorted(semester_groups.keys(), key=lambda x: {'I': 1, 'II': 2}[x]):
-            type_list = []
-            for exam_type, grades in semester_groups[semester].items():
-                if grades:  # Only include non-empty groups
-                    # Reapply sorting to ensure it’s preserved
-                    if sort_type == 'asc':
-                        grades.sort(key=lambda g: g.grade_value)
-                    elif sort_type == 'desc':
-                        grades.sort(key=lambda g: g.grade_value, reverse=True)
-                    else:  # 'seq'
-                        grades.sort(key=lambda g: (g.exam.date, g.exam.course.discipline.name))
-                    type_list.append((exam_type, grades))
-            if type_list:  # Only include semesters with grades
-                semester_list.append((semester, type_list))
-        if semester_list:  # Only include years with grades
-            grouped_grades.append((academic_year, semester_list))
-
-    # Calculate statistics on filtered grades
-    filtered_grades_qs = Grade.objects.filter(
-        id__in=[g.id for g in filtered_grades]
-    )
-    average_grade = filtered_grades_qs.aggregate(Avg('grade_value'))['grade_value__avg'] or 0
-    highest_grade = filtered_grades_qs.aggregate(Max('grade_value'))['grade_value__max']
-    lowest_grade = filtered_grades_qs.aggregate(Min('grade_value'))['grade_value__min']
-    highest_grade_exam = filtered_grades_qs.filter(grade_value=highest_grade).first() if highest_grade else None
-    lowest_grade_exam = filtered_grades_qs.filter(grade_value=lowest_grade).first() if lowest_grade else None
-    total_disciplines = filtered_grades_qs.count()
-    exams = filtered_grades_qs.filter(exam__type='exam').count()
-    credits = filtered_grades_qs.filter(exam__type='credit').count()
-
-    print(f"Sort type: {sort_type}, Grouped grades: {grouped_grades}")
+    filters = GradeFilters.from_data(request.GET)
+    # The report is built only when the table is not cached (or the rows are read from the context)
+    report = SimpleLazyObject(lambda: build_grade_report(student, filters))
+    table = grade_table(student, filters, lambda: report)
 
     context = {
         'student': student,
-        'grouped_grades': grouped_grades,
-        'average_grade': round(average_grade) if average_grade else 0,
-        'highest_grade_exam': highest_grade_exam,
-        'lowest_grade_exam': lowest_grade_exam,
-        'total_disciplines': total_disciplines,
-        'exams': exams,
-        'credits': credits,
-        'grade_min': grade_min,
-        'grade_max': grade_max,
-        'course_min': course_min,
-        'course_max': course_max,
-        'semester_1': semester_1,
-        'semester_2': semester_2,
-        'type_exam': type_exam,
-        'type_credit': type_credit,
-        'sort_type': sort_type,
+        'grade_table': table.html,
+        'grouped_grades': SimpleLazyObject(lambda: report.grouped()),
+        'highest_grade_exam': SimpleLazyObject(lambda: report.highest),
+        'lowest_grade_exam': SimpleLazyObject(lambda: report.lowest),
+        'pdf_export_background': settings.PDF_EXPORT_MODE == 'background',
+        **table.stats,
+        **filters.context(),
     }
     return render(request, 'education/student_grades.html', context)
 
 @login_required
 @user_passes_test(is_student, login_url='education:home')
+@replica_reads
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_export_etag)
 def export_grades_pdf(request):
-    if request.method != 'POST':
+    if request.method not in ('GET', 'POST'):
         return HttpResponse("Method not allowed", status=405)
 
     student = request.user.student
-    grades = Grade.objects.filter(student=student)
-
-    # Apply the same filters as in student_grades view
-    grade_min = int(request.POST.get('grade_min', 60))
-    grade_max = int(request.POST.get('grade_max', 100))
-    course_min = int(request.POST.get('course_min', 1))
-    course_max = int(request.POST.get('course_max', 6))
-    semester_1 = request.POST.get('semester_1') == 'on'
-    semester_2 = request.POST.get('semester_2') == 'on'
-    type_exam = request.POST.get('type_exam') == 'on'
-    type_credit = request.POST.get('type_credit') == 'on'
-    sort_type = request.POST.get('sort_type', 'seq')
-
-    # Calculate student's current study year
-    current_date = datetime.now()
-    current_year = current_date.year
-    if current_date.month < 9:
-        current_academic_year = f"{current_year - 1}-{str(current_year)[-2:]}"
-    else:
-        current_academic_year = f"{current_year}-{str(current_year + 1)[-2:]}"
-    study_start_year = student.study_year
-    start_year = int(study_start_year.split('-')[0])
-    current_start_year = int(current_academic_year.split('-')[0])
-    student_study_year = current_start_year - start_year + 1
-
-    # Apply filters
-    grades = grades.filter(grade_value__gte=grade_min, grade_value__lte=grade_max)
-    grades_by_year = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
-    filtered_grades = []
-    for grade in grades:
-        exam_year = grade.exam.date.year
-        if grade.exam.date.month >= 9:
-            academic_year = f"{exam_year}-{str(exam_year + 1)[-2:]}"
+    # Apply the same filters as in student_grades view; GET requests can be revalidated
+    filters = GradeFilters.from_data(request.GET if request.method == 'GET' else request.POST)
+
+    if settings.PDF_EXPORT_MODE == 'background':
+        # GET is not CSRF-protected, so it may only fetch a finished export; queueing takes a POST
+        if request.method == 'GET':
+            job = finished_transcript(student, filters)
         else:
-            academic_year = f"{exam_year - 1}-{str(exam_year)[-2:]}"
-        grade.academic_year = academic_year
-        study_year = int(academic_year.split('-')[0]) - start_year + 1
-        if course_min <= study_year <= course_max:
-            filtered_grades.append(grade)
-            semester = grade.exam.course.semester  # Assuming semester is stored in Course model
-            semester_name = "I" if semester == 1 else "II"
-            grades_by_year[academic_year][semester_name][grade.exam.type].append(grade)
-
-    # Apply semester filter
-    if semester_1 and not semester_2:
-        grades_by_year = {
-            year: {sem: types for sem, types in semesters.items() if sem == "I"}
-            for year, semesters in grades_by_year.items()
-        }
-    elif semester_2 and not semester_1:
-        grades_by_year = {
-            year: {sem: types for sem, types in semesters.items() if sem == "II"}
-            for year, semesters in grades_by_year.items()
-        }
-
-    # Apply discipline type filter
-    if type_exam and not type_credit:
-        grades_by_year = {
-            year: {sem: {typ: grades for typ, grades in types.items() if typ == 'exam'}
-                   for sem, types in semesters.items()}
-            for year, semesters in grades_by_year.items()
-        }
-    elif type_credit and not type_exam:
-        grades_by_year = {
-            year: {sem: {typ: grades for typ, grades in types.items() if typ == 'credit'}
-                   for sem, types in semesters.items()}
-            for year, semesters in grades_by_year.items()
-        }
-
-    # Apply sorting
-    for academic_year in grades_by_year:
-        for semester in grades_by_year[academic_year]:
-            for exam_type in grades_by_year[academic_year][semester]:
-                grades_list = grades_by_year[academic_year][semester][exam_type]
-                if sort_type == 'asc':
-                    grades_list.sort(key=lambda g: g.grade_value)
-                elif sort_type == 'desc':
-                    grades_list.sort(key=lambda g: g.grade_value, reverse=True)
+            job = enqueue_transcript(student, filters)
+        if job is not None and job.status == 'done':
+            # Identical export of unchanged grades: serve the cached file
+            try:
+                pdf_file = open(job.file_path, 'rb')
+            except FileNotFoundError:
+                # Evicted since the existence check
+                if request.method == 'GET':
+                    job = None
                 else:
-                    grades_list.sort(key=lambda g: (g.exam.date, g.exam.course.discipline.name))
-
-    # Calculate average grade for filtered grades
-    filtered_grades_qs = Grade.objects.filter(
-        id__in=[g.id for g in filtered_grades]
-    )
-    average_grade = filtered_grades_qs.aggregate(Avg('grade_value'))['grade_value__avg'] or 0
-    average_grade = round(average_grade)
+                    requeue_missing_file(job)
+            else:
+                touch(job)
+                return FileResponse(pdf_file, as_attachment=True,
+                                    filename=transcript_filename(student), content_type='application/pdf')
+        if job is None:
+            return JsonResponse({'error': 'transcript is not rendered yet, POST to queue it'}, status=404)
+        return JsonResponse(_transcript_job_state(job), status=202)
+
+    # Render into a temporary file and stream it back instead of buffering the PDF in memory
+    pdf_file = tempfile.TemporaryFile()
+    render_transcript(student, build_grade_report(student, filters), pdf_file)
+    pdf_file.seek(0)
+    return FileResponse(pdf_file, as_attachment=True, filename=transcript_filename(student), content_type='application/pdf')
+
+def _transcript_job_state(job):
+    state = {
+        'id': job.pk,
+        'status': job.status,
+        'status_url': reverse('education:export_grades_pdf_status', args=[job.pk]),
+    }
+    if job.status == 'done':
+        state['download_url'] = reverse('education:export_grades_pdf_download', args=[job.pk])
+    return state
 
-    # Create PDF using reportlab
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=inch, leftMargin=inch, topMargin=inch, bottomMargin=inch)
-    elements = []
+@login_required
+@user_passes_test(is_student, login_url='education:home')
+def export_grades_pdf_status(request, job_id):
+    job = TranscriptJob.objects.filter(pk=job_id, student=request.user.student).first()
+    if job is None:
+        raise Http404
+    return JsonResponse(_transcript_job_state(job))
 
-    # Register DejaVuSans font for Cyrillic support
+@login_required
+@user_passes_test(is_student, login_url='education:home')
+def export_grades_pdf_download(request, job_id):
+    student = request.user.student
+    job = TranscriptJob.objects.filter(pk=job_id, student=student, status='done').first()
+    if job is None:
+        raise Http404
     try:
-        pdfmetrics.registerFont(TTFont('DejaVuSans', 'static/fonts/DejaVuSans.ttf'))
-    except:
-        # Fallback to Helvetica if font file is missing (Cyrillic won't work)
-        pass
-
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        name='Title',
-        fontName='DejaVuSans' if 'DejaVuSans' in pdfmetrics.getRegisteredFontNames() else 'Helvetica-Bold',
-        fontSize=16,
-        alignment=1,  # Center
-        spaceAfter=12,
-    )
-    normal_style = ParagraphStyle(
-        name='Normal',
-        fontName='DejaVuSans' if 'DejaVuSans' in pdfmetrics.getRegisteredFontNames() else 'Helvetica',
-        fontSize=12,
-        alignment=1,  # Center
-        spaceAfter=6,
-    )
-
-    # Add title and student details
-    elements.append(Paragraph(f"Оцінки студента: {student.full_name}", title_style))
-    elements.append(Paragraph(f"Факультет: {student.faculty.name}", normal_style))
-    elements.append(Paragraph(f"Група: {student.group.name}", normal_style))
-
-    # Build table data
-    table_data = [["Дисципліна", "Кредити", "Години", "Оцінка", "Бали"]]
-    for academic_year, semester_groups in sorted(grades_by_year.items(), reverse=True):
-        for semester, type_groups in semester_groups.items():
-            table_data.append([f"{semester} семестр {academic_year}", "", "", "", ""])  # Semester header
-            has_data = False
-            for exam_type, grades in type_groups.items():
-                if grades:
-                    has_data = True
-                    table_data.append([("Іспити" if exam_type == 'exam' else "Заліки"), "", "", "", ""])  # Exam type header
-                    for grade in grades:
-                        discipline = grade.exam.course.discipline.name
-                        credits = str(grade.exam.course.discipline.credits) if grade.exam.course.discipline.credits else "-"
-                        hours = str(grade.exam.course.discipline.hours) if grade.exam.course.discipline.hours else "-"
-                        # Apply new grading logic for assessment
-                        if grade.exam.type == "credit":
-                            assessment = "Зарахов."
-                        else:
-                            if grade.grade_value >= 90 and grade.grade_value <= 100:
-                                assessment = "5"
-                            elif grade.grade_value >= 75 and grade.grade_value <= 89:
-                                assessment = "4"
-                            elif grade.grade_value >= 60 and grade.grade_value <= 74:
-                                assessment = "3"
-                            else:
-                                assessment = f"{grade.grade_value:.2f}"
-                        points = f"{grade.grade_value:.2f}"
-                        table_data.append([discipline, credits, hours, assessment, points])
-            if not has_data:
-                table_data.append(["(немає даних)", "", "", "", ""])  # Empty row if no data
-
-    # Create table with text wrapping for discipline column
-    from reportlab.platypus import Paragraph as PLParagraph
-    col_widths = [180, 50, 50, 70, 70]  # Increased width for discipline to accommodate long names
-    table_data_wrapped = []
-    for row in table_data:
-        wrapped_row = []
-        for i, cell in enumerate(row):
-            if i == 0 and isinstance(cell, str) and len(cell.split()) > 1:  # Wrap discipline names
-                wrapped_row.append(PLParagraph(cell, style=normal_style))
-            else:
-                wrapped_row.append(cell)
-        table_data_wrapped.append(wrapped_row)
-
-    table = Table(table_data_wrapped, colWidths=col_widths)
-    table.setStyle(TableStyle([
-        ('FONT', (0, 0), (-1, -1), 'DejaVuSans' if 'DejaVuSans' in pdfmetrics.getRegisteredFontNames() else 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-        ('ALIGN', (0, 1), (0, -1), 'LEFT'),  # Left-align discipline names
-        ('ALIGN', (1, 1), (-1, -1), 'CENTER'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('FONTNAME', (0, 0), (-1, 0), 'DejaVuSans' if 'DejaVuSans' in pdfmetrics.getRegisteredFontNames() else 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('SPAN', (0, 1), (-1, 1)),  # Span for semester headers
-    ]))
-
-    # Adjust SPAN for semester and type headers dynamically
-    row_idx = 1
-    for academic_year, semester_groups in sorted(grades_by_year.items(), reverse=True):
-        for semester, type_groups in semester_groups.items():
-            table._argH[row_idx] = 20  # Set height for semester header
-            table.setStyle(TableStyle([
-                ('SPAN', (0, row_idx), (-1, row_idx)),
-                ('BACKGROUND', (0, row_idx), (-1, row_idx), colors.lightgrey),
-                ('FONTNAME', (0, row_idx), (-1, row_idx), 'DejaVuSans' if 'DejaVuSans' in pdfmetrics.getRegisteredFontNames() else 'Helvetica-Bold'),
-                ('FONTSIZE', (0, row_idx), (-1, row_idx), 12),
-            ]))
-            row_idx += 1
-            has_data = False
-            for exam_type, grades in type_groups.items():
-                if grades:
-                    has_data = True
-                    table._argH[row_idx] = 15  # Set height for exam type header
-                    table.setStyle(TableStyle([
-                        ('SPAN', (0, row_idx), (-1, row_idx)),
-                        ('BACKGROUND', (0, row_idx), (-1, row_idx), colors.whitesmoke),
-                        ('FONTNAME', (0, row_idx), (-1, row_idx), 'DejaVuSans' if 'DejaVuSans' in pdfmetrics.getRegisteredFontNames() else 'Helvetica'),
-                        ('FONTSIZE', (0, row_idx), (-1, row_idx), 10),
-                    ]))
-                    row_idx += 1
-                    for _ in grades:
-                        row_idx += 1
-            if not has_data:
-                row_idx += 1  # Skip an extra row for empty data
-
-    elements.append(table)
-    elements.append(Paragraph(f"Середній бал: {average_grade}", normal_style))
-
-    # Build PDF
-    doc.build(elements)
-    pdf = buffer.getvalue()
-    buffer.close()
-
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="grades_{student.full_name}.pdf"'
-    response.write(pdf)
-    return response
+        pdf_file = open(job.file_path, 'rb')
+    except FileNotFoundError:
+        raise Http404
+    touch(job)
+    return FileResponse(pdf_file, as_attachment=True, filename=transcript_filename(student), content_type='application/pdf')
 
 @login_required
 @user_passes_test(is_teacher, login_url='education:home')
@@ -503,77 +234,51 @@ def lecturer_profile(request):
     }
     return render(request, 'education/lecturer_profile.html', context)
 
-@login_required
-@user_passes_test(is_teacher, login_url=reverse_lazy('login'))
-def lecturer_grades(request):
-    teacher = request.user.teacher
-    lecturer_courses = Course.objects.filter(teacher=teacher).select_related('discipline')
-    groups = Group.objects.all()
+def _grade_sheet_context(teacher, discipline_id, group_id, fallback):
+    lecturer_courses = list(Course.objects.filter(teacher=teacher).select_related('discipline'))
+    # Groups of the faculties whose disciplines the lecturer teaches
+    groups = (Group.objects
+              .filter(faculty_id__in=Course.objects.filter(teacher=teacher).values('discipline__faculty_id'))
+              .only('id', 'name')
+              .order_by('name'))
 
-    selected_discipline_id = request.GET.get('discipline')
-    selected_group_id = request.GET.get('group')
     students = []
     selected_course = None
 
-    if selected_discipline_id and selected_group_id:
+    if discipline_id and group_id:
         # Ensure we get the correct course for the selected discipline
-        selected_course = Course.objects.filter(
-            teacher=teacher,
-            discipline_id=selected_discipline_id
-        ).first()
-        if selected_course:
-            # Get or create the exam, but don’t override the type if it already exists
-            exam, created = Exam.objects.get_or_create(
-                course=selected_course,
-                defaults={'date': datetime.now(), 'type': 'credit' if selected_course.semester == 1 else 'exam'}
-            )
-            students = Student.objects.filter(group_id=selected_group_id).select_related('group')
-            for student in students:
-                try:
-                    grade = Grade.objects.filter(
-                        exam__course=selected_course,
-                        student=student,
-                        teacher=teacher
-                    ).latest('created_at')
-                    # Since we only store total_grade, split it for display
-                    total_grade = float(grade.grade_value)
-                    semester_grade = total_grade / 2  # Simplified split for display
-                    exam_grade = total_grade / 2
-                except ObjectDoesNotExist:
-                    semester_grade = float(request.GET.get(f'semester_grade_{student.id}', 0))
-                    exam_grade = float(request.GET.get(f'exam_grade_{student.id}', 0))
-                    total_grade = min(100, semester_grade + exam_grade)
-
-                # Use the exam’s type directly
-                exam_type = exam.type
-
-                # Assign values to student for template rendering
-                student.semester_grade = semester_grade
-                student.exam_grade = exam_grade
-                student.total_grade = total_grade
-                student.exam_type = exam_type
-
-                # Calculate national grade
-                if total_grade < 60:
-                    student.national_grade = "-"
-                else:
-                    if exam_type == 'credit':
-                        student.national_grade = "Зарахов."
-                    else:  # exam
-                        if total_grade >= 90:
-                            student.national_grade = "5"
-                        elif total_grade >= 75:
-                            student.national_grade = "4"
-                        else:  # 60-74
-                            student.national_grade = "3"
-
-    context = {
+        selected_course = next(
+            (course for course in lecturer_courses if str(course.discipline_id) == discipline_id), None
+        )
+        if selected_course and group_id.isdigit():
+            # The exam is only created when the sheet is saved; until then the type follows the semester
+            exam = Exam.objects.filter(course=selected_course).order_by('id').only('id', 'type').first()
+            exam_type = exam.type if exam else default_exam_type(selected_course)
+            students = grade_sheet(teacher, selected_course, group_id, exam_type, fallback=fallback,
+                                   exam_id=exam and exam.pk)
+
+    return {
         'lecturer': teacher,
         'lecturer_courses': lecturer_courses,
         'groups': groups,
         'students': students,
         'selected_discipline': selected_course,
+        'discipline_id': discipline_id,
+        'group_id': group_id,
     }
+
+def _sheet_exam(course):
+    exam, created = Exam.objects.get_or_create(
+        course=course,
+        defaults={'date': datetime.now(), 'type': default_exam_type(course)}
+    )
+    return exam
+
+@login_required
+@user_passes_test(is_teacher, login_url=reverse_lazy('login'))
+def lecturer_grades(request):
+    context = _grade_sheet_context(request.user.teacher, request.GET.get('discipline'), request.GET.get('group'),
+                                   request.GET)
     return render(request, 'education/lecturer_grades.html', context)
 
 @login_required
@@ -586,33 +291,146 @@ def save_grades(request):
         if selected_discipline_id and selected_group_id:
             course = Course.objects.filter(teacher=teacher, discipline_id=selected_discipline_id).first()
             if course:
-                # Determine exam type based on your logic (e.g., semester-based)
-                exam_type = 'credit' if course.semester == 1 else 'exam'  # Adjust as needed
-                exam, created = Exam.objects.get_or_create(
-                    course=course,
-                    defaults={'date': datetime.now(), 'type': exam_type}
-                )
-                students = Student.objects.filter(group_id=selected_group_id)
+                exam = _sheet_exam(course)
+                students = Student.objects.filter(group_id=selected_group_id, is_deleted=False).only('id', 'full_name')
+                totals = {}
+                # Grade versions the sheet was rendered with; forms without them are saved unchecked
+                versions = {}
+                invalid = []
                 for student in students:
-                    semester_grade = request.POST.get(f'semester_grade_{student.id}', 0)
-                    exam_grade = request.POST.get(f'exam_grade_{student.id}', 0)
                     try:
-                        semester_grade = float(semester_grade)
-                        exam_grade = float(exam_grade)
-                        total_grade = min(100, semester_grade + exam_grade)
-                        Grade.objects.update_or_create(
-                            exam=exam,
-                            student=student,
-                            teacher=teacher,
-                            defaults={'grade_value': total_grade}
+                        totals[student.id] = total_grade(
+                            request.POST.get(f'semester_grade_{student.id}', 0),
+                            request.POST.get(f'exam_grade_{student.id}', 0),
                         )
-                        messages.success(request, f"Оцінки для {student.full_name} збережено.")
+                        version = request.POST.get(f'version_{student.id}')
+                        if version is not None:
+                            versions[student.id] = parse_version(version)
                     except ValueError:
-                        messages.error(request, f"Невірний формат оцінки для {student.full_name}.")
+                        totals.pop(student.id, None)
+                        invalid.append(student.full_name)
+                try:
+                    result = save_grade_sheet(teacher, exam, totals, versions)
+                except SheetSaveConflict:
+                    messages.error(request, "Відомість одночасно змінюють інші викладачі, спробуйте зберегти ще раз.")
+                    return redirect('education:lecturer_grades')
+                prewarm_grade_tables(result.created + result.updated)
+                messages.success(
+                    request,
+                    f"Відомість збережено: нових оцінок — {len(result.created)}, змінених — {len(result.updated)}, "
+                    f"без змін — {len(result.unchanged)}."
+                )
+                if invalid:
+                    messages.error(request, f"Невірний формат оцінки для: {', '.join(invalid)}.")
+                if result.conflicts:
+                    # Show the sheet again with the current grades; conflicting rows also show what was submitted
+                    context = _grade_sheet_context(teacher, selected_discipline_id, selected_group_id, request.POST)
+                    for student in context['students']:
+                        if student.id in result.conflicts:
+                            student.conflict = True
+                            student.submitted_total = totals[student.id]
+                    context['conflicts'] = len(result.conflicts)
+                    return render(request, 'education/lecturer_grades.html', context, status=409)
         else:
             messages.error(request, "Оберіть дисципліну та групу.")
     return redirect('education:lecturer_grades')
 
+@login_required
+@user_passes_test(is_teacher, login_url='education:home')
+@require_POST
+def save_grade_cells(request):
+    """
+    Autosave of the grade sheet: takes {"discipline", "group", "cells": [...]}
+    as JSON, upserts only the given cells and returns their recomputed totals.
+    """
+    try:
+        payload = json.loads(request.body)
+        discipline_id, group_id, cells = int(payload['discipline']), int(payload['group']), payload['cells']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'expected a JSON object with discipline, group and cells'}, status=400)
+    if not isinstance(cells, list) or len(cells) > MAX_AUTOSAVE_CELLS:
+        return JsonResponse({'error': f'cells must be a list of at most {MAX_AUTOSAVE_CELLS} cells'}, status=400)
+
+    teacher = request.user.teacher
+    course = Course.objects.filter(teacher=teacher, discipline_id=discipline_id).first()
+    if course is None:
+        return JsonResponse({'error': 'discipline is not taught by this lecturer'}, status=404)
+    totals, versions, errors = parse_cells(cells)
+    group_students = set(Student.objects.filter(group_id=group_id, is_deleted=False, pk__in=list(totals))
+                         .values_list('pk', flat=True))
+    for student_id in [student_id for student_id in totals if student_id not in group_students]:
+        del totals[student_id]
+        errors.append({'student': student_id, 'error': 'Student is not in the group.'})
+    if not totals:
+        # Nothing valid to save: do not create the sheet's exam for it
+        return JsonResponse({'cells': [], 'errors': errors})
+
+    exam = _sheet_exam(course)
+    try:
+        result = save_grade_sheet(teacher, exam, totals, versions)
+    except SheetSaveConflict:
+        return JsonResponse({'error': 'the sheet is being changed concurrently, retry'}, status=409)
+    prewarm_grade_tables(result.created + result.updated)
+
+    statuses = {
+        **dict.fromkeys(result.created, 'created'),
+        **dict.fromkeys(result.updated, 'updated'),
+        **dict.fromkeys(result.unchanged, 'unchanged'),
+        # Conflicting cells come back with the grade someone else saved
+        **dict.fromkeys(result.conflicts, 'conflict'),
+    }
+    saved = Grade.objects.filter(exam=exam, student_id__in=list(totals)).values_list('student_id', 'grade_value', 'version')
+    cells = []
+    for student_id, grade_value, version in saved:
+        # Conflicting rows are reloaded with these points, split like the sheet splits stored grades
+        semester_grade, exam_grade = sheet_points(grade_value)
+        cells.append({
+            'student': student_id,
+            'status': statuses[student_id],
+            'total_grade': float(grade_value),
+            'national_grade': sheet_national_grade(grade_value, exam.type),
+            'version': version,
+            'semester_grade': semester_grade,
+            'exam_grade': exam_grade,
+        })
+    return JsonResponse({
+        'cells': cells,
+        'errors': errors,
+    })
+
+@login_required
+@user_passes_test(is_teacher, login_url='education:home')
+@require_POST
+def import_grades(request):
+    """Imports an uploaded grade CSV (see education/grade_import.py); the file is streamed, never read whole."""
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'error': 'attach the CSV file as "file"'}, status=400)
+    try:
+        result = GradeImporter(request.user.teacher).run(io.TextIOWrapper(upload, encoding='utf-8-sig', newline=''))
+    except ValueError as error:
+        # Also raised for undecodable files; chunks imported before the bad line stay saved
+        return JsonResponse({'error': str(error)}, status=400)
+    return JsonResponse(result.as_dict(max_errors=IMPORT_ERRORS_SHOWN))
+
+EXPORT_FORMATS = {
+    'csv': (csv_stream, 'text/csv; charset=utf-8'),
+    'json': (json_stream, 'application/json'),
+}
+
+@login_required
+@user_passes_test(is_registrar, login_url='education:home')
+def export_grades(request, export_format):
+    """Streams the grades selected by the faculty/group/course/academic_year parameters as CSV or JSON."""
+    try:
+        filters = ExportFilters.from_data(request.GET)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    stream, content_type = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(stream(filters), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filters.filename(export_format)}"'
+    return response
+
 def register(request):
     if request.method == 'POST':
         username = request.POST['username']
@@ -634,6 +452,8 @@ def register(request):
         except Faculty.DoesNotExist:
             messages.error(request, 'Invalid faculty.')
             return render(request, 'education/registration.html', {'faculties': Faculty.objects.all()})
+        # The groups, the new student or teacher and the registration are on the faculty's shard
+        pin_faculty(faculty.id)
 
         # Invite code logic
         auto_approve = False
@@ -732,7 +552,16 @@ def logout_view(request):
     logout(request)
     return redirect('education:home')
 
+@replica_reads
 def get_groups(request):
-    faculty_id = request.GET.get('faculty_id')
-    groups = Group.objects.filter(faculty_id=faculty_id).values('id', 'name')
-    return JsonResponse(list(groups), safe=False)
\ No newline at end of file
+    faculty_id = request.GET.get('faculty_id', '')
+    if not faculty_id.isdigit():
+        return JsonResponse({'error': 'faculty_id must be a number'}, status=400)
+    group_list = faculty_groups(int(faculty_id))
+    # Browsers keep the list and revalidate it with If-None-Match
+    response = get_conditional_response(request, etag=group_list.etag)
+    if response is None:
+        response = HttpResponse(group_list.body, content_type='application/json')
+    response['ETag'] = group_list.etag
+    patch_cache_control(response, public=True, max_age=settings.GROUPS_HTTP_MAX_AGE, must_revalidate=True)
+    return response
\ No newline at end of file